@@ -4,8 +4,11 @@
 
 import os
 import copy
+import heapq
+import itertools
 from collections import OrderedDict, namedtuple
 
+from django.conf import settings
 from django.utils import timezone
 
 from cvat.apps.engine.data_manager import DataManager, TrackManager
@@ -118,6 +121,7 @@ class Annotation:
         self._host = host
         self._create_callback=create_callback
         self._MAX_ANNO_SIZE=30000
+        self._annotation_size = 0
         self._frame_info = {}
         self._frame_mapping = {}
 
@@ -299,35 +303,49 @@ class Annotation:
             attributes=self._export_attributes(tag["attributes"]),
         )
 
+    def _get_frame(self, frame):
+        db_image = self._frame_info[frame]
+        # Images imported from the share in the direct mode are kept
+        # there, their names are relative to the share root
+        share_root = os.path.join(settings.SHARE_ROOT, '')
+        rpath = db_image['path'].split(os.path.sep)
+        if db_image['path'].startswith(share_root):
+            rpath = db_image['path'][len(share_root):]
+        elif len(rpath) != 1:
+            rpath = os.path.sep.join(rpath[rpath.index(".upload")+1:])
+        else:
+            rpath = rpath[0]
+
+        return Annotation.Frame(
+            frame=self._db_task.start_frame + frame * self._db_task.get_frame_step(),
+            name=rpath,
+            height=db_image["height"],
+            width=db_image["width"],
+            labeled_shapes=[],
+            tags=[],
+        )
+
     def group_by_frame(self):
-        def _get_frame(annotations, shape):
-            db_image = self._frame_info[shape["frame"]]
-            frame = self._db_task.start_frame + shape["frame"] * self._db_task.get_frame_step()
-            rpath = db_image['path'].split(os.path.sep)
-            if len(rpath) != 1:
-                rpath = os.path.sep.join(rpath[rpath.index(".upload")+1:])
-            else:
-                rpath = rpath[0]
-            if frame not in annotations:
-                annotations[frame] = Annotation.Frame(
-                    frame=frame,
-                    name=rpath,
-                    height=db_image["height"],
-                    width=db_image["width"],
-                    labeled_shapes=[],
-                    tags=[],
-                )
-            return annotations[frame]
-
-        annotations = {}
+        # Frames are generated in the order of frame numbers. Shapes, tags
+        # and interpolated tracks are merged lazily, so only annotations of
+        # the current frame are kept in memory.
         data_manager = DataManager(self._annotation_ir)
-        for shape in data_manager.to_shapes(self._db_task.size):
-            _get_frame(annotations, shape).labeled_shapes.append(self._export_labeled_shape(shape))
-
-        for tag in self._annotation_ir.tags:
-            _get_frame(annotations, tag).tags.append(self._export_tag(tag))
-
-        return iter(annotations.values())
+        shapes = ((shape, False) for shape in
+            data_manager.to_shapes_by_frame(self._db_task.size))
+        tags = ((tag, True) for tag in
+            sorted(self._annotation_ir.tags, key=lambda tag: tag["frame"]))
+        get_frame = lambda item: item[0]["frame"]
+
+        for frame, objects in itertools.groupby(
+                heapq.merge(shapes, tags, key=get_frame), key=get_frame):
+            frame_annotation = self._get_frame(frame)
+            for obj, is_tag in objects:
+                if is_tag:
+                    frame_annotation.tags.append(self._export_tag(obj))
+                else:
+                    frame_annotation.labeled_shapes.append(
+                        self._export_labeled_shape(obj))
+            yield frame_annotation
 
     @property
     def shapes(self):
@@ -337,14 +355,16 @@ class Annotation:
     @property
     def tracks(self):
         for track in self._annotation_ir.tracks:
-            tracked_shapes = TrackManager.get_interpolated_shapes(track, 0, self._db_task.size)
-            for tracked_shape in tracked_shapes:
+            tracked_shapes = []
+            for tracked_shape in TrackManager.iter_interpolated_shapes(
+                    track, 0, self._db_task.size):
                 tracked_shape["attributes"] += track["attributes"]
+                tracked_shapes.append(self._export_tracked_shape(tracked_shape))
 
             yield Annotation.Track(
                 label=self._get_label_name(track["label_id"]),
                 group=track['group'],
-                shapes=[self._export_tracked_shape(shape) for shape in tracked_shapes],
+                shapes=tracked_shapes,
             )
 
     @property
@@ -397,23 +417,27 @@ class Annotation:
         if self._len() > self._MAX_ANNO_SIZE:
             self._create_callback(self._annotation_ir.serialize())
             self._annotation_ir.reset()
+            self._annotation_size = 0
 
     def add_tag(self, tag):
         imported_tag = self._import_tag(tag)
         if imported_tag['label_id']:
             self._annotation_ir.add_tag(imported_tag)
+            self._annotation_size += 1
             self._call_callback()
 
     def add_shape(self, shape):
         imported_shape = self._import_shape(shape)
         if imported_shape['label_id']:
             self._annotation_ir.add_shape(imported_shape)
+            self._annotation_size += 1
             self._call_callback()
 
     def add_track(self, track):
         imported_track = self._import_track(track)
         if imported_track['label_id']:
             self._annotation_ir.add_track(imported_track)
+            self._annotation_size += len(imported_track['shapes'])
             self._call_callback()
 
     @property
@@ -421,11 +445,9 @@ class Annotation:
         return self._annotation_ir
 
     def _len(self):
-        track_len = 0
-        for track in self._annotation_ir.tracks:
-            track_len += len(track['shapes'])
-
-        return len(self._annotation_ir.tags) + len(self._annotation_ir.shapes) + track_len
+        # The size is counted on adding of objects to avoid walking
+        # through all tracks after every added object
+        return self._annotation_size
 
     @property
     def frame_info(self):
@@ -22,12 +22,13 @@ format_spec = {
     ],
 }
 
-def mask_to_polygon(mask, tolerance=1.0, area_threshold=1):
+def mask_to_polygon(mask, tolerance=1.0, area_threshold=1, offset=(0, 0)):
     """Convert object's mask to polygon [[x1,y1, x2,y2 ...], [...]]
     Args:
         mask: object's mask presented as 2D array of 0 and 1
         tolerance: maximum distance from original points of polygon to approximated
         area_threshold: if area of a polygon is less than this value, remove this small object
+        offset: (x, y) position of the mask if it is a part of an image
     """
     from skimage import measure
     from pycocotools import mask as mask_util
@@ -40,6 +41,7 @@ def mask_to_polygon(mask, tolerance=1.0, area_threshold=1):
     # Fix coordinates after padding
     contours = np.subtract(contours, 1)
     for contour in contours:
+        contour = contour + (offset[1], offset[0])
         if not np.array_equal(contour[0], contour[-1]):
             contour = np.vstack((contour, contour[0]))
         contour = measure.approximate_polygon(contour, tolerance)
@@ -52,84 +54,156 @@ def mask_to_polygon(mask, tolerance=1.0, area_threshold=1):
             reshaped_contour = [point if point > 0 else 0 for point in reshaped_contour]
 
             # Check if area of a polygon is enough
-            rle = mask_util.frPyObjects([reshaped_contour], mask.shape[0], mask.shape[1])
+            rle = mask_util.frPyObjects([reshaped_contour],
+                mask.shape[0] + offset[1], mask.shape[1] + offset[0])
             area = mask_util.area(rle)
             if sum(area) > area_threshold:
                 polygons.append(reshaped_contour)
     return polygons
 
+def _get_bounding_box(points):
+    return min(points[0::2]), min(points[1::2]), max(points[0::2]), max(points[1::2])
+
+def fix_segments_intersections(polygons, height, width, img_name,
+                            threshold=0.0, ratio_tolerance=0.001, area_threshold=1):
+    """Find all intersected regions and crop contour for back object by objects which
+        are in front of the first one. It is related to a specialty of segmentation
+        in CVAT annotation. Intersection is calculated via function 'iou' from cocoapi
+    Args:
+        polygons: all objects on image represented as 2D array of objects' contours
+        height: height of image
+        width: width of image
+        img_name: name of image file
+        threshold: threshold of intersection over union of two objects.
+            By default is set to 0 and processes any two intersected objects
+        ratio_tolerance: used for situation when one object is fully or almost fully
+            inside another one and we don't want make "hole" in one of objects
+    """
+    from pycocotools import mask as mask_util
+    import numpy as np
+
+    empty_polygon = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+
+    # Objects with disjoint bounding boxes have zero IoU, so only pairs with
+    # intersecting boxes are rasterized (boxes are extended by a pixel
+    # because of rasterization on borders). Objects are cropped in turn,
+    # thus RLEs of the objects above the current one are computed once.
+    boxes = np.array([_get_bounding_box(polygon['points']) for polygon in polygons],
+        dtype=float).reshape(-1, 4)
+    rles = [None] * len(polygons)
+
+    for i, _ in enumerate(polygons):
+        rle_bottom = rles[i] or mask_util.frPyObjects([polygons[i]['points']], height, width)
+        box = boxes[i]
+        if threshold < 0:
+            candidates = range(i + 1, len(polygons))
+        else:
+            top_boxes = boxes[i + 1:]
+            candidates = (np.flatnonzero(
+                (top_boxes[:, 0] <= box[2] + 1) & (box[0] <= top_boxes[:, 2] + 1) &
+                (top_boxes[:, 1] <= box[3] + 1) & (box[1] <= top_boxes[:, 3] + 1)
+            ) + i + 1).tolist()
+        segment_overlapped = False
+        for j in candidates:
+            if rles[j] is None:
+                rles[j] = mask_util.frPyObjects([polygons[j]['points']], height, width)
+            rle_top = rles[j]
+            iou = mask_util.iou(rle_bottom, rle_top, [0, 0])
+            area_top = sum(mask_util.area(rle_top))
+            area_bottom = sum(mask_util.area(rle_bottom))
+            if area_bottom == 0:
+                continue
+            area_ratio = area_top / area_bottom
+            sum_iou = sum(iou)
+
+            # If segment is fully inside another one, save this segment as is
+            if area_ratio - ratio_tolerance < sum_iou[0] < area_ratio + ratio_tolerance:
+                continue
+            # Check situation when bottom segment is fully inside top.
+            # It means that in annotation is mistake. Save this segment as is
+            if 1 / area_ratio - ratio_tolerance < sum_iou[0] < 1 / area_ratio + ratio_tolerance:
+                continue
+
+            if sum_iou[0] > threshold:
+                segment_overlapped = True
+                bottom_mask = np.array(mask_util.decode(rle_bottom), dtype=np.uint8)
+                top_mask = np.array(mask_util.decode(rle_top), dtype=np.uint8)
+
+                bottom_mask = np.subtract(bottom_mask, top_mask)
+                bottom_mask[bottom_mask > 1] = 0
+
+                bottom_mask = np.sum(bottom_mask, axis=2)
+                bottom_mask = np.array(bottom_mask > 0, dtype=np.uint8)
+                # Contours are traced only inside the bounding box of the
+                # object (with a margin of empty pixels)
+                x0 = max(int(box[0]) - 1, 0)
+                y0 = max(int(box[1]) - 1, 0)
+                x1 = min(int(box[2]) + 3, width)
+                y1 = min(int(box[3]) + 3, height)
+                polygons[i]['points'] = mask_to_polygon(bottom_mask[y0:y1, x0:x1],
+                    area_threshold=area_threshold, offset=(x0, y0))
+                # If some segment is empty, do small fix to avoid error in cocoapi function
+                if len(polygons[i]['points']) == 0:
+                    polygons[i]['points'] = [empty_polygon]
+                rle_bottom = mask_util.frPyObjects(polygons[i]['points'], height, width)
+        rles[i] = None
+        if not segment_overlapped:
+            polygons[i]['points'] = [polygons[i]['points']]
+
+    output_polygons = []
+    for polygon in polygons:
+        poly_len = len(polygon['points'])
+        if poly_len != 0 and polygon['points'] != [empty_polygon]:
+            output_polygons.append(polygon)
+
+    return output_polygons
+
+def fix_frames_intersections(frames, workers=1):
+    """Apply fix_segments_intersections to many images. Images are independent,
+        so they are processed by a pool of processes. Results are returned
+        in the order of images
+    Args:
+        frames: iterable of (polygons, height, width, img_name) tuples
+        workers: number of processes
+    """
+    if workers <= 1:
+        for frame in frames:
+            yield fix_segments_intersections(*frame)
+        return
+
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+
+    # A limited number of images is submitted ahead, so the whole task isn't
+    # kept in memory. Images with one object are not worth sending to
+    # another process.
+    pending = deque()
+    submitted = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for frame in frames:
+            if len(frame[0]) > 1:
+                pending.append(executor.submit(fix_segments_intersections, *frame))
+                submitted += 1
+            else:
+                pending.append(fix_segments_intersections(*frame))
+            while submitted > 2 * workers:
+                result = pending.popleft()
+                if not isinstance(result, list):
+                    result = result.result()
+                    submitted -= 1
+                yield result
+
+        while pending:
+            result = pending.popleft()
+            yield result if isinstance(result, list) else result.result()
+
 def dump(file_object, annotations):
     import numpy as np
     import json
-    from collections import OrderedDict
+    from collections import OrderedDict, deque
     from pycocotools import mask as mask_util
     from pycocotools import coco as coco_loader
-
-
-    def fix_segments_intersections(polygons, height, width, img_name,
-                                threshold=0.0, ratio_tolerance=0.001, area_threshold=1):
-        """Find all intersected regions and crop contour for back object by objects which
-            are in front of the first one. It is related to a specialty of segmentation
-            in CVAT annotation. Intersection is calculated via function 'iou' from cocoapi
-        Args:
-            polygons: all objects on image represented as 2D array of objects' contours
-            height: height of image
-            width: width of image
-            img_name: name of image file
-            threshold: threshold of intersection over union of two objects.
-                By default is set to 0 and processes any two intersected objects
-            ratio_tolerance: used for situation when one object is fully or almost fully
-                inside another one and we don't want make "hole" in one of objects
-        """
-        empty_polygon = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
-
-        for i, _ in enumerate(polygons):
-            rle_bottom = mask_util.frPyObjects([polygons[i]['points']], height, width)
-            segment_overlapped = False
-            for j in range(i + 1, len(polygons)):
-                rle_top = mask_util.frPyObjects([polygons[j]['points']], height, width)
-                iou = mask_util.iou(rle_bottom, rle_top, [0, 0])
-                area_top = sum(mask_util.area(rle_top))
-                area_bottom = sum(mask_util.area(rle_bottom))
-                if area_bottom == 0:
-                    continue
-                area_ratio = area_top / area_bottom
-                sum_iou = sum(iou)
-
-                # If segment is fully inside another one, save this segment as is
-                if area_ratio - ratio_tolerance < sum_iou[0] < area_ratio + ratio_tolerance:
-                    continue
-                # Check situation when bottom segment is fully inside top.
-                # It means that in annotation is mistake. Save this segment as is
-                if 1 / area_ratio - ratio_tolerance < sum_iou[0] < 1 / area_ratio + ratio_tolerance:
-                    continue
-
-                if sum_iou[0] > threshold:
-                    segment_overlapped = True
-                    bottom_mask = np.array(mask_util.decode(rle_bottom), dtype=np.uint8)
-                    top_mask = np.array(mask_util.decode(rle_top), dtype=np.uint8)
-
-                    bottom_mask = np.subtract(bottom_mask, top_mask)
-                    bottom_mask[bottom_mask > 1] = 0
-
-                    bottom_mask = np.sum(bottom_mask, axis=2)
-                    bottom_mask = np.array(bottom_mask > 0, dtype=np.uint8)
-                    polygons[i]['points'] = mask_to_polygon(bottom_mask, area_threshold=area_threshold)
-                    # If some segment is empty, do small fix to avoid error in cocoapi function
-                    if len(polygons[i]['points']) == 0:
-                        polygons[i]['points'] = [empty_polygon]
-                    rle_bottom = mask_util.frPyObjects(polygons[i]['points'], height, width)
-            if not segment_overlapped:
-                polygons[i]['points'] = [polygons[i]['points']]
-
-        output_polygons = []
-        for polygon in polygons:
-            poly_len = len(polygon['points'])
-            if poly_len != 0 and polygon['points'] != [empty_polygon]:
-                output_polygons.append(polygon)
-
-        return output_polygons
-
+    from django.conf import settings
 
     def polygon_area_and_bbox(polygon, height, width):
         """Calculate area of object's polygon and bounding box around it
@@ -264,37 +338,51 @@ def dump(file_object, annotations):
     insert_info_data(annotations, result_annotation)
     category_map = insert_categories_data(annotations, result_annotation)
 
-    segm_id = 1
-    for img in annotations.group_by_frame():
-        polygons = []
-
-        for shape in img.labeled_shapes:
-            if shape.type == 'polygon' or shape.type == 'rectangle':
-                polygon = {
-                    'label': shape.label,
-                    'points': shape.points,
-                    'z_order': shape.z_order,
-                    'group': shape.group,
-                }
-
-                if shape.type == 'rectangle':
-                    xtl = polygon['points'][0]
-                    ytl = polygon['points'][1]
-                    xbr = polygon['points'][2]
-                    ybr = polygon['points'][3]
-                    polygon['points'] = [xtl, ytl, xbr, ytl, xbr, ybr, xtl, ybr]
+    # Images are taken from the queue in the order of their polygons
+    images = deque()
+    def get_frames():
+        for img in annotations.group_by_frame():
+            polygons = []
 
-                polygons.append(polygon)
+            for shape in img.labeled_shapes:
+                if shape.type == 'polygon' or shape.type == 'rectangle':
+                    polygon = {
+                        'label': shape.label,
+                        'points': shape.points,
+                        'z_order': shape.z_order,
+                        'group': shape.group,
+                    }
+
+                    if shape.type == 'rectangle':
+                        xtl = polygon['points'][0]
+                        ytl = polygon['points'][1]
+                        xbr = polygon['points'][2]
+                        ybr = polygon['points'][3]
+                        polygon['points'] = [xtl, ytl, xbr, ytl, xbr, ybr, xtl, ybr]
+
+                    polygons.append(polygon)
+
+            polygons.sort(key=lambda x: int(x['z_order']))
+            images.append(img)
+            yield polygons, img.height, img.width, img.name
+
+    def wrap_points(frames):
+        for polygons, _, _, _ in frames:
+            for polygon in polygons:
+                polygon['points'] = [polygon['points']]
+            yield polygons
 
-        polygons.sort(key=lambda x: int(x['z_order']))
+    if annotations.meta['task']['z_order'] == 'True':
+        fixed_polygons = fix_frames_intersections(get_frames(),
+            workers=settings.ANNOTATION_DUMP_WORKERS)
+    else:
+        fixed_polygons = wrap_points(get_frames())
 
+    segm_id = 1
+    for polygons in fixed_polygons:
+        img = images.popleft()
         # Create new image
         insert_image_data(img, result_annotation)
-        if annotations.meta['task']['z_order'] == 'True':
-            polygons = fix_segments_intersections(polygons, img.height, img.width, img.name)
-        else:
-            for polygon in polygons:
-                polygon['points'] = [polygon['points']]
 
         # combine grouped polygons with the same label
         grouped_poligons = OrderedDict()
@@ -16,14 +16,66 @@ format_spec = {
     ],
 }
 
+def rasterize_frame(shapes, height, width, colormap):
+    """Paint all shapes of a frame into one index map and encode it as PNG
+    Args:
+        shapes: list of (label index, polygon points) sorted by z_order,
+            the next shape is painted over the previous ones
+        height: height of the image
+        width: width of the image
+        colormap: uint8 array (number of labels, 3) of RGB colors of labels
+    """
+    import io
+    import numpy as np
+    from PIL import Image, ImageDraw
+
+    index_map = Image.new('L', (width, height), 0)
+    draw = ImageDraw.Draw(index_map)
+    for label_idx, points in shapes:
+        draw.polygon(points, fill=label_idx)
+
+    # Colors are taken from the lookup table for all pixels at once
+    image = Image.fromarray(colormap[np.asarray(index_map)])
+    buf = io.BytesIO()
+    # The fastest level of compression: masks are compressed well anyway
+    image.save(buf, format='PNG', compress_level=1)
+    return buf.getvalue()
+
+def rasterize_frames(frames, colormap, workers=1):
+    """Rasterize frames by a pool of processes. PNG images are returned
+        in the order of frames
+    Args:
+        frames: iterable of (shapes, height, width) tuples
+        colormap: uint8 array (number of labels, 3) of RGB colors of labels
+        workers: number of processes
+    """
+    if workers <= 1:
+        for shapes, height, width in frames:
+            yield rasterize_frame(shapes, height, width, colormap)
+        return
+
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+
+    # A limited number of frames is submitted ahead, so images are written
+    # while next frames are being rasterized
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for shapes, height, width in frames:
+            pending.append(executor.submit(rasterize_frame,
+                shapes, height, width, colormap))
+            if len(pending) > 2 * workers:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
 def dump(file_object, annotations):
     from zipfile import ZipFile
     import numpy as np
     import os
-    from pycocotools import mask as maskUtils
-    import matplotlib.image
-    import io
     from collections import OrderedDict
+    from django.conf import settings
 
     # RGB format, (0, 0, 0) used for background
     def genearte_pascal_colormap(size=256):
@@ -38,10 +90,10 @@ def dump(file_object, annotations):
         return colormap
 
     def convert_box_to_polygon(points):
-        xtl = shape.points[0]
-        ytl = shape.points[1]
-        xbr = shape.points[2]
-        ybr = shape.points[3]
+        xtl = points[0]
+        ytl = points[1]
+        xbr = points[2]
+        ybr = points[3]
 
         return [xtl, ytl, xbr, ytl, xbr, ybr, xtl, ybr]
 
@@ -49,13 +101,14 @@ def dump(file_object, annotations):
     labels = [label[1]["name"] for label in annotations.meta["task"]["labels"] if label[1]["name"] != 'background']
     labels.insert(0, 'background')
     label_colors = OrderedDict((label, colormap[idx]) for idx, label in enumerate(labels))
+    label_indexes = {label: idx for idx, label in enumerate(labels)}
+    label_colormap = np.array(list(label_colors.values()), dtype=np.uint8)
 
-    with ZipFile(file_object, "w") as output_zip:
+    annotation_names = []
+    def get_frames():
         for frame_annotation in annotations.group_by_frame():
             image_name = frame_annotation.name
             annotation_name = "{}.png".format(os.path.splitext(os.path.basename(image_name))[0])
-            width = frame_annotation.width
-            height = frame_annotation.height
 
             shapes = frame_annotation.labeled_shapes
             # convert to mask only rectangles and polygons
@@ -63,18 +116,16 @@ def dump(file_object, annotations):
             if not shapes:
                 continue
             shapes = sorted(shapes, key=lambda x: int(x.z_order))
-            img = np.zeros((height, width, 3))
-            buf = io.BytesIO()
-            for shape in shapes:
-                points = shape.points if shape.type != 'rectangle' else convert_box_to_polygon(shape.points)
-                rles = maskUtils.frPyObjects([points], height, width)
-                rle = maskUtils.merge(rles)
-                mask = maskUtils.decode(rle)
-                color = label_colors[shape.label] / 255
-                idx = (mask > 0)
-                img[idx] = color
-
-            matplotlib.image.imsave(buf, img, format='png')
-            output_zip.writestr(annotation_name, buf.getvalue())
+
+            annotation_names.append(annotation_name)
+            yield [(label_indexes[shape.label],
+                    shape.points if shape.type != 'rectangle' else convert_box_to_polygon(shape.points))
+                for shape in shapes], frame_annotation.height, frame_annotation.width
+
+    with ZipFile(file_object, "w") as output_zip:
+        images = rasterize_frames(get_frames(), label_colormap,
+            workers=settings.ANNOTATION_DUMP_WORKERS)
+        for idx, image in enumerate(images):
+            output_zip.writestr(annotation_names[idx], image)
         labels = '\n'.join('{}:{}'.format(label, ','.join(str(i) for i in color)) for label, color in label_colors.items())
         output_zip.writestr('colormap.txt', labels)
@@ -4,6 +4,9 @@
 # SPDX-License-Identifier: MIT
 
 import cv2
+import numpy as np
+
+from cvat.apps.engine import frame_provider
 
 class ImageLoader():
     def __init__(self, image_list):
@@ -22,3 +25,14 @@ class ImageLoader():
     @staticmethod
     def _load_image(path_to_image):
         return cv2.imread(path_to_image)
+
+class FrameLoader(ImageLoader):
+    # Frames of a task are read by the frame provider. Thus they are
+    # available for tasks without extracted frames too.
+    def __init__(self, db_task):
+        super().__init__(range(db_task.size))
+        self._db_task = db_task
+
+    def _load_image(self, frame):
+        frame_data = frame_provider.get_frame(self._db_task, frame)
+        return cv2.imdecode(np.frombuffer(frame_data, dtype=np.uint8), cv2.IMREAD_COLOR)
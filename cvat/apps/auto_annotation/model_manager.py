@@ -3,7 +3,6 @@
 # SPDX-License-Identifier: MIT
 
 import django_rq
-import fnmatch
 import numpy as np
 import os
 import rq
@@ -15,6 +14,7 @@ from django.utils import timezone
 from django.conf import settings
 
 from cvat.apps.engine.log import slogger
+from cvat.apps.engine.progress import ProgressReporter
 from cvat.apps.engine.models import Task as TaskModel
 from cvat.apps.authentication.auth import has_admin_role
 from cvat.apps.engine.serializers import LabeledDataSerializer
@@ -22,7 +22,7 @@ from cvat.apps.engine.annotation import put_task_data, patch_task_data
 
 from .models import AnnotationModel, FrameworkChoice
 from .model_loader import load_labelmap
-from .image_loader import ImageLoader
+from .image_loader import FrameLoader
 from .inference import run_inference_engine_annotation
 
 
@@ -208,28 +208,12 @@ def delete(dl_model_id):
     else:
         raise Exception("Requested DL model {} doesn't exist".format(dl_model_id))
 
-def get_image_data(path_to_data):
-    def get_image_key(item):
-        return int(os.path.splitext(os.path.basename(item))[0])
-
-    image_list = []
-    for root, _, filenames in os.walk(path_to_data):
-        for filename in fnmatch.filter(filenames, "*.jpg"):
-            image_list.append(os.path.join(root, filename))
-
-    image_list.sort(key=get_image_key)
-    return ImageLoader(image_list)
-
-
 def run_inference_thread(tid, model_file, weights_file, labels_mapping, attributes, convertation_file, reset, user, restricted=True):
     def update_progress(job, progress):
-        job.refresh()
-        if "cancel" in job.meta:
+        if not progress_reporter.update(round(progress * progress_reporter.total / 100)):
             del job.meta["cancel"]
             job.save()
             return False
-        job.meta["progress"] = progress
-        job.save_meta()
         return True
 
     try:
@@ -240,8 +224,10 @@ def run_inference_thread(tid, model_file, weights_file, labels_mapping, attribut
 
         result = None
         slogger.glob.info("auto annotation with openvino toolkit for task {}".format(tid))
+        data = FrameLoader(db_task)
+        progress_reporter = ProgressReporter(total=len(data), job=job, check_cancel=True)
         result = run_inference_engine_annotation(
-            data=get_image_data(db_task.get_data_dirname()),
+            data=data,
             model_file=model_file,
             weights_file=weights_file,
             labels_mapping=labels_mapping,
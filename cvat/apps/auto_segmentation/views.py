@@ -11,9 +11,10 @@ from cvat.apps.authentication.decorators import login_required
 from cvat.apps.engine.models import Task as TaskModel
 from cvat.apps.engine.serializers import LabeledDataSerializer
 from cvat.apps.engine.annotation import put_task_data
+from cvat.apps.engine import frame_provider
+from cvat.apps.engine.progress import ProgressReporter
 
 import django_rq
-import fnmatch
 import json
 import os
 import rq
@@ -23,7 +24,7 @@ import numpy as np
 from cvat.apps.engine.log import slogger
 
 import sys
-import skimage.io
+from PIL import Image
 from skimage.measure import find_contours, approximate_polygon
 
 
@@ -88,16 +89,14 @@ def run_tensorflow_auto_segmentation(image_list, labels_mapping, treshold):
 
     ## RUN OBJECT DETECTION
     result = {}
-    for image_num, image_path in enumerate(image_list):
-        job.refresh()
-        if 'cancel' in job.meta:
+    progress = ProgressReporter(total=len(image_list), job=job, check_cancel=True)
+    for image_num, image_file in enumerate(image_list):
+        if not progress.update(image_num):
             del job.meta['cancel']
             job.save()
             return None
-        job.meta['progress'] = image_num * 100 / len(image_list)
-        job.save_meta()
 
-        image = skimage.io.imread(image_path)
+        image = np.array(Image.open(image_file).convert('RGB'))
 
         # for multiple image detection, "batch size" must be equal to number of images
         r = model.detect([image], verbose=1)
@@ -118,19 +117,6 @@ def run_tensorflow_auto_segmentation(image_list, labels_mapping, treshold):
     return result
 
 
-def make_image_list(path_to_data):
-    def get_image_key(item):
-        return int(os.path.splitext(os.path.basename(item))[0])
-
-    image_list = []
-    for root, _, filenames in os.walk(path_to_data):
-        for filename in fnmatch.filter(filenames, '*.jpg'):
-                image_list.append(os.path.join(root, filename))
-
-    image_list.sort(key=get_image_key)
-    return image_list
-
-
 def convert_to_cvat_format(data):
     result = {
         "tracks": [],
@@ -166,7 +152,7 @@ def create_thread(tid, labels_mapping, user):
         # Get job indexes and segment length
         db_task = TaskModel.objects.get(pk=tid)
         # Get image list
-        image_list = make_image_list(db_task.get_data_dirname())
+        image_list = frame_provider.FrameFiles(db_task)
 
         # Run auto segmentation by tf
         result = None
@@ -1,39 +1,43 @@
 from collections import OrderedDict
-import os
-import os.path as osp
+import io
 
+import numpy as np
 from django.db import transaction
+from PIL import Image
 
 from cvat.apps.annotation.annotation import Annotation
+from cvat.apps.engine import frame_provider
 from cvat.apps.engine.annotation import TaskAnnotation
-from cvat.apps.engine.models import Task, ShapeType
+from cvat.apps.engine.models import ShapeType
 
 import datumaro.components.extractor as datumaro
 from datumaro.util.image import lazy_image
 
 
-class CvatImagesDirExtractor(datumaro.Extractor):
-    _SUPPORTED_FORMATS = ['.png', '.jpg']
-
-    def __init__(self, url):
+class CvatTaskImagesExtractor(datumaro.Extractor):
+    # Frames are read through the frame provider, so tasks without
+    # extracted frames (with chunks) are exported too
+    def __init__(self, url, db_task):
         super().__init__()
 
+        self._db_task = db_task
+
         items = []
-        for (dirpath, _, filenames) in os.walk(url):
-            for name in filenames:
-                path = osp.join(dirpath, name)
-                if self._is_image(path):
-                    item_id = Task.get_image_frame(path)
-                    item = datumaro.DatasetItem(
-                        id=item_id, image=lazy_image(path))
-                    items.append((item.id, item))
-
-        items = sorted(items, key=lambda e: e[0])
-        items = OrderedDict(items)
-        self._items = items
+        for frame in range(db_task.size):
+            item = datumaro.DatasetItem(id=frame,
+                image=lazy_image(frame, loader=self._load_frame))
+            items.append((item.id, item))
+
+        self._items = OrderedDict(items)
 
         self._subsets = None
 
+    def _load_frame(self, frame):
+        # The same format as for datumaro load_image(): HWC BGR float
+        image = Image.open(io.BytesIO(frame_provider.get_frame(self._db_task, frame)))
+        image = np.asarray(image.convert('RGB'), dtype=np.float32)
+        return np.ascontiguousarray(image[:, :, ::-1])
+
     def __iter__(self):
         for item in self._items.values():
             yield item
@@ -49,12 +53,6 @@ class CvatImagesDirExtractor(datumaro.Extractor):
             raise KeyError()
         return self._items[item_id]
 
-    def _is_image(self, path):
-        for ext in self._SUPPORTED_FORMATS:
-            if osp.isfile(path) and path.endswith(ext):
-                return True
-        return False
-
 
 class CvatTaskExtractor(datumaro.Extractor):
     def __init__(self, url, db_task, user):
@@ -6,11 +6,11 @@ import shutil
 import sys
 import tempfile
 
-from django.utils import timezone
-import django_rq
-
+from cvat.apps.engine import export_cache
+from cvat.apps.engine.annotation import get_job_versions
 from cvat.apps.engine.log import slogger
 from cvat.apps.engine.models import Task, ShapeType
+from cvat.apps.engine.progress import ProgressReporter
 from .util import current_function_name, make_zip_archive
 
 _CVAT_ROOT_DIR = __file__[:__file__.rfind('cvat/')]
@@ -18,7 +18,7 @@ _DATUMARO_REPO_PATH = osp.join(_CVAT_ROOT_DIR, 'datumaro')
 sys.path.append(_DATUMARO_REPO_PATH)
 from datumaro.components.project import Project
 import datumaro.components.extractor as datumaro
-from .bindings import CvatImagesDirExtractor, CvatTaskExtractor
+from .bindings import CvatTaskImagesExtractor, CvatTaskExtractor
 
 
 _MODULE_NAME = __package__ + '.' + osp.splitext(osp.basename(__file__))[0]
@@ -33,9 +33,6 @@ _TASK_IMAGES_EXTRACTOR = '_cvat_task_images'
 _TASK_ANNO_EXTRACTOR = '_cvat_task_anno'
 _TASK_IMAGES_REMOTE_EXTRACTOR = 'cvat_rest_api_task_images'
 
-def get_export_cache_dir(db_task):
-    return osp.join(db_task.get_task_dirname(), 'export_cache')
-
 EXPORT_FORMAT_DATUMARO_PROJECT = "datumaro_project"
 
 
@@ -72,11 +69,9 @@ class TaskProject:
     def _create(self):
         self._project = Project.generate(self._project_dir)
         self._project.add_source('task_%s' % self._db_task.id, {
-            'url': self._db_task.get_data_dirname(),
             'format': _TASK_IMAGES_EXTRACTOR,
         })
-        self._project.env.extractors.register(_TASK_IMAGES_EXTRACTOR,
-            CvatImagesDirExtractor)
+        self._register_images_extractor()
 
         self._init_dataset()
         self._dataset.define_categories(self._generate_categories())
@@ -85,18 +80,19 @@ class TaskProject:
 
     def _load(self):
         self._project = Project.load(self._project_dir)
+        self._register_images_extractor()
+
+    def _register_images_extractor(self):
         self._project.env.extractors.register(_TASK_IMAGES_EXTRACTOR,
-            CvatImagesDirExtractor)
+            lambda url: CvatTaskImagesExtractor(url, db_task=self._db_task))
 
     def _import_from_task(self, user):
         self._project = Project.generate(self._project_dir)
 
         self._project.add_source('task_%s_images' % self._db_task.id, {
-            'url': self._db_task.get_data_dirname(),
             'format': _TASK_IMAGES_EXTRACTOR,
         })
-        self._project.env.extractors.register(_TASK_IMAGES_EXTRACTOR,
-            CvatImagesDirExtractor)
+        self._register_images_extractor()
 
         self._project.add_source('task_%s_anno' % self._db_task.id, {
             'format': _TASK_ANNO_EXTRACTOR,
@@ -306,6 +302,8 @@ class TaskProject:
 
 
 DEFAULT_FORMAT = EXPORT_FORMAT_DATUMARO_PROJECT
+# How long results of export jobs are kept. Exported files are kept in the
+# export cache while annotations of the task are the same.
 DEFAULT_CACHE_TTL = timedelta(hours=10)
 CACHE_TTL = DEFAULT_CACHE_TTL
 
@@ -316,43 +314,40 @@ def export_project(task_id, user, dst_format=None, server_url=None):
         if not dst_format:
             dst_format = DEFAULT_FORMAT
 
-        cache_dir = get_export_cache_dir(db_task)
-        save_dir = osp.join(cache_dir, dst_format)
-        archive_path = osp.normpath(save_dir) + '.zip'
-
-        task_time = timezone.localtime(db_task.updated_date).timestamp()
-        if not (osp.exists(archive_path) and \
-                task_time <= osp.getmtime(archive_path)):
-            os.makedirs(cache_dir, exist_ok=True)
+        # The code of the export is a part of the key, so exported files
+        # are recreated after an update of CVAT or Datumaro
+        key = export_cache.get_cache_key(db_task,
+            job_versions=get_job_versions(task_id),
+            export_format='dataset/' + dst_format,
+            handler_hash=export_cache.get_handler_hash(__file__,
+                osp.join(osp.dirname(__file__), 'bindings.py')),
+            params=[server_url])
+
+        def create_archive(archive_path):
+            progress = ProgressReporter(total=None,
+                status='Dataset is being exported')
+            progress.update(force=True)
             with tempfile.TemporaryDirectory(
-                    dir=cache_dir, prefix=dst_format + '_') as temp_dir:
+                    dir=db_task.get_export_cache_dirname(),
+                    prefix=dst_format + '_') as temp_dir:
                 project = TaskProject.from_task(db_task, user)
                 project.export(dst_format, save_dir=temp_dir, save_images=True,
                     server_url=server_url)
 
-                os.makedirs(cache_dir, exist_ok=True)
-                make_zip_archive(temp_dir, archive_path)
+                progress.set_status('Dataset is being archived... {progress}%')
+                make_zip_archive(temp_dir, archive_path, progress=progress)
 
-            archive_ctime = osp.getctime(archive_path)
-            scheduler = django_rq.get_scheduler()
-            cleaning_job = scheduler.enqueue_in(time_delta=CACHE_TTL,
-                func=clear_export_cache,
-                task_id=task_id,
-                file_path=archive_path, file_ctime=archive_ctime)
             slogger.task[task_id].info(
-                "The task '{}' is exported as '{}' "
-                "and available for downloading for next '{}'. "
-                "Export cache cleaning job is enqueued, "
-                "id '{}', start in '{}'".format(
-                    db_task.name, dst_format, CACHE_TTL,
-                    cleaning_job.id, CACHE_TTL))
-
-        return archive_path
+                "The task '{}' is exported as '{}'".format(db_task.name, dst_format))
+
+        return export_cache.get_or_create(db_task, key, 'zip', create_archive)
     except Exception:
         log_exception(slogger.task[task_id])
         raise
 
 def clear_export_cache(task_id, file_path, file_ctime):
+    # Cleaning jobs aren't enqueued anymore, the export cache is limited by
+    # size. The function is kept for jobs enqueued by previous versions.
     try:
         if osp.exists(file_path) and osp.getctime(file_path) == file_ctime:
             os.remove(file_path)
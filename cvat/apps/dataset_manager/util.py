@@ -7,9 +7,15 @@ def current_function_name(depth=1):
     return inspect.getouterframes(inspect.currentframe())[depth].function
 
 
-def make_zip_archive(src_path, dst_path):
+def make_zip_archive(src_path, dst_path, progress=None):
+    paths = [osp.join(dirpath, name)
+        for dirpath, _, filenames in os.walk(src_path)
+        for name in filenames]
+    if progress is not None:
+        progress.total = len(paths)
+
     with zipfile.ZipFile(dst_path, 'w') as archive:
-        for (dirpath, _, filenames) in os.walk(src_path):
-            for name in filenames:
-                path = osp.join(dirpath, name)
-                archive.write(path, osp.relpath(path, src_path))
+        for path in paths:
+            archive.write(path, osp.relpath(path, src_path))
+            if progress is not None:
+                progress.advance(nbytes=osp.getsize(path))
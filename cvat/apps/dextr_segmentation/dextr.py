@@ -29,7 +29,7 @@ class DEXTR_HANDLER:
             raise Exception("DEXTR_MODEL_DIR is not defined")
 
 
-    def handle(self, im_path, points):
+    def handle(self, image, points):
         # Lazy initialization
         if not self._plugin:
             self._plugin = make_plugin()
@@ -39,7 +39,7 @@ class DEXTR_HANDLER:
             self._output_blob = next(iter(self._network.outputs))
             self._exec_network = self._plugin.load(network=self._network)
 
-        image = PIL.Image.open(im_path)
+        image = PIL.Image.open(image)
         numpy_image = np.array(image)
         points = np.asarray([[int(p["x"]), int(p["y"])] for p in points], dtype=int)
         bounding_box = (
@@ -6,21 +6,25 @@ from django.http import HttpResponse, HttpResponseBadRequest, JsonResponse
 from cvat.apps.authentication.decorators import login_required
 from rules.contrib.views import permission_required, objectgetter
 
-from cvat.apps.engine.models import Job
+from cvat.apps.engine.models import Job, Task
 from cvat.apps.engine.log import slogger
+from cvat.apps.engine import frame_provider
 from cvat.apps.dextr_segmentation.dextr import DEXTR_HANDLER
 
 import django_rq
+import io
 import json
-import os
 import rq
 
 __RQ_QUEUE_NAME = "default"
 __DEXTR_HANDLER = DEXTR_HANDLER()
 
-def _dextr_thread(im_path, points):
+def _dextr_thread(tid, frame, points):
     job = rq.get_current_job()
-    job.meta["result"] = __DEXTR_HANDLER.handle(im_path, points)
+    # Frames of tasks with chunks aren't extracted, they are decoded on demand
+    db_task = Task.objects.get(pk=tid)
+    image = io.BytesIO(frame_provider.get_frame(db_task, frame))
+    job.meta["result"] = __DEXTR_HANDLER.handle(image, points)
     job.save_meta()
 
 
@@ -39,7 +43,6 @@ def create(request, jid):
             + "by the USER: {} on the FRAME: {}".format(username, frame))
 
         db_task = Job.objects.select_related("segment__task").get(id=jid).segment.task
-        im_path = os.path.realpath(db_task.get_frame_path(frame))
 
         queue = django_rq.get_queue(__RQ_QUEUE_NAME)
         rq_id = "dextr.create/{}/{}".format(jid, username)
@@ -53,7 +56,7 @@ def create(request, jid):
                 job.delete()
 
         queue.enqueue_call(func=_dextr_thread,
-            args=(im_path, points),
+            args=(db_task.id, frame, points),
             job_id=rq_id,
             timeout=15,
             ttl=30)
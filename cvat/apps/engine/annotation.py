@@ -2,14 +2,22 @@
 #
 # SPDX-License-Identifier: MIT
 
+import io
+import copy
+import bisect
 import os
+import json
+import shutil
+import itertools
+import tempfile
 from enum import Enum
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
 from django.utils import timezone
 from PIL import Image
 
 from django.conf import settings
-from django.db import transaction
+from django.db import connection, transaction
+from django.db.models import Max, Q
 
 from cvat.apps.profiler import silk_profile
 from cvat.apps.engine.plugins import plugin_decorator
@@ -17,6 +25,7 @@ from cvat.apps.annotation.annotation import AnnotationIR, Annotation
 from cvat.apps.engine.utils import execute_python_code, import_modules
 
 from . import models
+from . import export_cache
 from .data_manager import DataManager
 from .log import slogger
 from . import serializers
@@ -122,20 +131,187 @@ def delete_task_data(pk, user):
     annotation = TaskAnnotation(pk, user)
     annotation.delete()
 
-def dump_task_data(pk, user, filename, dumper, scheme, host):
+def get_task_dump_key(db_task, dumper, scheme, host):
+    # Dumps with the same key are identical
+    db_format = dumper.annotation_format
+    return export_cache.get_cache_key(db_task,
+        job_versions=get_job_versions(db_task.id),
+        export_format=dumper.display_name,
+        handler_hash=export_cache.get_handler_hash(
+            os.path.join(settings.BASE_DIR, db_format.handler_file.name)),
+        params=[dumper.handler, scheme, host])
+
+def export_task_data(pk, user, dumper, scheme, host):
+    # Returns a path to the dump in the export cache. Annotations are read
+    # from DB only if there is no dump for current versions of jobs.
+    with transaction.atomic():
+        db_task = models.Task.objects.get(pk=pk)
+        key = get_task_dump_key(db_task, dumper, scheme, host)
+        ext = dumper.format.lower()
+        path = export_cache.get(db_task, key, ext)
+        if path is not None:
+            return path
+
+        annotation = TaskAnnotation(pk, user)
+        annotation.init_from_db()
+
     # For big tasks dump function may run for a long time and
     # we dont need to acquire lock after _AnnotationForTask instance
     # has been initialized from DB.
-    # But there is the bug with corrupted dump file in case 2 or more dump request received at the same time.
-    # https://github.com/opencv/cvat/issues/217
+    return export_cache.get_or_create(db_task, key, ext,
+        lambda path: annotation.dump(path, dumper, scheme, host))
+
+def dump_task_data(pk, user, filename, dumper, scheme, host):
+    try:
+        shutil.copyfile(export_task_data(pk, user, dumper, scheme, host), filename)
+    except FileNotFoundError:
+        # The dump has been evicted from the export cache by another
+        # process before it is copied. It is created again.
+        shutil.copyfile(export_task_data(pk, user, dumper, scheme, host), filename)
+
+# A limit for queries which read annotations for a streaming response (ms)
+_STREAM_STATEMENT_TIMEOUT = 5 * 60 * 1000
+# Streamed job annotations are read by pages of objects. Every page is read
+# by a separate short transaction, so a slow client doesn't keep a
+# transaction open while the response is being sent.
+_STREAM_PAGE_SIZE = 1000
+# Size of parts of a streaming response (characters)
+_STREAM_CHUNK_SIZE = 2**16
+
+def _set_statement_timeout(timeout):
+    # Is applied to the current transaction only
+    if 'postgresql' in settings.DATABASES["default"]["ENGINE"]:
+        with connection.cursor() as cursor:
+            cursor.execute("SET LOCAL statement_timeout = %s", [timeout])
+
+def _get_keyset_filter(fields, values):
+    # Selects rows which follow the values in the order of the fields
+    q = Q(**{fields[-1] + '__gt': values[-1]})
+    for field, value in zip(reversed(fields[:-1]), reversed(values[:-1])):
+        q = Q(**{field + '__gt': value}) | Q(**{field: value}) & q
+    return q
+
+def stream_job_data(pk, user):
+    # Only objects of the current page are kept in memory. The first chunk
+    # is read before the response is started, thus a missing job or a DB
+    # error at the beginning is reported with an error status.
+    annotation = JobAnnotation(pk, user, lock=False)
+    chunks = annotation.iter_from_db()
+    first_chunk = next(chunks)
+
+    def stream():
+        yield first_chunk
+        yield from chunks
+
+    return stream()
+
+def stream_task_data(pk, user):
+    # Annotations of jobs are merged in memory, only the encoding of the
+    # response is streamed. Unlike stream_job_data, memory isn't bounded.
     with transaction.atomic():
+        _set_statement_timeout(_STREAM_STATEMENT_TIMEOUT)
         annotation = TaskAnnotation(pk, user)
         annotation.init_from_db()
 
-    annotation.dump(filename, dumper, scheme, host)
+    data = annotation.data
+    return _encode_annotations(data['version'], data['tags'], data['shapes'],
+        data['tracks'], chunk_size=_STREAM_CHUNK_SIZE)
+
+def _join_ordered_rows(parents, children, parent_key, field_name):
+    # Attaches children rows to their parents in one pass over both
+    # sequences. Children have to be ordered in the same way as parents.
+    groups = itertools.groupby(children, key=lambda row: row.pop(parent_key))
+    group = next(groups, None)
+    for parent in parents:
+        parent[field_name] = []
+        if group is not None and group[0] == parent['id']:
+            parent[field_name] = list(group[1])
+            group = next(groups, None)
+        yield parent
+
+def _encode_annotations(version, tags, shapes, tracks, chunk_size=2**16):
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+    def encode():
+        yield '{{"version":{}'.format(version)
+        for name, objects in [('tags', tags), ('shapes', shapes), ('tracks', tracks)]:
+            yield ',"{}":['.format(name)
+            separator = ''
+            for obj in objects:
+                yield separator
+                yield encoder.encode(obj)
+                separator = ','
+            yield ']'
+        yield '}'
+
+    chunk = []
+    chunk_len = 0
+    for part in encode():
+        chunk.append(part)
+        chunk_len += len(part)
+        if chunk_len >= chunk_size:
+            yield ''.join(chunk).encode('utf-8')
+            chunk = []
+            chunk_len = 0
+
+    if chunk:
+        yield ''.join(chunk).encode('utf-8')
+
+# Rows of these models are written by COPY FROM STDIN on PostgreSQL if
+# there are many of them (e.g. on annotation upload)
+_COPY_MODELS = (
+    models.LabeledShape,
+    models.LabeledShapeAttributeVal,
+    models.TrackedShape,
+    models.TrackedShapeAttributeVal,
+)
+_COPY_MIN_SIZE = 1000
+_COPY_BATCH_SIZE = 50000
+
+def _escape_copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (bytes, memoryview)):
+        return '\\\\x' + bytes(value).hex()
+
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t') \
+        .replace('\n', '\\n').replace('\r', '\\r')
+
+def copy_create(db_model, objects):
+    # COPY doesn't return ids of created rows. That is why ids are reserved
+    # from the sequence of the table beforehand.
+    fields = db_model._meta.concrete_fields
+    table = db_model._meta.db_table
+    quote_name = connection.ops.quote_name
+    query = "COPY {} ({}) FROM STDIN".format(quote_name(table),
+        ", ".join(quote_name(field.column) for field in fields))
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval(pg_get_serial_sequence(%s, 'id')) "
+            "FROM generate_series(1, %s)", [table, len(objects)])
+        for obj, (obj_id, ) in zip(objects, cursor.fetchall()):
+            obj.id = obj_id
+
+        for start in range(0, len(objects), _COPY_BATCH_SIZE):
+            stream = io.StringIO()
+            for obj in objects[start:start + _COPY_BATCH_SIZE]:
+                stream.write("\t".join(_escape_copy_value(
+                    field.get_prep_value(getattr(obj, field.attname)))
+                    for field in fields))
+                stream.write("\n")
+            stream.seek(0)
+            cursor.copy_expert(query, stream)
+
+    return objects
 
 def bulk_create(db_model, objects, flt_param):
     if objects:
+        if 'postgresql' in settings.DATABASES["default"]["ENGINE"] and \
+            db_model in _COPY_MODELS and len(objects) >= _COPY_MIN_SIZE:
+            return copy_create(db_model, objects)
+
         if flt_param:
             if 'postgresql' in settings.DATABASES["default"]["ENGINE"]:
                 return db_model.objects.bulk_create(objects)
@@ -178,10 +354,12 @@ def _merge_table_rows(rows, keys_for_merge, field_id):
     return list(merged_rows.values())
 
 class JobAnnotation:
-    def __init__(self, pk, user):
+    def __init__(self, pk, user, lock=True):
         self.user = user
-        self.db_job = models.Job.objects.select_related('segment__task') \
-            .select_for_update().get(id=pk)
+        db_jobs = models.Job.objects.select_related('segment__task')
+        if lock:
+            db_jobs = db_jobs.select_for_update()
+        self.db_job = db_jobs.get(id=pk)
 
         db_segment = self.db_job.segment
         self.start_frame = db_segment.start_frame
@@ -380,6 +558,187 @@ class JobAnnotation:
 
         self.ir_data.tags = tags
 
+    def _check_label(self, obj):
+        if obj["label_id"] not in self.db_labels:
+            raise AttributeError("label_id `{}` is invalid".format(obj["label_id"]))
+
+    @staticmethod
+    def _diff_objects(db_objects, objects, fields):
+        # Splits objects on absent and existing in DB ones. Returns DB objects
+        # which were modified in accordance with objects as well.
+        db_objects = {db_obj.id: db_obj for db_obj in db_objects}
+        new_objects = []
+        old_objects = []
+        changed_db_objects = []
+        for obj in objects:
+            db_obj = db_objects.get(obj.get("id"))
+            if db_obj is None:
+                new_objects.append(obj)
+                continue
+
+            old_objects.append(obj)
+
+            is_changed = False
+            for field in fields:
+                if getattr(db_obj, field) != obj[field]:
+                    setattr(db_obj, field, obj[field])
+                    is_changed = True
+            if is_changed:
+                changed_db_objects.append(db_obj)
+
+        return new_objects, old_objects, changed_db_objects
+
+    @staticmethod
+    def _update_attributes_in_db(db_model, parent_field, objects):
+        # objects is a list of (parent id, attributes, valid attribute specs)
+        parent_key = parent_field + "_id"
+        db_attrvals = defaultdict(dict)
+        for db_attrval in db_model.objects.filter(**{
+                parent_key + "__in": [parent_id for parent_id, _, _ in objects]}):
+            db_attrvals[getattr(db_attrval, parent_key)][db_attrval.spec_id] = db_attrval
+
+        created_db_attrvals = []
+        updated_db_attrvals = []
+        deleted_db_attrvals = []
+        for parent_id, attributes, specs in objects:
+            parent_db_attrvals = db_attrvals.pop(parent_id, {})
+            for attr in attributes:
+                if attr["spec_id"] not in specs:
+                    raise AttributeError("spec_id `{}` is invalid".format(attr["spec_id"]))
+                db_attrval = parent_db_attrvals.pop(attr["spec_id"], None)
+                if db_attrval is None:
+                    created_db_attrvals.append(db_model(**{
+                        parent_key: parent_id,
+                        "spec_id": attr["spec_id"],
+                        "value": attr["value"],
+                    }))
+                elif db_attrval.value != attr["value"]:
+                    db_attrval.value = attr["value"]
+                    updated_db_attrvals.append(db_attrval)
+            deleted_db_attrvals.extend(db_attrval.id
+                for db_attrval in parent_db_attrvals.values())
+
+        bulk_create(db_model, created_db_attrvals, {})
+        if updated_db_attrvals:
+            db_model.objects.bulk_update(updated_db_attrvals, ["value"])
+        if deleted_db_attrvals:
+            db_model.objects.filter(id__in=deleted_db_attrvals).delete()
+
+        return bool(created_db_attrvals or updated_db_attrvals or deleted_db_attrvals)
+
+    def _update_tags_in_db(self, tags):
+        for tag in tags:
+            self._check_label(tag)
+
+        fields = ["frame", "label_id", "group"]
+        new_tags, old_tags, changed_db_tags = self._diff_objects(
+            self.db_job.labeledimage_set.filter(id__in=[tag["id"] for tag in tags]),
+            tags, fields)
+        if changed_db_tags:
+            models.LabeledImage.objects.bulk_update(changed_db_tags, fields)
+
+        is_changed = self._update_attributes_in_db(models.LabeledImageAttributeVal,
+            "image", [(tag["id"], tag["attributes"], self.db_attributes[tag["label_id"]]["all"])
+                for tag in old_tags])
+
+        return new_tags, is_changed or bool(changed_db_tags)
+
+    def _update_shapes_in_db(self, shapes):
+        for shape in shapes:
+            self._check_label(shape)
+
+        fields = ["frame", "label_id", "group", "type", "occluded", "z_order", "points"]
+        new_shapes, old_shapes, changed_db_shapes = self._diff_objects(
+            self.db_job.labeledshape_set.filter(id__in=[shape["id"] for shape in shapes]),
+            shapes, fields)
+        if changed_db_shapes:
+            models.LabeledShape.objects.bulk_update(changed_db_shapes, fields)
+
+        is_changed = self._update_attributes_in_db(models.LabeledShapeAttributeVal,
+            "shape", [(shape["id"], shape["attributes"], self.db_attributes[shape["label_id"]]["all"])
+                for shape in old_shapes])
+
+        return new_shapes, is_changed or bool(changed_db_shapes)
+
+    def _update_tracks_in_db(self, tracks):
+        for track in tracks:
+            self._check_label(track)
+
+        fields = ["frame", "label_id", "group"]
+        new_tracks, old_tracks, changed_db_tracks = self._diff_objects(
+            self.db_job.labeledtrack_set.filter(id__in=[track["id"] for track in tracks]),
+            tracks, fields)
+        if changed_db_tracks:
+            models.LabeledTrack.objects.bulk_update(changed_db_tracks, fields)
+
+        is_changed = self._update_attributes_in_db(models.LabeledTrackAttributeVal,
+            "track", [(track["id"], track["attributes"], self.db_attributes[track["label_id"]]["immutable"])
+                for track in old_tracks])
+
+        # Tracked shapes (keyframes) of existing tracks
+        db_shapes = defaultdict(list)
+        for db_shape in models.TrackedShape.objects.filter(
+                track_id__in=[track["id"] for track in old_tracks]):
+            db_shapes[db_shape.track_id].append(db_shape)
+
+        shape_fields = ["type", "occluded", "z_order", "points", "frame", "outside"]
+        new_shapes = []
+        changed_db_shapes = []
+        deleted_db_shapes = []
+        shape_attributes = []
+        for track in old_tracks:
+            track_new_shapes, track_old_shapes, track_changed_db_shapes = self._diff_objects(
+                db_shapes[track["id"]], track["shapes"], shape_fields)
+            new_shapes.extend((track, shape) for shape in track_new_shapes)
+            changed_db_shapes.extend(track_changed_db_shapes)
+
+            shape_ids = set(shape["id"] for shape in track_old_shapes)
+            deleted_db_shapes.extend(db_shape.id for db_shape in db_shapes[track["id"]]
+                if db_shape.id not in shape_ids)
+            shape_attributes.extend((shape["id"], shape["attributes"],
+                self.db_attributes[track["label_id"]]["mutable"])
+                for shape in track_old_shapes)
+
+        if changed_db_shapes:
+            models.TrackedShape.objects.bulk_update(changed_db_shapes, shape_fields)
+        if deleted_db_shapes:
+            models.TrackedShape.objects.filter(id__in=deleted_db_shapes).delete()
+        is_changed |= self._update_attributes_in_db(models.TrackedShapeAttributeVal,
+            "shape", shape_attributes)
+
+        # New keyframes of existing tracks
+        created_db_shapes = []
+        created_db_attrvals = []
+        for track, shape in new_shapes:
+            db_shape = models.TrackedShape(track_id=track["id"], **{
+                field: shape[field] for field in shape_fields})
+            for attr in shape["attributes"]:
+                if attr["spec_id"] not in self.db_attributes[track["label_id"]]["mutable"]:
+                    raise AttributeError("spec_id `{}` is invalid".format(attr["spec_id"]))
+                created_db_attrvals.append(models.TrackedShapeAttributeVal(
+                    shape_id=len(created_db_shapes), **attr))
+            created_db_shapes.append(db_shape)
+
+        created_db_shapes = bulk_create(
+            db_model=models.TrackedShape,
+            objects=created_db_shapes,
+            flt_param={"track__job_id": self.db_job.id}
+        )
+        for db_attrval in created_db_attrvals:
+            db_attrval.shape_id = created_db_shapes[db_attrval.shape_id].id
+        bulk_create(
+            db_model=models.TrackedShapeAttributeVal,
+            objects=created_db_attrvals,
+            flt_param={}
+        )
+        for (_, shape), db_shape in zip(new_shapes, created_db_shapes):
+            shape["id"] = db_shape.id
+
+        is_changed |= bool(changed_db_tracks or changed_db_shapes or
+            deleted_db_shapes or created_db_shapes)
+
+        return new_tracks, is_changed
+
     def _commit(self):
         db_prev_commit = self.db_job.commits.last()
         db_curr_commit = models.JobCommit()
@@ -420,9 +779,30 @@ class JobAnnotation:
         self._create(data)
         self._commit()
 
+    def _update(self, data):
+        # Only changed rows are updated in DB. Ids of objects are kept.
+        # Objects which don't exist in DB are created.
+        new_tags, is_changed = self._update_tags_in_db(data["tags"])
+        new_shapes, shapes_changed = self._update_shapes_in_db(data["shapes"])
+        new_tracks, tracks_changed = self._update_tracks_in_db(data["tracks"])
+        is_changed = is_changed or shapes_changed or tracks_changed
+
+        self.reset()
+        self._save_tags_to_db(new_tags)
+        self._save_shapes_to_db(new_shapes)
+        self._save_tracks_to_db(new_tracks)
+        is_changed = is_changed or bool(new_tags or new_shapes or new_tracks)
+
+        self.ir_data.tags = data["tags"]
+        self.ir_data.shapes = data["shapes"]
+        self.ir_data.tracks = data["tracks"]
+
+        if is_changed:
+            self._set_updated_date()
+            self.db_job.save()
+
     def update(self, data):
-        self._delete(data)
-        self._create(data)
+        self._update(data)
         self._commit()
 
     def _delete(self, data=None):
@@ -462,12 +842,12 @@ class JobAnnotation:
 
     @staticmethod
     def _extend_attributes(attributeval_set, default_attribute_values):
-        shape_attribute_specs_set = set(attr.spec_id for attr in attributeval_set)
+        shape_attribute_specs_set = set(attr['spec_id'] for attr in attributeval_set)
         for db_attr in default_attribute_values:
-            if db_attr.spec_id not in shape_attribute_specs_set:
+            if db_attr['spec_id'] not in shape_attribute_specs_set:
                 attributeval_set.append(dotdict([
-                    ('spec_id', db_attr.spec_id),
-                    ('value', db_attr.value),
+                    ('spec_id', db_attr['spec_id']),
+                    ('value', db_attr['value']),
                 ]))
 
     def _init_tags_from_db(self):
@@ -540,83 +920,234 @@ class JobAnnotation:
         self.ir_data.shapes = serializer.data
 
     def _init_tracks_from_db(self):
-        db_tracks = self.db_job.labeledtrack_set.prefetch_related(
-            "label",
-            "labeledtrackattributeval_set",
-            "trackedshape_set__trackedshapeattributeval_set"
-        ).values(
+        # Tracks, track attributes, tracked shapes and their attributes are
+        # loaded by separate queries and stitched together by ids. A joined
+        # query returns (track attributes x shapes x shape attributes) rows
+        # for every track, that is too much for tracks with many keyframes
+        # and attributes.
+        db_tracks = OrderedDict()
+        for row in self.db_job.labeledtrack_set.values(
             "id",
             "frame",
             "label_id",
             "group",
-            "labeledtrackattributeval__spec_id",
-            "labeledtrackattributeval__value",
-            "labeledtrackattributeval__id",
-            "trackedshape__type",
-            "trackedshape__occluded",
-            "trackedshape__z_order",
-            "trackedshape__points",
-            "trackedshape__id",
-            "trackedshape__frame",
-            "trackedshape__outside",
-            "trackedshape__trackedshapeattributeval__spec_id",
-            "trackedshape__trackedshapeattributeval__value",
-            "trackedshape__trackedshapeattributeval__id",
-        ).order_by('id', 'trackedshape__frame')
-
-        db_tracks = _merge_table_rows(
-            rows=db_tracks,
-            keys_for_merge={
-                "labeledtrackattributeval_set": [
-                    "labeledtrackattributeval__spec_id",
-                    "labeledtrackattributeval__value",
-                    "labeledtrackattributeval__id",
-                ],
-                "trackedshape_set":[
-                    "trackedshape__type",
-                    "trackedshape__occluded",
-                    "trackedshape__z_order",
-                    "trackedshape__points",
-                    "trackedshape__id",
-                    "trackedshape__frame",
-                    "trackedshape__outside",
-                    "trackedshape__trackedshapeattributeval__spec_id",
-                    "trackedshape__trackedshapeattributeval__value",
-                    "trackedshape__trackedshapeattributeval__id",
-                ],
-            },
-            field_id="id",
-        )
-
+        ).order_by("id"):
+            db_track = dotdict(row)
+            db_track["labeledtrackattributeval_set"] = []
+            db_track["trackedshape_set"] = []
+            db_tracks[db_track.id] = db_track
+
+        for row in models.LabeledTrackAttributeVal.objects.filter(
+            track__job_id=self.db_job.id
+        ).values(
+            "id",
+            "spec_id",
+            "value",
+            "track_id",
+        ).order_by("id"):
+            db_track = db_tracks[row.pop("track_id")]
+            db_track["labeledtrackattributeval_set"].append(dotdict(row))
+
+        db_shapes = {}
+        for row in models.TrackedShape.objects.filter(
+            track__job_id=self.db_job.id
+        ).values(
+            "id",
+            "type",
+            "occluded",
+            "z_order",
+            "points",
+            "frame",
+            "outside",
+            "track_id",
+        ).order_by("track_id", "frame"):
+            db_shape = dotdict(row)
+            db_shape["trackedshapeattributeval_set"] = []
+            db_tracks[db_shape.pop("track_id")]["trackedshape_set"].append(db_shape)
+            db_shapes[db_shape.id] = db_shape
+
+        for row in models.TrackedShapeAttributeVal.objects.filter(
+            shape__track__job_id=self.db_job.id
+        ).values(
+            "id",
+            "spec_id",
+            "value",
+            "shape_id",
+        ).order_by("id"):
+            db_shape = db_shapes[row.pop("shape_id")]
+            db_shape["trackedshapeattributeval_set"].append(dotdict(row))
+
+        db_tracks = list(db_tracks.values())
         for db_track in db_tracks:
-            db_track["trackedshape_set"] = _merge_table_rows(db_track["trackedshape_set"], {
-                'trackedshapeattributeval_set': [
-                    'trackedshapeattributeval__value',
-                    'trackedshapeattributeval__spec_id',
-                    'trackedshapeattributeval__id',
-                ]
-            }, 'id')
-
-            # A result table can consist many equal rows for track/shape attributes
-            # We need filter unique attributes manually
-            db_track["labeledtrackattributeval_set"] = list(set(db_track["labeledtrackattributeval_set"]))
             self._extend_attributes(db_track.labeledtrackattributeval_set,
                 self.db_attributes[db_track.label_id]["immutable"].values())
 
             default_attribute_values = self.db_attributes[db_track.label_id]["mutable"].values()
             for db_shape in db_track["trackedshape_set"]:
-                db_shape["trackedshapeattributeval_set"] = list(
-                    set(db_shape["trackedshapeattributeval_set"])
-                )
                 # in case of trackedshapes need to interpolate attriute values and extend it
                 # by previous shape attribute values (not default values)
                 self._extend_attributes(db_shape["trackedshapeattributeval_set"], default_attribute_values)
                 default_attribute_values = db_shape["trackedshapeattributeval_set"]
 
-
         serializer = serializers.LabeledTrackSerializer(db_tracks, many=True)
         self.ir_data.tracks = serializer.data
 
+    def _check_version(self):
+        db_commit = self.db_job.commits.last()
+        version = db_commit.version if db_commit else 0
+        if version != self.ir_data.version:
+            raise Exception("The job has been changed while its annotations were being read")
+
+    def _iter_pages(self, queryset, keys, read_page):
+        # Keyset pagination: a page starts after the last object of the
+        # previous one in the order of the keys. Every page is read by
+        # read_page(objects, page_filter) in a separate short transaction.
+        # page_filter(fields) selects rows of other tables which belong to
+        # the objects by their key fields. The job must not be changed
+        # between pages, otherwise the streamed data would be inconsistent.
+        start = None
+        while True:
+            with transaction.atomic():
+                _set_statement_timeout(_STREAM_STATEMENT_TIMEOUT)
+                self._check_version()
+
+                db_page = queryset.order_by(*keys)
+                if start is not None:
+                    db_page = db_page.filter(_get_keyset_filter(keys, start))
+                db_objects = list(db_page[:_STREAM_PAGE_SIZE])
+                if not db_objects:
+                    return
+                stop = [db_objects[-1][key] for key in keys]
+
+                def page_filter(fields):
+                    q = ~_get_keyset_filter(fields, stop)
+                    if start is not None:
+                        q &= _get_keyset_filter(fields, start)
+                    return q
+
+                db_objects = list(read_page(db_objects, page_filter))
+
+            yield from db_objects
+            if len(db_objects) < _STREAM_PAGE_SIZE:
+                return
+            start = stop
+
+    def _iter_tags_from_db(self):
+        def read_page(db_tags, page_filter):
+            db_attrvals = models.LabeledImageAttributeVal.objects.filter(
+                page_filter(['image__frame', 'image_id']),
+                image__job_id=self.db_job.id,
+            ).values(
+                'spec_id',
+                'value',
+                'image_id',
+            ).order_by('image__frame', 'image_id')
+
+            return _join_ordered_rows(db_tags, db_attrvals, 'image_id', 'attributes')
+
+        db_tags = self.db_job.labeledimage_set.values(
+            'id',
+            'frame',
+            'label_id',
+            'group',
+        )
+        for db_tag in self._iter_pages(db_tags, ['frame', 'id'], read_page):
+            self._extend_attributes(db_tag['attributes'],
+                self.db_attributes[db_tag['label_id']]["all"].values())
+            yield db_tag
+
+    def _iter_shapes_from_db(self):
+        def read_page(db_shapes, page_filter):
+            db_attrvals = models.LabeledShapeAttributeVal.objects.filter(
+                page_filter(['shape__frame', 'shape_id']),
+                shape__job_id=self.db_job.id,
+            ).values(
+                'spec_id',
+                'value',
+                'shape_id',
+            ).order_by('shape__frame', 'shape_id')
+
+            return _join_ordered_rows(db_shapes, db_attrvals, 'shape_id', 'attributes')
+
+        db_shapes = self.db_job.labeledshape_set.values(
+            'id',
+            'label_id',
+            'type',
+            'frame',
+            'group',
+            'occluded',
+            'z_order',
+            'points',
+        )
+        for db_shape in self._iter_pages(db_shapes, ['frame', 'id'], read_page):
+            self._extend_attributes(db_shape['attributes'],
+                self.db_attributes[db_shape['label_id']]["all"].values())
+            yield db_shape
+
+    def _iter_tracks_from_db(self):
+        def read_page(db_tracks, page_filter):
+            db_track_attrvals = models.LabeledTrackAttributeVal.objects.filter(
+                page_filter(['track_id']),
+                track__job_id=self.db_job.id,
+            ).values(
+                "spec_id",
+                "value",
+                "track_id",
+            ).order_by("track_id")
+            db_shapes = models.TrackedShape.objects.filter(
+                page_filter(['track_id']),
+                track__job_id=self.db_job.id,
+            ).values(
+                "id",
+                "type",
+                "occluded",
+                "z_order",
+                "points",
+                "frame",
+                "outside",
+                "track_id",
+            ).order_by("track_id", "frame", "id")
+            db_shape_attrvals = models.TrackedShapeAttributeVal.objects.filter(
+                page_filter(['shape__track_id']),
+                shape__track__job_id=self.db_job.id,
+            ).values(
+                "spec_id",
+                "value",
+                "shape_id",
+            ).order_by("shape__track_id", "shape__frame", "shape_id")
+
+            db_shapes = _join_ordered_rows(db_shapes, db_shape_attrvals,
+                "shape_id", "attributes")
+            db_tracks = _join_ordered_rows(db_tracks, db_track_attrvals,
+                "track_id", "attributes")
+            return _join_ordered_rows(db_tracks, db_shapes, "track_id", "shapes")
+
+        db_tracks = self.db_job.labeledtrack_set.values(
+            "id",
+            "frame",
+            "label_id",
+            "group",
+        )
+        for db_track in self._iter_pages(db_tracks, ['id'], read_page):
+            self._extend_attributes(db_track['attributes'],
+                self.db_attributes[db_track['label_id']]["immutable"].values())
+
+            default_attribute_values = self.db_attributes[db_track['label_id']]["mutable"].values()
+            for db_shape in db_track['shapes']:
+                # in case of trackedshapes need to interpolate attriute values and extend it
+                # by previous shape attribute values (not default values)
+                self._extend_attributes(db_shape['attributes'], default_attribute_values)
+                default_attribute_values = db_shape['attributes']
+            yield db_track
+
+    def iter_from_db(self):
+        # Produces the same data as init_from_db but objects are read by
+        # pages and aren't validated by serializers.
+        self._init_version_from_db()
+        return _encode_annotations(self.ir_data.version, self._iter_tags_from_db(),
+            self._iter_shapes_from_db(), self._iter_tracks_from_db(),
+            chunk_size=_STREAM_CHUNK_SIZE)
+
     def _init_version_from_db(self):
         db_commit = self.db_job.commits.last()
         self.ir_data.version = db_commit.version if db_commit else 0
@@ -653,6 +1184,79 @@ class JobAnnotation:
             execute_python_code("{}(file_object, annotations)".format(loader.handler), global_vars)
         self.create(annotation_importer.data.slice(self.start_frame, self.stop_frame).serialize())
 
+def get_job_versions(task_id):
+    # Latest commit version of every job of the task. Jobs without
+    # commits aren't included (their version is 0).
+    db_commits = models.JobCommit.objects.filter(job__segment__task_id=task_id) \
+        .values('job_id').annotate(version=Max('version')).order_by()
+
+    return {db_commit['job_id']: db_commit['version'] for db_commit in db_commits}
+
+class TaskAnnotationCache:
+    # Snapshots of annotations for every job and merged annotations for the
+    # task are kept on disk. A job snapshot is valid while the latest commit
+    # version of the job is the same. The task snapshot is valid while
+    # versions of all jobs are the same. Attribute specs are a part of the
+    # key too because default attribute values are substituted on loading.
+    # The creation date distinguishes tasks with a reused id. The snapshots
+    # are limited together with the export cache.
+    def __init__(self, db_task):
+        self._dirname = db_task.get_annotation_cache_dirname()
+        self._task = str(db_task.created_date)
+        self._specs = [list(spec) for spec in models.AttributeSpec.objects \
+            .filter(label__task_id=db_task.id).order_by('id') \
+            .values_list('id', 'mutable', 'default_value')]
+        self.logger = slogger.task[db_task.id]
+
+    def _load(self, filename, key):
+        path = os.path.join(self._dirname, filename)
+        try:
+            with open(path) as cache_file:
+                cache = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+        if cache.get('key') != key or cache.get('task') != self._task or \
+                cache.get('specs') != self._specs:
+            return None
+
+        export_cache.cache_limit.touch(path)
+        return cache['data']
+
+    def _save(self, filename, key, data):
+        path = os.path.join(self._dirname, filename)
+        try:
+            os.makedirs(self._dirname, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self._dirname, suffix='.tmp')
+            with os.fdopen(fd, 'w') as cache_file:
+                json.dump({'key': key, 'task': self._task, 'specs': self._specs,
+                    'data': data}, cache_file)
+            # Replace the file atomically. Concurrent readers see either
+            # the previous or the new snapshot.
+            os.replace(tmp_path, path)
+        except OSError as ex:
+            self.logger.warning("Cannot save annotation cache {}: {}".format(
+                filename, str(ex)))
+            return
+
+        export_cache.cache_limit.add(path)
+
+    @staticmethod
+    def _get_task_key(versions):
+        return [[jid, version] for jid, version in sorted(versions.items())]
+
+    def get_job_data(self, jid, version):
+        return self._load('job_{}.json'.format(jid), version)
+
+    def put_job_data(self, jid, data):
+        self._save('job_{}.json'.format(jid), data['version'], data)
+
+    def get_task_data(self, versions):
+        return self._load('task.json', self._get_task_key(versions))
+
+    def put_task_data(self, versions, data):
+        self._save('task.json', self._get_task_key(versions), data)
+
 class TaskAnnotation:
     def __init__(self, pk, user):
         self.user = user
@@ -686,6 +1290,42 @@ class TaskAnnotation:
                 self.ir_data.version = _data.version
             self._merge_data(_data, jobs[jid]["start"], self.db_task.overlap)
 
+    def _import_data(self, data):
+        # Imported objects are routed to jobs by their frames and saved by
+        # per-job batches. Unlike _patch_data the task annotations aren't
+        # sliced and merged again after each batch.
+        db_jobs = sorted(self.db_jobs, key=lambda db_job: db_job.segment.start_frame)
+        start_frames = [db_job.segment.start_frame for db_job in db_jobs]
+        jobs_data = OrderedDict((db_job.id, AnnotationIR()) for db_job in db_jobs)
+
+        def get_job_ids(frame):
+            # Segments are ordered and can overlap. Thus the frame can be
+            # inside several segments which precede the found position.
+            idx = bisect.bisect_right(start_frames, frame) - 1
+            while idx >= 0 and frame <= db_jobs[idx].segment.stop_frame:
+                yield db_jobs[idx].id
+                idx -= 1
+
+        def add_object(job_ids, obj, add):
+            # Saving of an object into DB modifies it (e.g. sets its id).
+            # Objects which belong to several jobs must be copied.
+            for idx, jid in enumerate(job_ids):
+                add(jobs_data[jid], obj if idx == 0 else copy.deepcopy(obj))
+
+        for tag in data["tags"]:
+            add_object(list(get_job_ids(int(tag["frame"]))), tag, AnnotationIR.add_tag)
+        for shape in data["shapes"]:
+            add_object(list(get_job_ids(int(shape["frame"]))), shape, AnnotationIR.add_shape)
+        for track in data["tracks"]:
+            job_ids = set()
+            for shape in track["shapes"]:
+                job_ids.update(get_job_ids(int(shape["frame"])))
+            add_object(sorted(job_ids), track, AnnotationIR.add_track)
+
+        for jid, job_data in jobs_data.items():
+            if job_data.tags or job_data.shapes or job_data.tracks:
+                patch_job_data(jid, self.user, job_data, PatchAction.CREATE)
+
     def _merge_data(self, data, start_frame, overlap):
         data_manager = DataManager(self.ir_data)
         data_manager.merge(data, start_frame, overlap)
@@ -709,15 +1349,36 @@ class TaskAnnotation:
     def init_from_db(self):
         self.reset()
 
+        cache = TaskAnnotationCache(self.db_task)
+        versions = get_job_versions(self.db_task.id)
+        versions = {db_job.id: versions.get(db_job.id, 0) for db_job in self.db_jobs}
+        task_data = cache.get_task_data(versions)
+        if task_data is not None:
+            self.ir_data.data = task_data
+            return
+
+        # Only jobs which have been changed since the last call are loaded
+        # from DB. Others are restored from their snapshots.
         for db_job in self.db_jobs:
-            annotation = JobAnnotation(db_job.id, self.user)
-            annotation.init_from_db()
-            if annotation.ir_data.version > self.ir_data.version:
-                self.ir_data.version = annotation.ir_data.version
+            snapshot = cache.get_job_data(db_job.id, versions[db_job.id])
+            if snapshot is None:
+                annotation = JobAnnotation(db_job.id, self.user)
+                annotation.init_from_db()
+                cache.put_job_data(db_job.id, annotation.data)
+                versions[db_job.id] = annotation.ir_data.version
+                job_data = annotation.ir_data
+            else:
+                job_data = AnnotationIR()
+                job_data.data = snapshot
+
+            if job_data.version > self.ir_data.version:
+                self.ir_data.version = job_data.version
             db_segment = db_job.segment
             start_frame = db_segment.start_frame
             overlap = self.db_task.overlap
-            self._merge_data(annotation.ir_data, start_frame, overlap)
+            self._merge_data(job_data, start_frame, overlap)
+
+        cache.put_task_data(versions, self.data)
 
     def dump(self, filename, dumper, scheme, host):
         anno_exporter = Annotation(
@@ -743,7 +1404,7 @@ class TaskAnnotation:
         annotation_importer = Annotation(
             annotation_ir=AnnotationIR(),
             db_task=self.db_task,
-            create_callback=self.create,
+            create_callback=self._import_data,
             )
         self.delete()
         db_format = loader.annotation_format
@@ -758,7 +1419,7 @@ class TaskAnnotation:
             global_vars["annotations"] = annotation_importer
 
             execute_python_code("{}(file_object, annotations)".format(loader.handler), global_vars)
-        self.create(annotation_importer.data.serialize())
+        self._import_data(annotation_importer.data.serialize())
 
     @property
     def data(self):
@@ -1,7 +1,11 @@
 import copy
+import heapq
+import itertools
 
 import numpy as np
 from scipy.optimize import linear_sum_assignment
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
 from shapely import geometry
 
 from . import models
@@ -25,7 +29,17 @@ class DataManager:
         shapes = self.data.shapes
         tracks = TrackManager(self.data.tracks)
 
-        return shapes + tracks.to_shapes(end_frame)
+        return itertools.chain(shapes, tracks.to_shapes(end_frame))
+
+    def to_shapes_by_frame(self, end_frame):
+        # The same shapes as to_shapes returns but in the order of frames.
+        # Tracks are interpolated lazily, so only current shapes of tracks
+        # are kept in memory.
+        shapes = sorted(self.data.shapes, key=lambda shape: shape["frame"])
+        tracks = TrackManager(self.data.tracks)
+
+        return heapq.merge(shapes, tracks.to_shapes_by_frame(end_frame),
+            key=lambda shape: shape["frame"])
 
     def to_tracks(self):
         tracks = self.data.tracks
@@ -65,6 +79,17 @@ class ObjectManager:
     def _modify_unmached_object(obj, end_frame):
         raise NotImplementedError()
 
+    def _match_objects(self, int_objects, old_objects, start_frame, overlap):
+        cost_matrix = np.empty(shape=(len(int_objects), len(old_objects)),
+            dtype=float)
+        for i, int_obj in enumerate(int_objects):
+            for j, old_obj in enumerate(old_objects):
+                cost_matrix[i][j] = 1 - self._calc_objects_similarity(
+                    int_obj, old_obj, start_frame, overlap)
+
+        row_ind, col_ind = linear_sum_assignment(cost_matrix)
+        return [(i, j, cost_matrix[i][j]) for i, j in zip(row_ind, col_ind)]
+
     def merge(self, objects, start_frame, overlap):
         # 1. Split objects on two parts: new and which can be intersected
         # with existing objects.
@@ -98,22 +123,15 @@ class ObjectManager:
             if frame in old_objects_by_frame:
                 int_objects = int_objects_by_frame[frame]
                 old_objects = old_objects_by_frame[frame]
-                cost_matrix = np.empty(shape=(len(int_objects), len(old_objects)),
-                    dtype=float)
-                # 5.1 Construct cost matrix for the frame.
-                for i, int_obj in enumerate(int_objects):
-                    for j, old_obj in enumerate(old_objects):
-                        cost_matrix[i][j] = 1 - self._calc_objects_similarity(
-                            int_obj, old_obj, start_frame, overlap)
-
-                # 6. Find optimal solution using Hungarian algorithm.
-                row_ind, col_ind = linear_sum_assignment(cost_matrix)
+                # 5. Construct cost matrix for the frame and
+                # 6. find optimal solution using Hungarian algorithm.
                 old_objects_indexes = list(range(0, len(old_objects)))
                 int_objects_indexes = list(range(0, len(int_objects)))
-                for i, j in zip(row_ind, col_ind):
+                for i, j, cost in self._match_objects(int_objects, old_objects,
+                        start_frame, overlap):
                     # Reject the solution if the cost is too high. Remember
                     # inside int_objects_indexes objects which were handled.
-                    if cost_matrix[i][j] <= min_cost_thresh:
+                    if cost <= min_cost_thresh:
                         old_objects[j] = self._unite_objects(int_objects[i], old_objects[j])
                         int_objects_indexes[i] = -1
                         old_objects_indexes[j] = -1
@@ -156,6 +174,95 @@ def pairwise(iterable):
     a = iter(iterable)
     return zip(a, a)
 
+def get_bounding_boxes(objects):
+    boxes = np.empty(shape=(len(objects), 4), dtype=float)
+    for idx, obj in enumerate(objects):
+        points = np.asarray(obj["points"], dtype=float).reshape(-1, 2)
+        boxes[idx, :2] = points.min(axis=0)
+        boxes[idx, 2:] = points.max(axis=0)
+
+    return boxes
+
+def find_intersecting_boxes(boxes0, boxes1, block_size=256):
+    # Returns indexes of all pairs of boxes with non-empty intersection.
+    # Both sets are sorted by xtl (sweep and prune). For a block of boxes0
+    # only a window of boxes1 (xtl in [min_xtl - max_width, max_xbr]) is
+    # compared, so pairs which are far from each other are never checked.
+    rows, cols = [], []
+    if not len(boxes0) or not len(boxes1):
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    order0 = np.argsort(boxes0[:, 0], kind='mergesort')
+    order1 = np.argsort(boxes1[:, 0], kind='mergesort')
+    sorted_xtl1 = boxes1[order1, 0]
+    max_width1 = np.max(boxes1[:, 2] - boxes1[:, 0])
+    for block_start in range(0, len(order0), block_size):
+        block = order0[block_start:block_start + block_size]
+        block_boxes = boxes0[block]
+        lo = np.searchsorted(sorted_xtl1, block_boxes[:, 0].min() - max_width1, side='left')
+        hi = np.searchsorted(sorted_xtl1, block_boxes[:, 2].max(), side='left')
+        if lo >= hi:
+            continue
+
+        candidates = order1[lo:hi]
+        candidate_boxes = boxes1[candidates]
+        mask = (block_boxes[:, None, 0] < candidate_boxes[None, :, 2]) & \
+            (candidate_boxes[None, :, 0] < block_boxes[:, None, 2]) & \
+            (block_boxes[:, None, 1] < candidate_boxes[None, :, 3]) & \
+            (candidate_boxes[None, :, 1] < block_boxes[:, None, 3])
+        block_rows, block_cols = np.nonzero(mask)
+        rows.append(block[block_rows])
+        cols.append(candidates[block_cols])
+
+    if not rows:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    return np.concatenate(rows), np.concatenate(cols)
+
+def calc_boxes_iou(boxes0, boxes1):
+    # Element-wise IoU for two arrays of boxes with the same length
+    inter_w = np.minimum(boxes0[:, 2], boxes1[:, 2]) - np.maximum(boxes0[:, 0], boxes1[:, 0])
+    inter_h = np.minimum(boxes0[:, 3], boxes1[:, 3]) - np.maximum(boxes0[:, 1], boxes1[:, 1])
+    intersection = np.clip(inter_w, 0, None) * np.clip(inter_h, 0, None)
+    area0 = (boxes0[:, 2] - boxes0[:, 0]) * (boxes0[:, 3] - boxes0[:, 1])
+    area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    union = area0 + area1 - intersection
+
+    iou = np.zeros(len(union), dtype=float)
+    np.divide(intersection, union, out=iou, where=union > 0)
+
+    return iou
+
+def solve_sparse_assignment(rows, cols, costs, shape):
+    # Pairs which aren't listed have cost 1 (objects are not similar at all).
+    # The bipartite graph of listed pairs is split on connected components
+    # and the Hungarian algorithm is applied to each of them separately.
+    # It gives the same optimum as for the full cost matrix.
+    if not len(rows):
+        return []
+
+    graph = csr_matrix((np.ones(len(rows)), (rows, cols + shape[0])),
+        shape=(shape[0] + shape[1], shape[0] + shape[1]))
+    _, labels = connected_components(graph, directed=False)
+
+    matches = []
+    pair_labels = labels[rows]
+    order = np.argsort(pair_labels, kind='mergesort')
+    bounds = np.flatnonzero(np.diff(pair_labels[order])) + 1
+    for component in np.split(order, bounds):
+        component_rows = np.unique(rows[component])
+        component_cols = np.unique(cols[component])
+        cost_matrix = np.ones(shape=(len(component_rows), len(component_cols)),
+            dtype=float)
+        cost_matrix[np.searchsorted(component_rows, rows[component]),
+            np.searchsorted(component_cols, cols[component])] = costs[component]
+
+        row_ind, col_ind = linear_sum_assignment(cost_matrix)
+        for i, j in zip(row_ind, col_ind):
+            matches.append((component_rows[i], component_cols[j], cost_matrix[i][j]))
+
+    return matches
+
 class ShapeManager(ObjectManager):
     def to_tracks(self):
         tracks = []
@@ -181,6 +288,32 @@ class ShapeManager(ObjectManager):
 
         return tracks
 
+    def _match_objects(self, int_objects, old_objects, start_frame, overlap):
+        # Only shapes with intersecting bounding boxes can be similar. Find
+        # them using the spatial index and compute IoU of rectangles at once.
+        int_boxes = get_bounding_boxes(int_objects)
+        old_boxes = get_bounding_boxes(old_objects)
+        rows, cols = find_intersecting_boxes(int_boxes, old_boxes)
+
+        similarity = np.zeros(len(rows), dtype=float)
+        is_comparable = np.array([
+            int_objects[i]["type"] == old_objects[j]["type"] and
+            int_objects[i].get("label_id") == old_objects[j].get("label_id")
+            for i, j in zip(rows, cols)], dtype=bool)
+        is_rectangle = is_comparable & np.array([
+            int_objects[i]["type"] == models.ShapeType.RECTANGLE
+            for i in rows], dtype=bool)
+
+        similarity[is_rectangle] = calc_boxes_iou(int_boxes[rows[is_rectangle]],
+            old_boxes[cols[is_rectangle]])
+        for k in np.flatnonzero(is_comparable & ~is_rectangle):
+            similarity[k] = self._calc_objects_similarity(int_objects[rows[k]],
+                old_objects[cols[k]], start_frame, overlap)
+
+        is_similar = similarity > 0
+        return solve_sparse_assignment(rows[is_similar], cols[is_similar],
+            1 - similarity[is_similar], (len(int_objects), len(old_objects)))
+
     @staticmethod
     def _get_cost_threshold():
         return 0.25
@@ -201,7 +334,7 @@ class ShapeManager(ObjectManager):
                 return _calc_polygons_similarity(p0, p1)
             elif obj0["type"] == models.ShapeType.POLYGON:
                 p0 = geometry.Polygon(pairwise(obj0["points"]))
-                p1 = geometry.Polygon(pairwise(obj0["points"]))
+                p1 = geometry.Polygon(pairwise(obj1["points"]))
 
                 return _calc_polygons_similarity(p0, p1)
             else:
@@ -218,17 +351,30 @@ class ShapeManager(ObjectManager):
         pass
 
 class TrackManager(ObjectManager):
+    # Max number of frames interpolated by one call of interpolate_points.
+    # It limits memory for long distances between keyframes.
+    _INTERPOLATION_BATCH = 1024
+
     def to_shapes(self, end_frame):
-        shapes = []
         for idx, track in enumerate(self.objects):
-            for shape in TrackManager.get_interpolated_shapes(track, 0, end_frame):
-                if not shape["outside"]:
-                    shape["label_id"] = track["label_id"]
-                    shape["group"] = track["group"]
-                    shape["track_id"] = idx
-                    shape["attributes"] += track["attributes"]
-                    shapes.append(shape)
-        return shapes
+            yield from TrackManager._iter_track_shapes(idx, track, end_frame)
+
+    def to_shapes_by_frame(self, end_frame):
+        # Shapes of each track go in the order of frames, so they can be
+        # merged without sorting
+        return heapq.merge(*(TrackManager._iter_track_shapes(idx, track, end_frame)
+            for idx, track in enumerate(self.objects)),
+            key=lambda shape: shape["frame"])
+
+    @staticmethod
+    def _iter_track_shapes(idx, track, end_frame):
+        for shape in TrackManager.iter_interpolated_shapes(track, 0, end_frame):
+            if not shape["outside"]:
+                shape["label_id"] = track["label_id"]
+                shape["group"] = track["group"]
+                shape["track_id"] = idx
+                shape["attributes"] += track["attributes"]
+                yield shape
 
     @staticmethod
     def _get_objects_by_frame(objects, start_frame):
@@ -255,11 +401,12 @@ class TrackManager(ObjectManager):
             # and stop_frame is the stop frame of current segment
             # end_frame == stop_frame + 1
             end_frame = start_frame + overlap
-            obj0_shapes = TrackManager.get_interpolated_shapes(obj0, start_frame, end_frame)
-            obj1_shapes = TrackManager.get_interpolated_shapes(obj1, start_frame, end_frame)
+            obj0_shapes = TrackManager.iter_interpolated_shapes(obj0,
+                start_frame, end_frame, bounded=True)
+            obj1_shapes = TrackManager.iter_interpolated_shapes(obj1,
+                start_frame, end_frame, bounded=True)
             obj0_shapes_by_frame = {shape["frame"]:shape for shape in obj0_shapes}
             obj1_shapes_by_frame = {shape["frame"]:shape for shape in obj1_shapes}
-            assert obj0_shapes_by_frame and obj1_shapes_by_frame
 
             count, error = 0, 0
             for frame in range(start_frame, end_frame):
@@ -275,7 +422,9 @@ class TrackManager(ObjectManager):
                     error += 1
                     count += 1
 
-            return 1 - error / count
+            # Shapes of both tracks can be outside of the overlap window
+            # (e.g. a finished polygon track)
+            return 1 - error / count if count else 0
         else:
             return 0
 
@@ -303,10 +452,39 @@ class TrackManager(ObjectManager):
 
         return shape
 
+    @staticmethod
+    def interpolate_points(points0, points1, offsets):
+        # Computes points of all intermediate shapes at once. The result is
+        # (len(offsets), len(points0)) array where offsets are relative
+        # positions (0..1) between two keyframes.
+        points0 = np.asarray(points0, dtype=float)
+        points1 = np.asarray(points1, dtype=float)
+        return points0 + np.outer(offsets, points1 - points0)
+
     @staticmethod
     def get_interpolated_shapes(track, start_frame, end_frame):
+        return list(TrackManager.iter_interpolated_shapes(track, start_frame, end_frame))
+
+    @staticmethod
+    def iter_interpolated_shapes(track, start_frame, end_frame, bounded=False):
+        # Shapes are generated frame by frame and nothing is cached inside
+        # the track. If bounded is True, only shapes inside the window
+        # [start_frame, end_frame) are produced and keyframe pairs outside
+        # the window aren't interpolated at all.
+        if bounded:
+            is_frame_inside = lambda frame: start_frame <= frame < end_frame
+        else:
+            is_frame_inside = lambda frame: True
+
         def interpolate(shape0, shape1):
-            shapes = []
+            first_frame = shape0["frame"] + 1
+            last_frame = shape1["frame"]
+            if bounded:
+                first_frame = max(first_frame, start_frame)
+                last_frame = min(last_frame, end_frame)
+            if first_frame >= last_frame:
+                return
+
             is_same_type = shape0["type"] == shape1["type"]
             is_polygon = shape0["type"] == models.ShapeType.POLYGON
             is_polyline = shape0["type"] == models.ShapeType.POLYLINE
@@ -314,32 +492,37 @@ class TrackManager(ObjectManager):
             if not is_same_type or is_polygon or is_polyline or not is_same_size:
                 shape0 = TrackManager.normalize_shape(shape0)
                 shape1 = TrackManager.normalize_shape(shape1)
+                need_simplify = True
+            else:
+                # Interpolated rectangles and points have exactly the same
+                # number of points as keyframes. Nothing to simplify here.
+                need_simplify = False
 
             distance = shape1["frame"] - shape0["frame"]
-            step = np.subtract(shape1["points"], shape0["points"]) / distance
-            for frame in range(shape0["frame"] + 1, shape1["frame"]):
-                off = frame - shape0["frame"]
+            for batch_start in range(first_frame, last_frame, TrackManager._INTERPOLATION_BATCH):
+                frames = np.arange(batch_start,
+                    min(batch_start + TrackManager._INTERPOLATION_BATCH, last_frame))
                 if shape1["outside"]:
-                    points = np.asarray(shape0["points"]).reshape(-1, 2)
-                else:
-                    points = (shape0["points"] + step * off).reshape(-1, 2)
-                shape = copy.deepcopy(shape0)
-                if len(points) == 1:
-                    shape["points"] = points.flatten()
+                    batch = np.tile(np.asarray(shape0["points"], dtype=float),
+                        (len(frames), 1))
                 else:
-                    broken_line = geometry.LineString(points).simplify(0.05, False)
-                    shape["points"] = [x for p in broken_line.coords for x in p]
-
-                shape["keyframe"] = False
-                shape["frame"] = frame
-                shapes.append(shape)
-            return shapes
+                    batch = TrackManager.interpolate_points(shape0["points"],
+                        shape1["points"], (frames - shape0["frame"]) / distance)
+
+                for frame, points in zip(frames.tolist(), batch):
+                    shape = copy.copy(shape0)
+                    shape["attributes"] = copy.deepcopy(shape0["attributes"])
+                    if need_simplify:
+                        broken_line = geometry.LineString(points.reshape(-1, 2)) \
+                            .simplify(0.05, False)
+                        shape["points"] = [x for p in broken_line.coords for x in p]
+                    else:
+                        shape["points"] = points.tolist()
 
-        if track.get("interpolated_shapes"):
-            return track["interpolated_shapes"]
+                    shape["keyframe"] = False
+                    shape["frame"] = frame
+                    yield shape
 
-        # TODO: should be return an iterator?
-        shapes = []
         curr_frame = track["shapes"][0]["frame"]
         prev_shape = {}
         for shape in track["shapes"]:
@@ -349,10 +532,15 @@ class TrackManager(ObjectManager):
                     if attr["spec_id"] not in map(lambda el: el["spec_id"], shape["attributes"]):
                         shape["attributes"].append(copy.deepcopy(attr))
                 if not prev_shape["outside"]:
-                    shapes.extend(interpolate(prev_shape, shape))
+                    yield from interpolate(prev_shape, shape)
 
             shape["keyframe"] = True
-            shapes.append(shape)
+            if is_frame_inside(shape["frame"]):
+                # Callers are free to modify yielded shapes (e.g. extend
+                # attributes), so keyframes of the track are kept intact.
+                keyframe = copy.copy(shape)
+                keyframe["attributes"] = list(shape["attributes"])
+                yield keyframe
             curr_frame = shape["frame"]
             prev_shape = shape
 
@@ -360,11 +548,7 @@ class TrackManager(ObjectManager):
         if not prev_shape["outside"] and prev_shape["type"] == models.ShapeType.RECTANGLE:
             shape = copy.copy(prev_shape)
             shape["frame"] = end_frame
-            shapes.extend(interpolate(prev_shape, shape))
-
-        track["interpolated_shapes"] = shapes
-
-        return shapes
+            yield from interpolate(prev_shape, shape)
 
     @staticmethod
     def _unite_objects(obj0, obj1):
@@ -380,6 +564,5 @@ class TrackManager(ObjectManager):
 
         track["frame"] = min(obj0["frame"], obj1["frame"])
         track["shapes"] = list(sorted(shapes.values(), key=lambda shape: shape["frame"]))
-        track["interpolated_shapes"] = []
 
         return track
@@ -0,0 +1,85 @@
+# Copyright (C) 2019 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import os
+import glob
+import stat
+import threading
+
+from django.conf import settings
+
+class DiskCacheLimit:
+    # Limits the total size of cache files which match glob patterns inside
+    # DATA_ROOT. The total is counted by a scan of the files once per process
+    # and then is increased by every added file. The files are scanned again
+    # only when the limit is exceeded: the least recently modified files are
+    # removed until the total is under the limit. Other processes add files
+    # too, thus the total is approximate between scans.
+    def __init__(self, patterns, get_max_size):
+        self._patterns = patterns
+        self._get_max_size = get_max_size
+        self._lock = threading.Lock()
+        self._data_root = None
+        self._size = 0
+
+    def _scan(self):
+        files = []
+        for pattern in self._patterns:
+            for path in glob.glob(os.path.join(settings.DATA_ROOT, pattern)):
+                # Temporary files belong to caches which are being written
+                if path.endswith('.tmp'):
+                    continue
+                try:
+                    path_stat = os.stat(path)
+                except OSError:
+                    continue
+                if stat.S_ISREG(path_stat.st_mode):
+                    files.append((path_stat.st_mtime, path_stat.st_size, path))
+
+        return files
+
+    def _evict(self, keep):
+        files = self._scan()
+        self._size = sum(size for _, size, _ in files)
+        max_size = self._get_max_size()
+        for _, size, path in sorted(files):
+            if self._size <= max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            self._size -= size
+
+    def add(self, path):
+        # The path is a new file of the cache, it is never evicted here
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+
+        with self._lock:
+            if self._data_root != settings.DATA_ROOT:
+                # The first file in the process (or DATA_ROOT is changed)
+                self._data_root = settings.DATA_ROOT
+                self._size = sum(size for _, size, _ in self._scan())
+            else:
+                self._size += size
+
+            if self._size > self._get_max_size():
+                self._evict(keep=path)
+
+    @staticmethod
+    def touch(path):
+        # Modification time is used as the last access time for eviction.
+        # Returns False if the file doesn't exist (e.g. it is evicted).
+        try:
+            os.utime(path)
+            return True
+        except OSError:
+            return False
@@ -0,0 +1,109 @@
+# Copyright (C) 2019 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import os
+import fcntl
+import json
+import hashlib
+import tempfile
+
+from django.conf import settings
+
+from cvat.apps.engine import models
+from cvat.apps.engine.disk_cache import DiskCacheLimit
+from cvat.apps.engine.log import slogger
+
+# Exported files (annotation dumps, datasets) are kept in the task directory
+# under a key which describes their content: the task, the format, commit
+# versions of all jobs, labels and the code of the format handler. Thus a
+# file is reused until annotations or the handler are changed. The size of
+# the cache is limited for all tasks together (with snapshots of annotations,
+# see TaskAnnotationCache), the least recently used files are removed first.
+cache_limit = DiskCacheLimit(['*/export_cache/*', '*/annotation_cache/*'],
+    lambda: settings.EXPORT_CACHE_SIZE)
+
+# Hashes of handlers are kept for the process while their files are the same
+# (e.g. a key is computed on each poll of a dump request)
+_handler_hashes = {}
+
+def get_handler_hash(*paths):
+    stats = [os.stat(path) for path in paths]
+    stats = [(stat.st_mtime_ns, stat.st_size) for stat in stats]
+    cached = _handler_hashes.get(paths)
+    if cached is not None and cached[0] == stats:
+        return cached[1]
+
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as handler_file:
+            digest.update(handler_file.read())
+    _handler_hashes[paths] = (stats, digest.hexdigest())
+
+    return digest.hexdigest()
+
+def get_cache_key(db_task, job_versions, export_format, handler_hash, params=None):
+    # job_versions are latest commit versions of jobs (see get_job_versions).
+    # A commit to any job changes the key, not only to the job with the max
+    # version. Labels and attributes are written into exported files too.
+    db_labels = models.Label.objects.filter(task_id=db_task.id) \
+        .order_by('id').values_list('id', 'name')
+    db_specs = models.AttributeSpec.objects.filter(label__task_id=db_task.id) \
+        .order_by('id').values_list('id', 'label_id', 'name', 'mutable',
+            'input_type', 'default_value', 'values')
+    key = json.dumps([
+        db_task.id,
+        # Ids can be reused (e.g. by tests), the directory of a task can't
+        str(db_task.created_date),
+        db_task.name,
+        export_format,
+        sorted(job_versions.items()),
+        handler_hash,
+        list(db_labels),
+        list(db_specs),
+        params or [],
+    ])
+
+    return hashlib.sha1(key.encode()).hexdigest()
+
+# Concurrent exports with the same key wait for the first one and reuse its
+# file. Keys are spread over a fixed number of lock files in the directory.
+_LOCK_STRIPES = 16
+
+def _get_path(db_task, key, ext):
+    return os.path.join(db_task.get_export_cache_dirname(), "{}.{}".format(key, ext))
+
+def get(db_task, key, ext):
+    path = _get_path(db_task, key, ext)
+    return path if cache_limit.touch(path) else None
+
+def get_or_create(db_task, key, ext, create):
+    # create(path) writes an exported file into the path
+    path = get(db_task, key, ext)
+    if path is not None:
+        return path
+
+    dirname = db_task.get_export_cache_dirname()
+    os.makedirs(dirname, exist_ok=True)
+    lock_path = os.path.join(dirname, '.lock{}'.format(int(key[:8], 16) % _LOCK_STRIPES))
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        path = get(db_task, key, ext)
+        if path is not None:
+            return path
+
+        path = _get_path(db_task, key, ext)
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        os.close(fd)
+        try:
+            create(tmp_path)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    slogger.task[db_task.id].info("Export cache file '{}' is created".format(path))
+    cache_limit.add(path)
+
+    return path
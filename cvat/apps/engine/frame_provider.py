@@ -0,0 +1,170 @@
+# Copyright (C) 2019 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import os
+import io
+import zipfile
+import tempfile
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from django.conf import settings
+
+from cvat.apps.engine.disk_cache import DiskCacheLimit
+from cvat.apps.engine.media_extractors import ImageListExtractor, VideoExtractor
+from cvat.apps.engine.log import slogger
+
+# Chunks are zip archives (without compression) of JPEG frames. They are
+# decoded from the original media (or packed from extracted frames) on the
+# first request and kept in LRU caches: in memory of the process and on
+# disk (in the task directory).
+_memory_cache = OrderedDict()
+_memory_cache_size = 0
+_memory_cache_lock = threading.Lock()
+# The disk limit is common for all tasks
+_disk_cache_limit = DiskCacheLimit(['*/chunks/*.zip'],
+    lambda: settings.FRAME_CACHE_DISK_SIZE)
+
+def _get_from_memory(key):
+    with _memory_cache_lock:
+        chunk = _memory_cache.get(key)
+        if chunk is not None:
+            _memory_cache.move_to_end(key)
+        return chunk
+
+def _put_to_memory(key, chunk):
+    global _memory_cache_size
+    with _memory_cache_lock:
+        if key in _memory_cache:
+            return
+        _memory_cache[key] = chunk
+        _memory_cache_size += len(chunk)
+        while _memory_cache_size > settings.FRAME_CACHE_MEMORY_SIZE:
+            _, evicted_chunk = _memory_cache.popitem(last=False)
+            _memory_cache_size -= len(evicted_chunk)
+
+def _get_chunk_path(db_task, chunk_number):
+    return os.path.join(db_task.get_chunks_dirname(), "{}.zip".format(chunk_number))
+
+def _get_from_disk(db_task, chunk_number):
+    path = _get_chunk_path(db_task, chunk_number)
+    try:
+        with open(path, 'rb') as chunk_file:
+            chunk = chunk_file.read()
+        _disk_cache_limit.touch(path)
+        return chunk
+    except OSError:
+        return None
+
+def _put_to_disk(db_task, chunk_number, chunk):
+    dirname = db_task.get_chunks_dirname()
+    path = _get_chunk_path(db_task, chunk_number)
+    try:
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as chunk_file:
+            chunk_file.write(chunk)
+        os.replace(tmp_path, path)
+    except OSError as ex:
+        slogger.task[db_task.id].warning("Cannot save chunk #{}: {}".format(
+            chunk_number, str(ex)))
+        return
+
+    _disk_cache_limit.add(path)
+
+def get_chunk_size(db_task):
+    return db_task.data_chunk_size or settings.FRAME_DEFAULT_CHUNK_SIZE
+
+def _load_keyframes(db_task):
+    try:
+        return np.load(db_task.get_video_keyframes_path())
+    except OSError:
+        # The video will be decoded from the beginning
+        return None
+
+def _make_chunk(db_task, chunk_number):
+    chunk_size = get_chunk_size(db_task)
+    start = chunk_number * chunk_size
+    stop = min(start + chunk_size, db_task.size)
+    if start >= stop:
+        raise Exception("Chunk #{} is out of range".format(chunk_number))
+
+    frames = range(start, stop)
+    buffers = [io.BytesIO() for _ in frames]
+    if not db_task.data_chunk_size:
+        for frame, buffer in zip(frames, buffers):
+            with open(db_task.get_frame_path(frame), 'rb') as frame_file:
+                buffer.write(frame_file.read())
+    elif db_task.mode == 'interpolation':
+        db_video = db_task.video
+        step = db_task.get_frame_step()
+        extractor = VideoExtractor(
+            source_path=[db_video.path],
+            dest_path=None,
+            image_quality=db_task.image_quality,
+            step=step,
+            start=db_task.start_frame + start * step,
+            stop=db_task.start_frame + (stop - 1) * step,
+            frame_size=(db_video.width, db_video.height),
+            keyframes=_load_keyframes(db_task),
+        )
+        for _ in extractor.save_images(buffers):
+            pass
+    else:
+        db_images = db_task.image_set.filter(frame__gte=start, frame__lt=stop) \
+            .order_by('frame')
+        for db_image, buffer in zip(db_images, buffers):
+            ImageListExtractor.compress_image(db_image.path, buffer,
+                db_task.image_quality)
+
+    chunk = io.BytesIO()
+    with zipfile.ZipFile(chunk, 'w', zipfile.ZIP_STORED) as chunk_archive:
+        for frame, buffer in zip(frames, buffers):
+            if buffer.tell():
+                chunk_archive.writestr("{}.jpg".format(frame), buffer.getvalue())
+
+    return chunk.getvalue()
+
+def get_chunk(db_task, chunk_number):
+    # Ids of removed tasks can be reused, the creation date can't
+    key = (db_task.id, db_task.created_date, chunk_number)
+    chunk = _get_from_memory(key)
+    if chunk is None:
+        chunk = _get_from_disk(db_task, chunk_number)
+        if chunk is None:
+            chunk = _make_chunk(db_task, chunk_number)
+            _put_to_disk(db_task, chunk_number, chunk)
+        _put_to_memory(key, chunk)
+
+    return chunk
+
+def get_frame(db_task, frame):
+    if not db_task.data_chunk_size:
+        # Frames are extracted, a chunk isn't required to read one of them
+        with open(db_task.get_frame_path(frame), 'rb') as frame_file:
+            return frame_file.read()
+
+    chunk = get_chunk(db_task, frame // get_chunk_size(db_task))
+    with zipfile.ZipFile(io.BytesIO(chunk)) as chunk_archive:
+        return chunk_archive.read("{}.jpg".format(frame))
+
+class FrameFiles:
+    # Frames of a task as file objects which are read on access. Features
+    # which process all frames (e.g. automatic annotation) work for tasks
+    # with and without extracted frames.
+    def __init__(self, db_task):
+        self._db_task = db_task
+
+    def __len__(self):
+        return self._db_task.size
+
+    def __getitem__(self, frame):
+        if not 0 <= frame < len(self):
+            raise IndexError("Frame #{} is out of range".format(frame))
+        return io.BytesIO(get_frame(self._db_task, frame))
+
+    def __iter__(self):
+        for frame in range(len(self)):
+            yield self[frame]
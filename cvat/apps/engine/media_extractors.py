@@ -1,9 +1,17 @@
 import os
+import json
+import struct
+import tarfile
+import zipfile
 import tempfile
 import shutil
+import threading
+import itertools
+import subprocess
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 import numpy as np
 
-from ffmpy import FFmpeg
 from pyunpack import Archive
 from PIL import Image
 
@@ -21,6 +29,83 @@ def get_mime(name):
 
     return 'unknown'
 
+def _get_jpeg_size(image_file):
+    image_file.seek(2)
+    while True:
+        byte = image_file.read(1)
+        while byte and byte != b'\xff':
+            byte = image_file.read(1)
+        while byte == b'\xff':
+            byte = image_file.read(1)
+        if not byte:
+            return None
+
+        marker = byte[0]
+        # Markers without a segment
+        if marker == 0x01 or 0xD0 <= marker <= 0xD9:
+            continue
+
+        segment_length = struct.unpack('>H', image_file.read(2))[0]
+        # SOFn markers, except DHT, JPG and DAC
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack('>xHH', image_file.read(5))
+            return width, height
+        image_file.seek(segment_length - 2, os.SEEK_CUR)
+
+def _get_png_size(image_file):
+    header = image_file.read(24)
+    if header[12:16] != b'IHDR':
+        return None
+
+    return struct.unpack('>II', header[16:24])
+
+def _get_tiff_size(image_file):
+    byte_order = '<' if image_file.read(2) == b'II' else '>'
+    magic, ifd_offset = struct.unpack(byte_order + 'HI', image_file.read(6))
+    if magic != 42: # BigTIFF isn't supported here
+        return None
+
+    image_file.seek(ifd_offset)
+    entry_count = struct.unpack(byte_order + 'H', image_file.read(2))[0]
+    size = {}
+    for _ in range(entry_count):
+        tag, value_type, _, value = struct.unpack(byte_order + 'HHI4s',
+            image_file.read(12))
+        # ImageWidth and ImageLength are SHORT or LONG values
+        if tag in (256, 257):
+            if value_type == 3:
+                size[tag] = struct.unpack(byte_order + 'H', value[:2])[0]
+            else:
+                size[tag] = struct.unpack(byte_order + 'I', value)[0]
+        if len(size) == 2:
+            return size[256], size[257]
+
+    return None
+
+def get_image_size(path):
+    """Get (width, height) of an image reading only its header"""
+    size = None
+    with open(path, 'rb') as image_file:
+        signature = image_file.read(8)
+        image_file.seek(0)
+        try:
+            if signature[:2] == b'\xff\xd8':
+                size = _get_jpeg_size(image_file)
+            elif signature == b'\x89PNG\r\n\x1a\n':
+                size = _get_png_size(image_file)
+            elif signature[:4] in (b'II*\x00', b'MM\x00*'):
+                size = _get_tiff_size(image_file)
+        except struct.error:
+            size = None
+
+    if size is None:
+        # Other formats and unusual files are left to PIL. It reads only
+        # the header of the image as well but it is slower.
+        with Image.open(path) as image:
+            size = image.size
+
+    return tuple(size)
+
 class MediaExtractor:
     def __init__(self, source_path, dest_path, image_quality, step, start, stop):
         self._source_path = source_path
@@ -33,6 +118,11 @@ class MediaExtractor:
     def get_source_name(self):
         return self._source_path
 
+    def save_images(self, dest_paths, workers=1):
+        # Returns sizes of saved images in the order of frames
+        for frame, dest_path in enumerate(dest_paths):
+            yield self.save_image(frame, dest_path)
+
 #Note step, start, stop have no affect
 class ImageListExtractor(MediaExtractor):
     def __init__(self, source_path, dest_path, image_quality, step=1, start=0, stop=0):
@@ -57,7 +147,22 @@ class ImageListExtractor(MediaExtractor):
         return len(self._source_path)
 
     def save_image(self, k, dest_path):
-        image = Image.open(self[k])
+        return self.compress_image(self[k], dest_path, self._image_quality)
+
+    def save_images(self, dest_paths, workers=1):
+        # Images are compressed by a pool of processes
+        workers = min(workers, len(dest_paths))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                yield from executor.map(self.compress_image,
+                    self._source_path[:len(dest_paths)], dest_paths,
+                    itertools.repeat(self._image_quality), chunksize=4)
+        else:
+            yield from super().save_images(dest_paths)
+
+    @staticmethod
+    def compress_image(image_path, dest_path, image_quality):
+        image = Image.open(image_path)
         # Ensure image data fits into 8bit per pixel before RGB conversion as PIL clips values on conversion
         if image.mode == "I":
             # Image mode is 32bit integer pixels.
@@ -66,7 +171,7 @@ class ImageListExtractor(MediaExtractor):
             im_data = im_data * (2**8 / im_data.max())
             image = Image.fromarray(im_data.astype(np.int32))
         image = image.convert('RGB')
-        image.save(dest_path, quality=self._image_quality, optimize=True)
+        image.save(dest_path, format='JPEG', quality=image_quality, optimize=True)
         height = image.height
         width = image.width
         image.close()
@@ -142,10 +247,45 @@ class DirectoryExtractor(ImageListExtractor):
 
 #Note step, start, stop have no affect
 class ArchiveExtractor(DirectoryExtractor):
+    # Zip and tar archives are read member by member: images are extracted
+    # in a background thread while already extracted ones are compressed,
+    # and each image is removed as soon as it is compressed. Other formats
+    # are unpacked entirely by pyunpack.
     def __init__(self, source_path, dest_path, image_quality, step=1, start=0, stop=0):
-        Archive(source_path[0]).extractall(dest_path)
-        super().__init__(
-            source_path=[dest_path],
+        self._archive_path = source_path[0]
+        if zipfile.is_zipfile(self._archive_path):
+            self._archive_type = 'zip'
+            with zipfile.ZipFile(self._archive_path) as archive:
+                # ZipInfo.is_dir() isn't available in Python 3.5
+                names = [info.filename for info in archive.infolist()
+                    if not info.filename.endswith('/')]
+        elif tarfile.is_tarfile(self._archive_path):
+            self._archive_type = 'tar'
+            with tarfile.open(self._archive_path) as archive:
+                names = [member.name for member in archive.getmembers()
+                    if member.isfile()]
+        else:
+            self._archive_type = None
+            Archive(self._archive_path).extractall(dest_path)
+            super().__init__(
+                source_path=[dest_path],
+                dest_path=dest_path,
+                image_quality=image_quality,
+                step=1,
+                start=0,
+                stop=0,
+            )
+            return
+
+        # Paths of images (where they are extracted to) -> names of members
+        self._members = {}
+        for name in names:
+            path = self._get_member_path(dest_path, name)
+            if path is not None and get_mime(path) == 'image':
+                self._members[path] = name
+
+        ImageListExtractor.__init__(self,
+            source_path=list(self._members),
             dest_path=dest_path,
             image_quality=image_quality,
             step=1,
@@ -153,62 +293,283 @@ class ArchiveExtractor(DirectoryExtractor):
             stop=0,
         )
 
+    @staticmethod
+    def _get_member_path(dest_path, name):
+        # Members outside of the destination directory are skipped
+        dest_path = os.path.abspath(dest_path)
+        path = os.path.abspath(os.path.join(dest_path, name))
+        if os.path.commonpath([dest_path, path]) != dest_path or path == dest_path:
+            return None
+        return path
+
+    def is_streamed(self):
+        return self._archive_type is not None
+
+    def _extract_members(self, events, state):
+        # Members are extracted in the order of the archive. An event is set
+        # when the corresponding image is on the disk.
+        names = { name: path for path, name in self._members.items()
+            if path in events }
+
+        def extract(name, source_file):
+            path = names.pop(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as dest_file:
+                shutil.copyfileobj(source_file, dest_file)
+            events[path].set()
+
+        try:
+            if self._archive_type == 'zip':
+                with zipfile.ZipFile(self._archive_path) as archive:
+                    for info in archive.infolist():
+                        if state['stop'] or not names:
+                            break
+                        if info.filename in names:
+                            with archive.open(info) as source_file:
+                                extract(info.filename, source_file)
+            else:
+                # The stream mode allows to read compressed tar archives
+                # without seeking
+                with tarfile.open(self._archive_path, 'r|*') as archive:
+                    for member in archive:
+                        if state['stop'] or not names:
+                            break
+                        if member.isfile() and member.name in names:
+                            source_file = archive.extractfile(member)
+                            extract(member.name, source_file)
+        except Exception as ex:
+            state['error'] = ex
+        finally:
+            for event in events.values():
+                event.set()
+
+    def extract(self):
+        # Extracts all images and keeps them on the disk
+        if not self.is_streamed():
+            return
+
+        state = { 'stop': False, 'error': None }
+        self._extract_members({ path: threading.Event() for path in self }, state)
+        if state['error'] is not None:
+            raise state['error']
+        self._archive_type = None
+
+    @staticmethod
+    def _finish_image(path, future):
+        size = future.result()
+        os.remove(path)
+        return size
+
+    def save_images(self, dest_paths, workers=1):
+        if not self.is_streamed():
+            yield from super().save_images(dest_paths, workers)
+            return
+
+        workers = max(workers, 1)
+        paths = self._source_path[:len(dest_paths)]
+        events = { path: threading.Event() for path in paths }
+        state = { 'stop': False, 'error': None }
+        extract_thread = threading.Thread(target=self._extract_members,
+            args=(events, state), daemon=True)
+
+        pending = deque()
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # Workers are forked on the first submit. They must be forked
+                # before the extraction thread is started, otherwise they can
+                # inherit locks (zipfile, tarfile, logging) held by the thread.
+                executor.submit(os.getpid).result()
+                extract_thread.start()
+
+                for path, dest_path in zip(paths, dest_paths):
+                    events[path].wait()
+                    if state['error'] is not None:
+                        raise state['error']
+
+                    pending.append((path, executor.submit(self.compress_image,
+                        path, dest_path, self._image_quality)))
+                    # Sizes are returned in the order of frames
+                    while pending and (len(pending) > 2 * workers or pending[0][1].done()):
+                        yield self._finish_image(*pending.popleft())
+
+                while pending:
+                    yield self._finish_image(*pending.popleft())
+        finally:
+            state['stop'] = True
+            if extract_thread.is_alive():
+                extract_thread.join()
+            for path in paths:
+                if os.path.exists(path):
+                    os.remove(path)
+
 class VideoExtractor(MediaExtractor):
-    def __init__(self, source_path, dest_path, image_quality, step=1, start=0, stop=0):
-        from cvat.apps.engine.log import slogger
-        _dest_path = tempfile.mkdtemp(prefix='cvat-', suffix='.data')
+    # Frames are decoded by ffmpeg into a pipe as raw RGB buffers and are
+    # encoded to JPEG right into their final location. Nothing is written
+    # into a temporary directory.
+    def __init__(self, source_path, dest_path, image_quality, step=1, start=0, stop=0,
+            frame_size=None, keyframes=None):
         super().__init__(
             source_path=source_path[0],
-            dest_path=_dest_path,
+            dest_path=dest_path,
             image_quality=image_quality,
             step=step,
             start=start,
             stop=stop,
             )
-        # translate inversed range 1:95 to 2:32
-        translated_quality = 96 - self._image_quality
-        translated_quality = round((((translated_quality - 1) * (31 - 2)) / (95 - 1)) + 2)
-        self._tmp_output = tempfile.mkdtemp(prefix='cvat-', suffix='.data')
-        target_path = os.path.join(self._tmp_output, '%d.jpg')
-        output_opts = '-start_number 0 -b:v 10000k -vsync 0 -an -y -q:v ' + str(translated_quality)
-        filters = ''
-        if self._stop > 0:
-            filters = 'between(n,' + str(self._start) + ',' + str(self._stop) + ')'
-        elif self._start > 0:
-            filters = 'gte(n,' + str(self._start) + ')'
-        if self._step > 1:
-            filters += ('*' if filters else '') + 'not(mod(n-' + str(self._start) + ',' + str(self._step) + '))'
-        if filters:
-            output_opts += " -vf select=\"'" + filters + "'\""
-
-        ff = FFmpeg(
-            inputs  = {self._source_path: None},
-            outputs = {target_path: output_opts})
-
-        slogger.glob.info("FFMpeg cmd: {} ".format(ff.cmd))
-        ff.run()
 
-    def _getframepath(self, k):
-        return "{0}/{1}.jpg".format(self._tmp_output, k)
+        if frame_size is None:
+            self._width, self._height, frame_count = self._probe(self._source_path)
+            self._set_frame_count(frame_count)
+        else:
+            # The video has been probed already (e.g. on decoding of a chunk)
+            self._width, self._height = frame_size
+            self._length = len(range(self._start, self._stop + 1, self._step))
+        # Decoding is started from the nearest key frame before the start
+        # frame (see index_frames) instead of the beginning of the video
+        self._keyframes = keyframes
+
+    def _set_frame_count(self, frame_count):
+        last_frame = frame_count - 1
+        if self._stop > 0:
+            last_frame = min(self._stop, last_frame)
+        self._length = len(range(self._start, last_frame + 1, self._step))
+
+    @staticmethod
+    def _probe(source_path):
+        output = subprocess.check_output(['ffprobe', '-v', 'error',
+            '-select_streams', 'v:0',
+            '-show_entries', 'stream=width,height,nb_frames:stream_tags=rotate',
+            '-of', 'json', source_path])
+        stream = json.loads(output.decode('utf-8'))['streams'][0]
+        width, height = int(stream['width']), int(stream['height'])
+        # ffmpeg rotates frames in accordance with the metadata
+        if int(stream.get('tags', {}).get('rotate', 0)) % 180 == 90:
+            width, height = height, width
+
+        frame_count = stream.get('nb_frames', '')
+        if not frame_count.isdigit():
+            # Some containers (e.g. mkv, webm) don't keep the number of
+            # frames. Packets are counted without decoding in this case.
+            frame_count = subprocess.check_output(['ffprobe', '-v', 'error',
+                '-select_streams', 'v:0', '-count_packets',
+                '-show_entries', 'stream=nb_read_packets',
+                '-of', 'csv=p=0', source_path]).decode('utf-8').strip()
+
+        return width, height, int(frame_count)
+
+    def index_frames(self):
+        # The number of frames in metadata (or the number of packets) can
+        # differ from the number of decoded frames, e.g. because of edit
+        # lists or broken packets. Frames are decoded by ffprobe to count
+        # them exactly. Key frames are found at the same time. Returns an
+        # array of (frame, seek time) for key frames (see keyframes).
+        output = subprocess.check_output(['ffprobe', '-v', 'error',
+            '-select_streams', 'v:0',
+            '-show_entries', 'frame=key_frame,best_effort_timestamp_time:format=start_time',
+            '-of', 'json', self._source_path])
+        info = json.loads(output.decode('utf-8'))
+        try:
+            # ffmpeg adds the start time to the position of -ss
+            start_time = float(info.get('format', {}).get('start_time', 0))
+        except ValueError:
+            start_time = 0.0
+
+        frames = info.get('frames', [])
+        keyframes = []
+        prev_time = None
+        for frame, frame_info in enumerate(frames):
+            try:
+                time = float(frame_info.get('best_effort_timestamp_time'))
+            except (TypeError, ValueError):
+                prev_time = None
+                continue
+            if frame_info.get('key_frame') and prev_time is not None and prev_time < time:
+                # The middle between the key frame and the previous frame.
+                # ffmpeg drops decoded frames before the position.
+                seek_time = (prev_time + time) / 2 - start_time
+                if seek_time > 0:
+                    keyframes.append((frame, seek_time))
+            prev_time = time
+
+        self._set_frame_count(len(frames))
+        return np.array(keyframes, dtype=np.float64).reshape(-1, 2)
+
+    def _get_decode_cmd(self):
+        cmd = ['ffmpeg', '-v', 'error']
+        start, stop = self._start, self._stop
+        if self._keyframes is not None and len(self._keyframes):
+            idx = np.searchsorted(self._keyframes[:, 0], start, side='right') - 1
+            if idx >= 0:
+                keyframe, seek_time = self._keyframes[idx]
+                # Frames are numbered from the key frame after seeking
+                cmd += ['-ss', '{:.6f}'.format(seek_time)]
+                start -= int(keyframe)
+                if stop > 0:
+                    stop -= int(keyframe)
 
-    def __iter__(self):
-        i = 0
-        while os.path.exists(self._getframepath(i)):
-            yield self._getframepath(i)
-            i += 1
+        filters = ''
+        if stop > 0:
+            filters = 'between(n,' + str(start) + ',' + str(stop) + ')'
+        elif start > 0:
+            filters = 'gte(n,' + str(start) + ')'
+        if self._step > 1:
+            filters += ('*' if filters else '') + 'not(mod(n-' + str(start) + ',' + str(self._step) + '))'
 
-    def __del__(self):
-        if self._tmp_output:
-            shutil.rmtree(self._tmp_output)
+        cmd += ['-i', self._source_path, '-an', '-vsync', '0']
+        if filters:
+            cmd += ['-vf', "select='" + filters + "'"]
+        if self._stop > 0:
+            # ffmpeg exits after the last required frame
+            cmd += ['-frames:v', str(len(range(self._start, self._stop + 1, self._step)))]
+        cmd += ['-f', 'rawvideo', '-pix_fmt', 'rgb24', 'pipe:1']
 
-    def __getitem__(self, k):
-        return self._getframepath(k)
+        return cmd
 
     def __len__(self):
-        return len(os.listdir(self._tmp_output))
+        return self._length
 
-    def save_image(self, k, dest_path):
-        shutil.copyfile(self[k], dest_path)
+    def get_frame_size(self):
+        return self._width, self._height
+
+    def save_images(self, dest_paths, workers=1):
+        from cvat.apps.engine.log import slogger
+        cmd = self._get_decode_cmd()
+        slogger.glob.info("FFMpeg cmd: {} ".format(' '.join(cmd)))
+
+        frame_size = self._width * self._height * 3
+        with tempfile.TemporaryFile() as error_file:
+            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=error_file)
+            is_killed = False
+            try:
+                # A destination is taken only for a decoded frame. Paths can
+                # be produced lazily with their directories (e.g. if the
+                # number of frames isn't known).
+                dest_paths = iter(dest_paths)
+                while True:
+                    buffer = process.stdout.read(frame_size)
+                    if len(buffer) < frame_size:
+                        break
+                    dest_path = next(dest_paths, None)
+                    if dest_path is None:
+                        break
+
+                    image = Image.frombuffer('RGB', (self._width, self._height),
+                        buffer, 'raw', 'RGB', 0, 1)
+                    image.save(dest_path, format='JPEG', quality=self._image_quality)
+                    yield self._width, self._height
+            finally:
+                process.stdout.close()
+                # All required frames have been read or the reading has been
+                # stopped. The rest of the output isn't interesting.
+                if process.poll() is None:
+                    process.kill()
+                    is_killed = True
+                process.wait()
+
+            if not is_killed and process.returncode != 0:
+                error_file.seek(0)
+                raise Exception("Failed to decode {}: {}".format(self._source_path,
+                    error_file.read().decode('utf-8', errors='replace')))
 
 def _is_archive(path):
     mime = mimetypes.guess_type(path)
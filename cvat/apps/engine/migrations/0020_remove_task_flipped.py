@@ -3,10 +3,10 @@
 from django.db import migrations
 from django.conf import settings
 
-from cvat.apps.engine.task import get_image_meta_cache
 from cvat.apps.engine.models import Job, ShapeType
 
 from PIL import Image
+from ast import literal_eval
 
 import os
 
@@ -34,18 +34,31 @@ def frame_path(db_task, frame):
     return path
 
 
-def _get_image_meta_cache_path(self):
-    task_dirname = os.path.join(settings.DATA_ROOT, str(self.id))
-    return os.path.join(task_dirname, "image_meta.cache")
+def get_image_meta_cache(db_task):
+    # A copy of get_image_meta_cache() from the engine at the time of the
+    # migration (for interpolation tasks only), so the migration doesn't
+    # depend on the current format of the cache
+    task_dirname = os.path.join(settings.DATA_ROOT, str(db_task.id))
+    meta_cache_path = os.path.join(task_dirname, "image_meta.cache")
+    try:
+        with open(meta_cache_path) as meta_cache_file:
+            return literal_eval(meta_cache_file.read())
+    except Exception:
+        with Image.open(frame_path(db_task, 0)) as image:
+            cache = {
+                'original_size': [{
+                    'width': image.size[0],
+                    'height': image.size[1]
+                }]
+            }
+        with open(meta_cache_path, 'w') as meta_cache_file:
+            meta_cache_file.write(str(cache))
+        return cache
 
 
 def forwards_func(apps, schema_editor):
     Task = apps.get_model('engine', 'Task')
 
-    # class methods unavailable in the class which got via get_model()
-    # nevertheless it is needed for us to use the function get_image_meta_cache()
-    setattr(Task, 'get_image_meta_cache_path', _get_image_meta_cache_path)
-
     print('Getting flipped tasks...')
     db_flipped_tasks = Task.objects.prefetch_related(
         'image_set',
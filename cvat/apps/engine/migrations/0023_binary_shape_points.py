@@ -0,0 +1,89 @@
+# Generated by Django 2.2.8 on 2019-12-16 10:00
+
+from django.db import migrations
+import cvat.apps.engine.models
+
+BATCH_SIZE = 10000
+
+def _copy_points(apps, model_name, src_field, dst_field):
+    db_model = apps.get_model('engine', model_name)
+    db_shapes = []
+    for db_shape in db_model.objects.only('id', src_field).iterator(chunk_size=BATCH_SIZE):
+        setattr(db_shape, dst_field, getattr(db_shape, src_field))
+        db_shapes.append(db_shape)
+        if len(db_shapes) == BATCH_SIZE:
+            db_model.objects.bulk_update(db_shapes, [dst_field])
+            db_shapes = []
+
+    if db_shapes:
+        db_model.objects.bulk_update(db_shapes, [dst_field])
+
+def pack_points(apps, schema_editor):
+    for model_name in ['LabeledShape', 'TrackedShape']:
+        _copy_points(apps, model_name, 'points', 'packed_points')
+
+def unpack_points(apps, schema_editor):
+    for model_name in ['LabeledShape', 'TrackedShape']:
+        _copy_points(apps, model_name, 'packed_points', 'points')
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('engine', '0022_auto_20191004_0817'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='labeledshape',
+            name='packed_points',
+            field=cvat.apps.engine.models.BinaryFloatArrayField(null=True),
+        ),
+        migrations.AddField(
+            model_name='trackedshape',
+            name='packed_points',
+            field=cvat.apps.engine.models.BinaryFloatArrayField(null=True),
+        ),
+        # The text column has to be nullable to be filled back on reverse
+        migrations.AlterField(
+            model_name='labeledshape',
+            name='points',
+            field=cvat.apps.engine.models.FloatArrayField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='trackedshape',
+            name='points',
+            field=cvat.apps.engine.models.FloatArrayField(null=True),
+        ),
+        migrations.RunPython(
+            code=pack_points,
+            reverse_code=unpack_points,
+        ),
+        migrations.RemoveField(
+            model_name='labeledshape',
+            name='points',
+        ),
+        migrations.RemoveField(
+            model_name='trackedshape',
+            name='points',
+        ),
+        migrations.RenameField(
+            model_name='labeledshape',
+            old_name='packed_points',
+            new_name='points',
+        ),
+        migrations.RenameField(
+            model_name='trackedshape',
+            old_name='packed_points',
+            new_name='points',
+        ),
+        migrations.AlterField(
+            model_name='labeledshape',
+            name='points',
+            field=cvat.apps.engine.models.BinaryFloatArrayField(),
+        ),
+        migrations.AlterField(
+            model_name='trackedshape',
+            name='points',
+            field=cvat.apps.engine.models.BinaryFloatArrayField(),
+        ),
+    ]
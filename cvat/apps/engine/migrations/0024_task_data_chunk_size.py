@@ -0,0 +1,18 @@
+# Generated by Django 2.2.8 on 2019-12-18 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('engine', '0023_binary_shape_points'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='data_chunk_size',
+            field=models.PositiveIntegerField(null=True),
+        ),
+    ]
@@ -7,6 +7,9 @@ from enum import Enum
 import re
 import shlex
 import os
+from base64 import b64encode
+
+import numpy as np
 
 from django.db import models
 from django.conf import settings
@@ -73,6 +76,9 @@ class Task(models.Model):
     frame_filter = models.CharField(max_length=256, default="", blank=True)
     status = models.CharField(max_length=32, choices=StatusChoice.choices(),
         default=StatusChoice.ANNOTATION)
+    # Frames are decoded on demand by chunks of the size. Null means that
+    # all frames are extracted into the data directory on task creation.
+    data_chunk_size = models.PositiveIntegerField(null=True)
 
     # Extend default permission model
     class Meta:
@@ -114,7 +120,19 @@ class Task(models.Model):
         return os.path.join(self.get_task_dirname(), "client.log")
 
     def get_image_meta_cache_path(self):
-        return os.path.join(self.get_task_dirname(), "image_meta.cache")
+        return os.path.join(self.get_task_dirname(), "image_meta.npy")
+
+    def get_video_keyframes_path(self):
+        return os.path.join(self.get_task_dirname(), "video_keyframes.npy")
+
+    def get_chunks_dirname(self):
+        return os.path.join(self.get_task_dirname(), "chunks")
+
+    def get_annotation_cache_dirname(self):
+        return os.path.join(self.get_task_dirname(), "annotation_cache")
+
+    def get_export_cache_dirname(self):
+        return os.path.join(self.get_task_dirname(), "export_cache")
 
     def get_task_dirname(self):
         return os.path.join(settings.DATA_ROOT, str(self.id))
@@ -302,13 +320,39 @@ class FloatArrayField(models.TextField):
         return self.from_db_value(value, None, None)
 
     def get_prep_value(self, value):
+        if value is None:
+            return value
         return self.separator.join(map(str, value))
 
+class BinaryFloatArrayField(models.BinaryField):
+    # Packed little-endian floats. float64 keeps values exactly the same as
+    # they were received from a client.
+    dtype = np.dtype('<f8')
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return np.frombuffer(value, dtype=self.dtype).tolist()
+
+    def to_python(self, value):
+        if isinstance(value, list):
+            return value
+
+        return self.from_db_value(super().to_python(value), None, None)
+
+    def get_prep_value(self, value):
+        if value is None:
+            return value
+        return np.asarray(value, dtype=self.dtype).tobytes()
+
+    def value_to_string(self, obj):
+        return b64encode(self.get_prep_value(self.value_from_object(obj))).decode('ascii')
+
 class Shape(models.Model):
     type = models.CharField(max_length=16, choices=ShapeType.choices())
     occluded = models.BooleanField(default=False)
     z_order = models.IntegerField(default=0)
-    points = FloatArrayField()
+    points = BinaryFloatArrayField()
 
     class Meta:
         abstract = True
@@ -0,0 +1,102 @@
+# Copyright (C) 2019 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import time
+
+import rq
+
+class ProgressReporter:
+    # Reports progress of an RQ job in job.meta. Every save of meta is a
+    # round trip to Redis, so updates are coalesced: meta is saved only if
+    # the progress has grown by min_delta percents or min_interval seconds
+    # have passed since the previous save.
+    def __init__(self, total, status=None, job=None, min_interval=1.0,
+            min_delta=5.0, check_cancel=False):
+        self.job = job if job is not None else rq.get_current_job()
+        self.total = total
+        # The status can contain {progress}, {fps} and {bps} fields
+        self.status = status
+        self.min_interval = min_interval
+        self.min_delta = min_delta
+        # If it is set, the job is refreshed on every save to find out
+        # if it has been cancelled (by "cancel" key in meta).
+        self.check_cancel = check_cancel
+        self.done = 0
+        self.bytes = 0
+        self.cancelled = False
+        self._start_time = time.monotonic()
+        self._saved_time = None
+        self._saved_progress = None
+
+    @property
+    def progress(self):
+        if not self.total:
+            return 0.0
+
+        return min(self.done * 100.0 / self.total, 100.0)
+
+    @property
+    def fps(self):
+        return self.done / max(time.monotonic() - self._start_time, 1e-9)
+
+    @property
+    def bps(self):
+        return self.bytes / max(time.monotonic() - self._start_time, 1e-9)
+
+    def advance(self, count=1, nbytes=0):
+        self.done += count
+        self.bytes += nbytes
+
+        return self._report(force=False)
+
+    def update(self, done=None, nbytes=None, force=False):
+        if done is not None:
+            self.done = done
+        if nbytes is not None:
+            self.bytes = nbytes
+
+        return self._report(force)
+
+    def set_status(self, status):
+        self.status = status
+
+        return self._report(force=True)
+
+    def _is_due(self, now, progress):
+        if self._saved_time is None:
+            return True
+        if progress >= 100.0:
+            return self._saved_progress < 100.0
+
+        return now - self._saved_time >= self.min_interval or \
+            progress - self._saved_progress >= self.min_delta
+
+    def _report(self, force):
+        # Returns False if the job has been cancelled
+        now = time.monotonic()
+        progress = self.progress
+        if self.job is None or self.cancelled or \
+                not (force or self._is_due(now, progress)):
+            return not self.cancelled
+
+        self._saved_time = now
+        self._saved_progress = progress
+
+        if self.check_cancel:
+            self.job.refresh()
+            if "cancel" in self.job.meta:
+                self.cancelled = True
+                return False
+
+        fps = self.fps
+        bps = self.bps
+        self.job.meta["progress"] = round(progress, 1)
+        self.job.meta["fps"] = round(fps, 2)
+        self.job.meta["bps"] = round(bps)
+        if self.status is not None:
+            self.job.meta["status"] = self.status.format(
+                progress=int(progress), fps=fps, bps=bps)
+        self.job.save_meta()
+
+        return True
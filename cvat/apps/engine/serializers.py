@@ -9,7 +9,7 @@ import shutil
 from rest_framework import serializers
 from django.contrib.auth.models import User, Group
 
-from cvat.apps.engine import models
+from cvat.apps.engine import models, frame_provider
 from cvat.apps.engine.log import slogger
 
 
@@ -190,6 +190,7 @@ class TaskSerializer(WriteOnceMixin, serializers.ModelSerializer):
     labels = LabelSerializer(many=True, source='label_set', partial=True)
     segments = SegmentSerializer(many=True, source='segment_set', read_only=True)
     image_quality = serializers.IntegerField(min_value=0, max_value=100)
+    chunk_size = serializers.SerializerMethodField()
 
     class Meta:
         model = models.Task
@@ -197,12 +198,16 @@ class TaskSerializer(WriteOnceMixin, serializers.ModelSerializer):
             'bug_tracker', 'created_date', 'updated_date', 'overlap',
             'segment_size', 'z_order', 'status', 'labels', 'segments',
             'image_quality', 'start_frame', 'stop_frame', 'frame_filter',
-            'project')
+            'project', 'chunk_size')
         read_only_fields = ('size', 'mode', 'created_date', 'updated_date',
             'status')
         write_once_fields = ('overlap', 'segment_size', 'image_quality')
         ordering = ['-id']
 
+    # pylint: disable=no-self-use
+    def get_chunk_size(self, instance):
+        return frame_provider.get_chunk_size(instance)
+
     def validate_frame_filter(self, value):
         match = re.search("step\s*=\s*([1-9]\d*)", value)
         if not match:
@@ -6,15 +6,23 @@
 import os
 import sys
 import rq
+import time
+import fcntl
 import shutil
+import tempfile
+import threading
+import itertools
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from PIL import Image
 from traceback import print_exception
-from ast import literal_eval
 from urllib import error as urlerror
 from urllib import parse as urlparse
 from urllib import request as urlrequest
 
-from cvat.apps.engine.media_extractors import get_mime, MEDIA_TYPES
+from cvat.apps.engine.media_extractors import (get_mime, get_image_size,
+    MEDIA_TYPES, ImageListExtractor, ArchiveExtractor, VideoExtractor)
 
 import django_rq
 from django.conf import settings
@@ -23,6 +31,7 @@ from distutils.dir_util import copy_tree
 
 from . import models
 from .log import slogger
+from .progress import ProgressReporter
 
 ############################# Low Level server API
 
@@ -43,62 +52,101 @@ def rq_handler(job, exc_type, exc_value, traceback):
 
 ############################# Internal implementation for server API
 
+def _save_image_meta_cache(db_task, sizes):
+    # Sizes of frames are kept as (width, height) rows of a .npy file
+    path = db_task.get_image_meta_cache_path()
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.npy')
+    with os.fdopen(fd, 'wb') as meta_file:
+        np.save(meta_file, np.array(sizes, dtype=np.uint32).reshape(-1, 2))
+    os.replace(tmp_path, path)
+
+def _get_image_sizes(paths, root=''):
+    # Only headers of images are read, it is done by a pool of threads.
+    # Errors are reported with paths relative to the root.
+    def get_size(path):
+        try:
+            return get_image_size(os.path.join(root, path))
+        except Exception:
+            raise ValueError("Cannot read the image '{}'".format(path))
+
+    workers = max(min(settings.MEDIA_COMPRESSION_WORKERS, len(paths)), 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(get_size, paths))
+
 def make_image_meta_cache(db_task):
-    with open(db_task.get_image_meta_cache_path(), 'w') as meta_file:
-        cache = {
-            'original_size': []
-        }
-
-        if db_task.mode == 'interpolation':
-            image = Image.open(db_task.get_frame_path(0))
-            cache['original_size'].append({
-                'width': image.size[0],
-                'height': image.size[1]
-            })
-            image.close()
-        else:
+    if db_task.mode == 'interpolation' and db_task.data_chunk_size:
+        sizes = [(db_task.video.width, db_task.video.height)]
+    elif db_task.mode == 'interpolation':
+        sizes = [get_image_size(db_task.get_frame_path(0))]
+    else:
+        sizes = list(db_task.image_set.order_by('frame').values_list('width', 'height'))
+        if len(sizes) != db_task.size:
+            # There are no rows for images of some old tasks. Headers of
+            # the images are read in parallel in this case.
             filenames = []
             for root, _, files in os.walk(db_task.get_upload_dirname()):
                 fullnames = map(lambda f: os.path.join(root, f), files)
                 images = filter(lambda x: get_mime(x) == 'image', fullnames)
                 filenames.extend(images)
             filenames.sort()
+            sizes = _get_image_sizes(filenames)
 
-            for image_path in filenames:
-                image = Image.open(image_path)
-                cache['original_size'].append({
-                    'width': image.size[0],
-                    'height': image.size[1]
-                })
-                image.close()
-
-        meta_file.write(str(cache))
-
+    _save_image_meta_cache(db_task, sizes)
 
 def get_image_meta_cache(db_task):
+    # Returns a memory-mapped array of (width, height) rows
     try:
-        with open(db_task.get_image_meta_cache_path()) as meta_cache_file:
-            return literal_eval(meta_cache_file.read())
-    except Exception:
+        return np.load(db_task.get_image_meta_cache_path(), mmap_mode='r')
+    except (OSError, ValueError):
         make_image_meta_cache(db_task)
-        with open(db_task.get_image_meta_cache_path()) as meta_cache_file:
-            return literal_eval(meta_cache_file.read())
+        return np.load(db_task.get_image_meta_cache_path(), mmap_mode='r')
+
+_FICLONE = 0x40049409 # from linux/fs.h
+
+def _link_file(source_path, target_path):
+    # A reflink (copy-on-write clone) is tried first, then a hardlink. Both
+    # work only inside one filesystem. A copy is made otherwise.
+    with open(source_path, 'rb') as source_file, open(target_path, 'wb') as target_file:
+        try:
+            fcntl.ioctl(target_file.fileno(), _FICLONE, source_file.fileno())
+            return
+        except OSError:
+            pass
+
+    os.remove(target_path)
+    try:
+        os.link(source_path, target_path)
+    except OSError:
+        shutil.copyfile(source_path, target_path)
+
+def _link_tree(source_dir, target_dir):
+    for root, _, files in os.walk(source_dir):
+        target_root = os.path.join(target_dir, os.path.relpath(root, source_dir))
+        os.makedirs(target_root, exist_ok=True)
+        for name in files:
+            _link_file(os.path.join(root, name), os.path.join(target_root, name))
 
 def _copy_data_from_share(server_files, upload_dir):
-    job = rq.get_current_job()
-    job.meta['status'] = 'Data are being copied from share..'
-    job.save_meta()
+    progress = ProgressReporter(total=len(server_files),
+        status='Data are being copied from share.. {progress}%')
 
     for path in server_files:
         source_path = os.path.join(settings.SHARE_ROOT, os.path.normpath(path))
         target_path = os.path.join(upload_dir, path)
         if os.path.isdir(source_path):
-            copy_tree(source_path, target_path)
+            if settings.SHARE_IMPORT_MODE == 'link':
+                _link_tree(source_path, target_path)
+            else:
+                copy_tree(source_path, target_path)
         else:
             target_dir = os.path.dirname(target_path)
             if not os.path.exists(target_dir):
                 os.makedirs(target_dir)
-            shutil.copyfile(source_path, target_path)
+            if settings.SHARE_IMPORT_MODE == 'link':
+                _link_file(source_path, target_path)
+            else:
+                shutil.copyfile(source_path, target_path)
+        progress.advance()
 
 def _save_task_to_db(db_task):
     job = rq.get_current_job()
@@ -203,34 +251,116 @@ def _validate_data(data):
     if unique_entries == 0 and multiple_entries == 0:
         raise ValueError('No media data found')
 
+    # Broken images from the share are found before they are copied
+    server_files = set(data['server_files'])
+    share_images = [path for path in counter['image'] if path in server_files]
+    _get_image_sizes(share_images, root=share_root)
+
     return counter
 
+_DOWNLOAD_BUFFER_SIZE = 1024 * 1024
+_DOWNLOAD_RETRIES = 5
+_DOWNLOAD_BACKOFF = 1.0 # seconds, it is doubled after each retry
+
+def _download_file(url, path, progress, progress_lock):
+    # On retries the download is resumed from the end of the partially
+    # downloaded file if the server supports HTTP Range requests.
+    for attempt in range(_DOWNLOAD_RETRIES + 1):
+        if attempt:
+            time.sleep(_DOWNLOAD_BACKOFF * 2 ** (attempt - 1))
+
+        offset = os.path.getsize(path) if os.path.exists(path) else 0
+        headers = {'User-Agent': 'Mozilla/5.0'}
+        if offset:
+            headers['Range'] = 'bytes={}-'.format(offset)
+        req = urlrequest.Request(url, headers=headers)
+        try:
+            with urlrequest.urlopen(req, timeout=60) as fp:
+                # The server can ignore the range and send the whole file
+                mode = 'ab' if offset and fp.status == 206 else 'wb'
+                if mode == 'wb' and offset:
+                    # Bytes of the truncated file have been reported already
+                    with progress_lock:
+                        progress.advance(count=0, nbytes=-offset)
+                expected_size = fp.headers.get('Content-Length')
+                received_size = 0
+                with open(path, mode) as tfp:
+                    while True:
+                        block = fp.read(_DOWNLOAD_BUFFER_SIZE)
+                        if not block:
+                            break
+                        tfp.write(block)
+                        received_size += len(block)
+                        with progress_lock:
+                            progress.advance(count=0, nbytes=len(block))
+                # urllib doesn't report a connection which is closed early
+                if expected_size is not None and received_size < int(expected_size):
+                    raise http.client.IncompleteRead(b'', int(expected_size) - received_size)
+            break
+        except urlerror.HTTPError as err:
+            if err.code == 416 and offset:
+                break # The file has been downloaded completely
+            if err.code < 500 and err.code != 429 or attempt == _DOWNLOAD_RETRIES:
+                raise Exception("Failed to download {}. {} - {}".format(
+                    url, err.code, err.reason))
+        except (urlerror.URLError, http.client.HTTPException, OSError) as err:
+            if attempt == _DOWNLOAD_RETRIES:
+                reason = err.reason if isinstance(err, urlerror.URLError) else err
+                raise Exception("Invalid URL: {}. {}".format(url, reason))
+            slogger.glob.warning("Downloading of {} is interrupted: {}".format(url, err))
+
+    with progress_lock:
+        progress.advance()
+
 def _download_data(urls, upload_dir):
-    job = rq.get_current_job()
-    local_files = {}
+    local_files = []
     for url in urls:
         name = os.path.basename(urlrequest.url2pathname(urlparse.urlparse(url).path))
         if name in local_files:
             raise Exception("filename collision: {}".format(name))
-        slogger.glob.info("Downloading: {}".format(url))
-        job.meta['status'] = '{} is being downloaded..'.format(url)
-        job.save_meta()
-
-        req = urlrequest.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
+        local_files.append(name)
+
+    progress = ProgressReporter(total=len(urls),
+        status='Data are being downloaded... {progress}% ({bps:.0f} B/s)')
+    progress_lock = threading.Lock()
+    workers = min(settings.DOWNLOAD_WORKERS, len(urls))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for url, name in zip(urls, local_files):
+            slogger.glob.info("Downloading: {}".format(url))
+            futures.append(executor.submit(_download_file, url,
+                os.path.join(upload_dir, name), progress, progress_lock))
         try:
-            with urlrequest.urlopen(req) as fp, open(os.path.join(upload_dir, name), 'wb') as tfp:
-                while True:
-                    block = fp.read(8192)
-                    if not block:
-                        break
-                    tfp.write(block)
-        except urlerror.HTTPError as err:
-            raise Exception("Failed to download " + url + ". " + str(err.code) + ' - ' + err.reason)
-        except urlerror.URLError as err:
-            raise Exception("Invalid URL: " + url + ". " + err.reason)
+            for future in futures:
+                future.result()
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
 
-        local_files[name] = True
-    return list(local_files.keys())
+    return local_files
+
+def _index_media(db_task, extractors):
+    # Frames will be decoded from the original media on demand
+    db_images = []
+    for extractor in extractors:
+        if isinstance(extractor, ArchiveExtractor):
+            extractor.extract()
+        elif isinstance(extractor, VideoExtractor):
+            np.save(db_task.get_video_keyframes_path(), extractor.index_frames())
+        if db_task.mode != 'interpolation':
+            paths = [extractor[frame] for frame in range(len(extractor))]
+            for path, (width, height) in zip(paths, _get_image_sizes(paths)):
+                db_images.append(models.Image(
+                    task=db_task,
+                    path=path,
+                    frame=db_task.size,
+                    width=width, height=height))
+                db_task.size += 1
+        else:
+            db_task.size += len(extractor)
+
+    return db_images
 
 @transaction.atomic
 def _create_thread(tid, data):
@@ -247,8 +377,18 @@ def _create_thread(tid, data):
 
     media = _validate_data(data)
 
+    # In the direct mode files are read by extractors right from the share
+    share_files = set()
     if data['server_files']:
-        _copy_data_from_share(data['server_files'], upload_dir)
+        if settings.SHARE_IMPORT_MODE == 'direct':
+            share_files = set(data['server_files'])
+        else:
+            _copy_data_from_share(data['server_files'], upload_dir)
+
+    def get_media_path(path):
+        if path in share_files:
+            return os.path.join(settings.SHARE_ROOT, os.path.normpath(path))
+        return os.path.join(upload_dir, path)
 
     job = rq.get_current_job()
     job.meta['status'] = 'Media files are being extracted...'
@@ -262,7 +402,7 @@ def _create_thread(tid, data):
             continue
 
         extractor = MEDIA_TYPES[media_type]['extractor'](
-            source_path=[os.path.join(upload_dir, f) for f in media_files],
+            source_path=[get_media_path(f) for f in media_files],
             dest_path=upload_dir,
             image_quality=db_task.image_quality,
             step=db_task.get_frame_step(),
@@ -273,40 +413,68 @@ def _create_thread(tid, data):
         db_task.mode = MEDIA_TYPES[media_type]['mode']
         extractors.append(extractor)
 
-    for extractor in extractors:
-        for frame, image_orig_path in enumerate(extractor):
-            image_dest_path = db_task.get_frame_path(db_task.size)
+    # PDF pages are rendered into a temporary directory. Thus they can't be
+    # decoded later.
+    if settings.FRAME_CHUNK_SIZE and all(isinstance(extractor,
+            (ImageListExtractor, VideoExtractor)) for extractor in extractors):
+        db_task.data_chunk_size = settings.FRAME_CHUNK_SIZE
+        db_images = _index_media(db_task, extractors)
+        extractors_to_save = []
+    else:
+        extractors_to_save = extractors
+
+    progress = ProgressReporter(total=length,
+        status='Images are being compressed... {progress}% ({fps:.1f} frames/s)')
+    def get_image_dest_paths(frames):
+        for frame in frames:
+            image_dest_path = db_task.get_frame_path(frame)
             dirname = os.path.dirname(image_dest_path)
 
             if not os.path.exists(dirname):
                 os.makedirs(dirname)
-
-            if db_task.mode == 'interpolation':
-                extractor.save_image(frame, image_dest_path)
-            else:
-                width, height = extractor.save_image(frame, image_dest_path)
+            yield image_dest_path
+
+    for extractor in extractors_to_save:
+        if isinstance(extractor, VideoExtractor):
+            # The number of frames in metadata of a video can be inexact.
+            # Frames are saved until the end of the video. The extractor
+            # takes a path (and its directory is created) only for a
+            # decoded frame.
+            image_dest_paths = get_image_dest_paths(itertools.count(db_task.size))
+        else:
+            image_dest_paths = list(get_image_dest_paths(
+                range(db_task.size, db_task.size + len(extractor))))
+
+        image_sizes = extractor.save_images(image_dest_paths,
+            workers=settings.MEDIA_COMPRESSION_WORKERS)
+        for frame, image_size in enumerate(image_sizes):
+            if db_task.mode != 'interpolation':
+                width, height = image_size
                 db_images.append(models.Image(
                     task=db_task,
-                    path=image_orig_path,
+                    path=extractor[frame],
                     frame=db_task.size,
                     width=width, height=height))
 
+            progress.advance(nbytes=os.path.getsize(db_task.get_frame_path(db_task.size)))
             db_task.size += 1
-            progress = frame * 100 // length
-            job.meta['status'] = 'Images are being compressed... {}%'.format(progress)
-            job.save_meta()
 
     if db_task.mode == 'interpolation':
-        image = Image.open(db_task.get_frame_path(0))
+        if db_task.data_chunk_size:
+            width, height = extractors[0].get_frame_size()
+        else:
+            with Image.open(db_task.get_frame_path(0)) as image:
+                width, height = image.size
         models.Video.objects.create(
             task=db_task,
             path=extractors[0].get_source_name(),
-            width=image.width, height=image.height)
-        image.close()
+            width=width, height=height)
         if db_task.stop_frame == 0:
             db_task.stop_frame = db_task.start_frame + (db_task.size - 1) * db_task.get_frame_step()
     else:
         models.Image.objects.bulk_create(db_images)
+        _save_image_meta_cache(db_task, [(db_image.width, db_image.height)
+            for db_image in db_images])
 
     slogger.glob.info("Founded frames {} for task #{}".format(db_task.size, tid))
     _save_task_to_db(db_task)
@@ -0,0 +1,198 @@
+# Copyright (C) 2019 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from cvat.apps.engine import annotation as annotation_module
+from cvat.apps.engine import models
+from cvat.apps.engine.annotation import (JobAnnotation, _escape_copy_value,
+    get_job_data, put_job_data, stream_job_data)
+
+def _normalize(tracks):
+    # Ids are generated by DB, the order of attributes isn't defined
+    tracks = json.loads(json.dumps(tracks))
+    for track in tracks:
+        track.pop("id", None)
+        track["attributes"].sort(key=lambda attr: attr["spec_id"])
+        for shape in track["shapes"]:
+            shape.pop("id", None)
+            shape["attributes"].sort(key=lambda attr: attr["spec_id"])
+
+    return tracks
+
+class JobTracksLoadingTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="annotator")
+        db_task = models.Task.objects.create(name="task", size=20, mode="interpolation")
+        db_segment = models.Segment.objects.create(task=db_task,
+            start_frame=0, stop_frame=19)
+        cls.db_job = models.Job.objects.create(segment=db_segment)
+        cls.db_label = models.Label.objects.create(task=db_task, name="car")
+        cls.model = models.AttributeSpec.objects.create(label=cls.db_label,
+            name="model", mutable=False, input_type="select",
+            default_value="mazda", values="bmw\nmazda").id
+        cls.parked = models.AttributeSpec.objects.create(label=cls.db_label,
+            name="parked", mutable=True, input_type="checkbox",
+            default_value="false", values="false\ntrue").id
+        cls.color = models.AttributeSpec.objects.create(label=cls.db_label,
+            name="color", mutable=True, input_type="select",
+            default_value="red", values="red\nblue").id
+
+    def _make_shape(self, frame, attributes, outside=False):
+        return {"type": "rectangle", "frame": frame, "points": [1.0, 2.0, 3.0, 4.5],
+            "occluded": False, "outside": outside, "z_order": 0,
+            "attributes": attributes}
+
+    def test_load_tracks(self):
+        JobAnnotation(self.db_job.id, self.user).put({"version": 0, "tags": [],
+            "shapes": [], "tracks": [
+                {"frame": 0, "label_id": self.db_label.id, "group": 1,
+                    "attributes": [{"spec_id": self.model, "value": "bmw"}],
+                    "shapes": [
+                        self._make_shape(0, [{"spec_id": self.parked, "value": "true"}]),
+                        self._make_shape(5, [{"spec_id": self.color, "value": "blue"}]),
+                        self._make_shape(10, [], outside=True),
+                    ]},
+                {"frame": 3, "label_id": self.db_label.id, "group": 0,
+                    "attributes": [], "shapes": [self._make_shape(3, [])]},
+            ]})
+
+        annotation = JobAnnotation(self.db_job.id, self.user)
+        annotation._init_tracks_from_db()
+
+        # Immutable attributes get default values, mutable ones are kept
+        # from the previous shape of the track
+        expected = [
+            {"frame": 0, "label_id": self.db_label.id, "group": 1,
+                "attributes": [{"spec_id": self.model, "value": "bmw"}],
+                "shapes": [
+                    self._make_shape(0, [{"spec_id": self.parked, "value": "true"},
+                        {"spec_id": self.color, "value": "red"}]),
+                    self._make_shape(5, [{"spec_id": self.parked, "value": "true"},
+                        {"spec_id": self.color, "value": "blue"}]),
+                    self._make_shape(10, [{"spec_id": self.parked, "value": "true"},
+                        {"spec_id": self.color, "value": "blue"}], outside=True),
+                ]},
+            {"frame": 3, "label_id": self.db_label.id, "group": 0,
+                "attributes": [{"spec_id": self.model, "value": "mazda"}],
+                "shapes": [self._make_shape(3, [
+                    {"spec_id": self.parked, "value": "false"},
+                    {"spec_id": self.color, "value": "red"}])]},
+        ]
+        self.assertEqual(_normalize(annotation.ir_data.tracks), _normalize(expected))
+
+    def test_load_without_tracks(self):
+        annotation = JobAnnotation(self.db_job.id, self.user)
+        annotation._init_tracks_from_db()
+
+        self.assertEqual(annotation.ir_data.tracks, [])
+
+@mock.patch.object(annotation_module, '_STREAM_PAGE_SIZE', 2)
+@mock.patch.object(annotation_module, '_STREAM_CHUNK_SIZE', 1)
+class JobStreamingTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username="annotator")
+        db_task = models.Task.objects.create(name="task", size=20, mode="interpolation")
+        db_segment = models.Segment.objects.create(task=db_task,
+            start_frame=0, stop_frame=19)
+        cls.db_job = models.Job.objects.create(segment=db_segment)
+        cls.db_label = models.Label.objects.create(task=db_task, name="car")
+        cls.db_spec = models.AttributeSpec.objects.create(label=cls.db_label,
+            name="parked", mutable=True, input_type="checkbox",
+            default_value="false", values="false\ntrue")
+
+    def _put_data(self):
+        # Objects are on different frames, so their order is defined
+        put_job_data(self.db_job.id, self.user, {
+            "version": 0,
+            "tags": [{"frame": frame, "label_id": self.db_label.id, "group": 0,
+                "attributes": [{"spec_id": self.db_spec.id, "value": "true"}]}
+                for frame in range(5)],
+            "shapes": [{"type": "rectangle", "frame": frame,
+                "label_id": self.db_label.id, "group": 0,
+                "points": [1.0, 2.0, 3.0 + frame, 4.5], "occluded": False,
+                "z_order": 0, "attributes": []} for frame in range(5, 10)],
+            "tracks": [{"frame": 10 + i, "label_id": self.db_label.id, "group": 0,
+                "attributes": [], "shapes": [{"type": "points",
+                    "frame": frame, "points": [1.0, 2.0 + i], "occluded": False,
+                    "outside": frame == 12 + i, "z_order": 0,
+                    "attributes": [{"spec_id": self.db_spec.id, "value": "true"}]
+                        if frame == 10 + i else []}
+                    for frame in range(10 + i, 13 + i)]}
+                for i in range(3)],
+        })
+
+    def test_stream_job_data(self):
+        self._put_data()
+
+        content = b"".join(stream_job_data(self.db_job.id, self.user))
+
+        expected = json.loads(json.dumps(get_job_data(self.db_job.id, self.user)))
+        self.assertEqual(json.loads(content.decode("utf-8")), expected)
+
+    def test_stream_job_data_without_annotations(self):
+        content = b"".join(stream_job_data(self.db_job.id, self.user))
+
+        self.assertEqual(json.loads(content.decode("utf-8")),
+            {"version": 0, "tags": [], "shapes": [], "tracks": []})
+
+    def test_transaction_is_not_kept_between_chunks(self):
+        self._put_data()
+        savepoints = len(connection.savepoint_ids)
+
+        chunks = stream_job_data(self.db_job.id, self.user)
+        for chunk_number, _ in enumerate(chunks):
+            self.assertEqual(len(connection.savepoint_ids), savepoints)
+            if chunk_number == 20:
+                break
+        # The response is closed before the end
+        chunks.close()
+        self.assertEqual(len(connection.savepoint_ids), savepoints)
+
+    def test_stream_is_broken_if_job_is_changed(self):
+        self._put_data()
+
+        chunks = stream_job_data(self.db_job.id, self.user)
+        next(chunks)
+        put_job_data(self.db_job.id, self.user,
+            {"version": 0, "tags": [], "shapes": [], "tracks": []})
+
+        with self.assertRaisesRegex(Exception, "has been changed"):
+            list(chunks)
+
+class CopyEscapeTestCase(SimpleTestCase):
+    def test_null(self):
+        self.assertEqual(_escape_copy_value(None), "\\N")
+
+    def test_bool(self):
+        self.assertEqual(_escape_copy_value(True), "t")
+        self.assertEqual(_escape_copy_value(False), "f")
+
+    def test_numbers(self):
+        self.assertEqual(_escape_copy_value(42), "42")
+        self.assertEqual(_escape_copy_value(0.5), "0.5")
+
+    def test_bytes(self):
+        # bytea in hex format, the backslash is escaped for the text format
+        self.assertEqual(_escape_copy_value(b"\x00\x1f\xff"), "\\\\x001fff")
+        self.assertEqual(_escape_copy_value(memoryview(b"\t\n")), "\\\\x090a")
+        self.assertEqual(_escape_copy_value(b""), "\\\\x")
+
+    def test_special_characters(self):
+        self.assertEqual(_escape_copy_value("a\tb\nc\rd"), "a\\tb\\nc\\rd")
+        self.assertEqual(_escape_copy_value("C:\\new"), "C:\\\\new")
+        # A backslash is escaped before the characters after it
+        self.assertEqual(_escape_copy_value("\\\t"), "\\\\\\t")
+        self.assertEqual(_escape_copy_value("\\N"), "\\\\N")
+
+    def test_text_is_kept(self):
+        self.assertEqual(_escape_copy_value("mazda, bmw"), "mazda, bmw")
+        self.assertEqual(_escape_copy_value("машина"), "машина")
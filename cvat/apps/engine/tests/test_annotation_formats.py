@@ -0,0 +1,118 @@
+# Copyright (C) 2019 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import copy
+import io
+
+import numpy as np
+from django.test import SimpleTestCase
+from PIL import Image
+
+from cvat.apps.annotation.coco import fix_frames_intersections
+from cvat.apps.annotation.mask import rasterize_frame, rasterize_frames
+
+def _make_polygon(points, z_order):
+    return {
+        'label': 'object',
+        'points': points,
+        'z_order': z_order,
+        'group': 0,
+    }
+
+def _get_bounding_box(polygons):
+    xs = [x for points in polygons for x in points[0::2]]
+    ys = [y for points in polygons for y in points[1::2]]
+    return min(xs), min(ys), max(xs), max(ys)
+
+class CocoIntersectionsTestCase(SimpleTestCase):
+    # Polygons go from the bottom to the top one
+    square = [0, 0, 20, 0, 20, 20, 0, 20]
+    right_square = [10, 0, 30, 0, 30, 20, 10, 20]
+    inner_square = [5, 5, 15, 5, 15, 15, 5, 15]
+    far_square = [60, 30, 70, 30, 70, 40, 60, 40]
+
+    def _fix(self, *polygons):
+        frame = ([_make_polygon(points, z_order)
+            for z_order, points in enumerate(polygons)], 50, 80, 'image.jpg')
+        return [polygon['points'] for polygon in
+            next(fix_frames_intersections([copy.deepcopy(frame)]))]
+
+    def test_separate_objects_are_kept(self):
+        self.assertEqual(self._fix(self.square, self.far_square),
+            [[self.square], [self.far_square]])
+
+    def test_objects_inside_others_are_kept(self):
+        self.assertEqual(self._fix(self.square, self.inner_square),
+            [[self.square], [self.inner_square]])
+        self.assertEqual(self._fix(self.inner_square, self.square),
+            [[self.inner_square], [self.square]])
+
+    def test_bottom_object_is_cropped(self):
+        bottom, top = self._fix(self.square, self.right_square)
+
+        self.assertEqual(top, [self.right_square])
+        # The left half of the bottom square is left
+        x0, y0, x1, y1 = _get_bounding_box(bottom)
+        self.assertLessEqual(abs(x0 - 0), 1)
+        self.assertLessEqual(abs(y0 - 0), 1)
+        self.assertLessEqual(abs(x1 - 10), 1)
+        self.assertLessEqual(abs(y1 - 20), 1)
+
+    def test_workers_keep_the_order_of_frames(self):
+        # The frame with one object isn't sent to workers
+        frames = [([_make_polygon(points, z_order)
+            for z_order, points in enumerate(polygons)], 50, 80, '{}.jpg'.format(idx))
+            for idx, polygons in enumerate([
+                [self.square, self.right_square],
+                [self.far_square],
+                [self.square, self.far_square],
+                [self.inner_square, self.square, self.right_square],
+                [self.right_square, self.square],
+            ])]
+        expected = list(fix_frames_intersections(copy.deepcopy(frames)))
+
+        self.assertEqual(list(fix_frames_intersections(
+            iter(copy.deepcopy(frames)), workers=2)), expected)
+
+class MaskRasterizationTestCase(SimpleTestCase):
+    colormap = np.array([[0, 0, 0], [255, 0, 0], [0, 255, 0]], dtype=np.uint8)
+    bottom = (1, [0, 0, 9, 0, 9, 9, 0, 9])
+    top = (2, [5, 5, 14, 5, 14, 14, 5, 14])
+
+    @staticmethod
+    def _decode(png):
+        image = Image.open(io.BytesIO(png))
+        return image, np.asarray(image.convert('RGB'))
+
+    def test_shapes_are_painted_in_z_order(self):
+        image, pixels = self._decode(rasterize_frame([self.bottom, self.top],
+            16, 20, self.colormap))
+
+        self.assertEqual(image.format, 'PNG')
+        self.assertEqual(image.size, (20, 16))
+        # Pixels are indexed by (y, x)
+        self.assertEqual(pixels[2, 2].tolist(), [255, 0, 0])
+        self.assertEqual(pixels[7, 7].tolist(), [0, 255, 0])
+        self.assertEqual(pixels[12, 12].tolist(), [0, 255, 0])
+        self.assertEqual(pixels[15, 18].tolist(), [0, 0, 0])
+
+        _, pixels = self._decode(rasterize_frame([self.top, self.bottom],
+            16, 20, self.colormap))
+        self.assertEqual(pixels[7, 7].tolist(), [255, 0, 0])
+
+    def test_only_label_colors_are_used(self):
+        _, pixels = self._decode(rasterize_frame([self.bottom, self.top],
+            16, 20, self.colormap))
+
+        colors = set(map(tuple, pixels.reshape(-1, 3).tolist()))
+        self.assertEqual(colors, set(map(tuple, self.colormap.tolist())))
+
+    def test_workers_keep_the_order_of_frames(self):
+        frames = [([self.bottom, self.top][:count], 16 + count, 20)
+            for count in [2, 0, 1, 2, 1]]
+        expected = [rasterize_frame(shapes, height, width, self.colormap)
+            for shapes, height, width in frames]
+
+        self.assertEqual(list(rasterize_frames(iter(frames), self.colormap,
+            workers=2)), expected)
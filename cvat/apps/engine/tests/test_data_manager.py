@@ -0,0 +1,170 @@
+# Copyright (C) 2019 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+from unittest import mock
+
+import numpy as np
+from django.test import SimpleTestCase
+from scipy.optimize import linear_sum_assignment
+
+from cvat.apps.engine.data_manager import (TrackManager, calc_boxes_iou,
+    find_intersecting_boxes, solve_sparse_assignment)
+from cvat.apps.engine.models import ShapeType
+
+def _make_track(shape_type, keyframes):
+    return {
+        "frame": keyframes[0][0],
+        "label_id": 0,
+        "group": 0,
+        "attributes": [],
+        "shapes": [{
+            "type": shape_type,
+            "frame": frame,
+            "points": points,
+            "occluded": False,
+            "outside": outside,
+            "z_order": 0,
+            "attributes": attributes,
+        } for frame, points, outside, attributes in keyframes],
+    }
+
+class TrackInterpolationTestCase(SimpleTestCase):
+    def _check_shapes(self, shapes, expected):
+        self.assertEqual([(shape["frame"], shape["keyframe"], shape["outside"])
+            for shape in shapes], [shape[:3] for shape in expected])
+        for shape, (_, _, _, points) in zip(shapes, expected):
+            np.testing.assert_allclose(shape["points"], points)
+
+    @mock.patch.object(TrackManager, '_INTERPOLATION_BATCH', 2)
+    def test_rectangle_track(self):
+        track = _make_track(ShapeType.RECTANGLE, [
+            (0, [0, 0, 10, 10], False, []),
+            (4, [4, 8, 14, 18], False, []),
+        ])
+
+        # The last rectangle is continued up to the end frame
+        self._check_shapes(TrackManager.get_interpolated_shapes(track, 0, 7), [
+            (0, True, False, [0, 0, 10, 10]),
+            (1, False, False, [1, 2, 11, 12]),
+            (2, False, False, [2, 4, 12, 14]),
+            (3, False, False, [3, 6, 13, 16]),
+            (4, True, False, [4, 8, 14, 18]),
+            (5, False, False, [4, 8, 14, 18]),
+            (6, False, False, [4, 8, 14, 18]),
+        ])
+
+    def test_points_track(self):
+        track = _make_track(ShapeType.POINTS, [
+            (0, [0, 0, 10, 20], False, []),
+            (2, [2, 4, 12, 24], False, []),
+        ])
+
+        self._check_shapes(TrackManager.get_interpolated_shapes(track, 0, 10), [
+            (0, True, False, [0, 0, 10, 20]),
+            (1, False, False, [1, 2, 11, 22]),
+            (2, True, False, [2, 4, 12, 24]),
+        ])
+
+    def test_outside_keyframe(self):
+        track = _make_track(ShapeType.RECTANGLE, [
+            (0, [0, 0, 10, 10], False, []),
+            (2, [2, 2, 12, 12], True, []),
+            (4, [4, 4, 14, 14], False, []),
+        ])
+
+        # A shape before an outside keyframe isn't moved, nothing is
+        # produced after it up to the next keyframe
+        self._check_shapes(TrackManager.get_interpolated_shapes(track, 0, 6), [
+            (0, True, False, [0, 0, 10, 10]),
+            (1, False, False, [0, 0, 10, 10]),
+            (2, True, True, [2, 2, 12, 12]),
+            (4, True, False, [4, 4, 14, 14]),
+            (5, False, False, [4, 4, 14, 14]),
+        ])
+
+    def test_attributes_are_kept_from_previous_keyframes(self):
+        track = _make_track(ShapeType.POINTS, [
+            (0, [0, 0], False, [{"spec_id": 1, "value": "a"}]),
+            (2, [2, 2], False, [{"spec_id": 2, "value": "b"}]),
+        ])
+
+        shapes = TrackManager.get_interpolated_shapes(track, 0, 3)
+        self.assertEqual([shape["attributes"] for shape in shapes], [
+            [{"spec_id": 1, "value": "a"}],
+            [{"spec_id": 1, "value": "a"}],
+            [{"spec_id": 2, "value": "b"}, {"spec_id": 1, "value": "a"}],
+        ])
+
+    def test_bounded_window(self):
+        track = _make_track(ShapeType.RECTANGLE, [
+            (0, [0, 0, 10, 10], False, []),
+            (10, [10, 20, 30, 40], False, []),
+        ])
+
+        shapes = TrackManager.iter_interpolated_shapes(track, 3, 6, bounded=True)
+        self._check_shapes(list(shapes), [
+            (3, False, False, [3, 6, 16, 19]),
+            (4, False, False, [4, 8, 18, 22]),
+            (5, False, False, [5, 10, 20, 25]),
+        ])
+
+def _generate_boxes(count, size=1000):
+    xy = np.random.uniform(0, size, (count, 2))
+    wh = np.random.uniform(1, size / 10, (count, 2))
+    return np.hstack([xy, xy + wh])
+
+class ObjectMatchingTestCase(SimpleTestCase):
+    def setUp(self):
+        np.random.seed(0)
+
+    def test_find_intersecting_boxes(self):
+        boxes0 = _generate_boxes(300)
+        boxes1 = _generate_boxes(200)
+        # Touching boxes don't intersect
+        boxes1[0] = [boxes0[0, 2], boxes0[0, 1], boxes0[0, 2] + 10, boxes0[0, 3]]
+
+        rows, cols = find_intersecting_boxes(boxes0, boxes1, block_size=16)
+
+        expected = set()
+        for i, box0 in enumerate(boxes0):
+            for j, box1 in enumerate(boxes1):
+                if box0[0] < box1[2] and box1[0] < box0[2] and \
+                        box0[1] < box1[3] and box1[1] < box0[3]:
+                    expected.add((i, j))
+        self.assertEqual(len(rows), len(expected))
+        self.assertEqual(set(zip(rows.tolist(), cols.tolist())), expected)
+
+    def test_find_intersecting_boxes_empty(self):
+        rows, cols = find_intersecting_boxes(_generate_boxes(0), _generate_boxes(5))
+        self.assertEqual(len(rows), 0)
+        self.assertEqual(len(cols), 0)
+
+    def test_sparse_assignment_is_optimal(self):
+        for count0, count1 in [(50, 70), (80, 40), (1, 1)]:
+            boxes0 = _generate_boxes(count0)
+            boxes1 = _generate_boxes(count1)
+            rows, cols = find_intersecting_boxes(boxes0, boxes1)
+            costs = 1 - calc_boxes_iou(boxes0[rows], boxes1[cols])
+
+            matches = solve_sparse_assignment(rows, cols, costs, (count0, count1))
+
+            cost_matrix = np.ones((count0, count1))
+            cost_matrix[rows, cols] = costs
+            row_ind, col_ind = linear_sum_assignment(cost_matrix)
+            # Unlisted pairs cost 1, so the dense optimum assigns them too
+            sparse_cost = sum(cost for _, _, cost in matches) + \
+                min(count0, count1) - len(matches)
+            self.assertAlmostEqual(sparse_cost, cost_matrix[row_ind, col_ind].sum())
+
+            matched_rows = [i for i, _, _ in matches]
+            matched_cols = [j for _, j, _ in matches]
+            self.assertEqual(len(set(matched_rows)), len(matches))
+            self.assertEqual(len(set(matched_cols)), len(matches))
+            for i, j, cost in matches:
+                self.assertAlmostEqual(cost, cost_matrix[i, j])
+
+    def test_sparse_assignment_without_pairs(self):
+        empty = np.empty(0, dtype=int)
+        self.assertEqual(solve_sparse_assignment(empty, empty,
+            np.empty(0), (3, 4)), [])
@@ -0,0 +1,200 @@
+# Copyright (C) 2019 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import io
+import itertools
+import os
+import struct
+import tarfile
+import tempfile
+import zipfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+from PIL import Image
+
+from cvat.apps.engine.media_extractors import (ArchiveExtractor, VideoExtractor,
+    get_image_size)
+
+def _jpeg_segment(marker, payload):
+    return b'\xff' + bytes([marker]) + struct.pack('>H', len(payload) + 2) + payload
+
+def _tiff_header(byte_order, entries):
+    # The IFD follows the 8-byte header
+    header = (b'II*\x00' if byte_order == '<' else b'MM\x00*') + \
+        struct.pack(byte_order + 'I', 8) + struct.pack(byte_order + 'H', len(entries))
+    for tag, value_type, value in entries:
+        value = struct.pack(byte_order + ('H2x' if value_type == 3 else 'I'), value)
+        header += struct.pack(byte_order + 'HHI', tag, value_type, 1) + value
+    return header
+
+class ImageSizeTestCase(SimpleTestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def _write(self, name, data):
+        path = os.path.join(self._temp_dir.name, name)
+        with open(path, 'wb') as image_file:
+            image_file.write(data)
+        return path
+
+    def test_jpeg(self):
+        path = self._write('image.jpg', b'\xff\xd8' +
+            _jpeg_segment(0xE0, b'JFIF\x00' + b'\x00' * 9) +
+            _jpeg_segment(0xC0, b'\x08' + struct.pack('>HH', 480, 640) + b'\x03'))
+        self.assertEqual(get_image_size(path), (640, 480))
+
+    def test_progressive_jpeg_with_exif(self):
+        # DHT isn't a SOF marker, fill bytes can precede markers
+        path = self._write('image.jpg', b'\xff\xd8' +
+            _jpeg_segment(0xE1, b'Exif\x00\x00' + b'\xff' * 64) +
+            _jpeg_segment(0xC4, b'\x00' * 17) + b'\xff' +
+            _jpeg_segment(0xC2, b'\x08' + struct.pack('>HH', 456, 123) + b'\x03'))
+        self.assertEqual(get_image_size(path), (123, 456))
+
+    def test_png(self):
+        path = self._write('image.png', b'\x89PNG\r\n\x1a\n' +
+            struct.pack('>I', 13) + b'IHDR' + struct.pack('>II', 777, 33) +
+            b'\x08\x02\x00\x00\x00')
+        self.assertEqual(get_image_size(path), (777, 33))
+
+    def test_tiff(self):
+        # ImageWidth is SHORT, ImageLength is LONG. Other tags are skipped.
+        for byte_order in ['<', '>']:
+            path = self._write('image.tif', _tiff_header(byte_order, [
+                (254, 4, 0), (256, 3, 300), (257, 4, 70000)]))
+            self.assertEqual(get_image_size(path), (300, 70000))
+
+    def test_other_formats_are_read_by_pil(self):
+        path = os.path.join(self._temp_dir.name, 'image.bmp')
+        Image.new('RGB', (31, 17)).save(path)
+        self.assertEqual(get_image_size(path), (31, 17))
+
+def _generate_image(size):
+    image_file = io.BytesIO()
+    Image.new('RGB', size).save(image_file, 'PNG')
+    return image_file.getvalue()
+
+class ArchiveExtractorTestCase(SimpleTestCase):
+    # Images in nested directories with other files. Sizes are unique.
+    members = {
+        'b.png': _generate_image((10, 20)),
+        'a/c.png': _generate_image((11, 21)),
+        'a/b/d.png': _generate_image((12, 22)),
+        'a/readme.txt': b'text',
+        'e/data.bin': b'\x00\x01',
+    }
+    images = ['a/b/d.png', 'a/c.png', 'b.png']
+
+    def setUp(self):
+        self._temp_dir = tempfile.TemporaryDirectory()
+        self.upload_dir = os.path.join(self._temp_dir.name, 'upload')
+        self.data_dir = os.path.join(self._temp_dir.name, 'data')
+        os.makedirs(self.upload_dir)
+        os.makedirs(self.data_dir)
+
+    def tearDown(self):
+        self._temp_dir.cleanup()
+
+    def _make_zip(self):
+        path = os.path.join(self.upload_dir, 'archive.zip')
+        with zipfile.ZipFile(path, 'w') as archive:
+            archive.writestr('a/', b'')
+            archive.writestr('a/b/', b'')
+            for name, data in self.members.items():
+                archive.writestr(name, data)
+            # Members outside of the directory are skipped
+            archive.writestr('../outside.png', self.members['b.png'])
+        return path
+
+    def _make_tar(self):
+        path = os.path.join(self.upload_dir, 'archive.tar.gz')
+        with tarfile.open(path, 'w:gz') as archive:
+            for dirname in ['a', 'a/b']:
+                info = tarfile.TarInfo(dirname)
+                info.type = tarfile.DIRTYPE
+                archive.addfile(info)
+            for name, data in self.members.items():
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+        return path
+
+    def _check_archive(self, archive_path, workers):
+        extractor = ArchiveExtractor([archive_path], self.upload_dir, 95)
+        self.assertTrue(extractor.is_streamed())
+        self.assertEqual(list(extractor),
+            [os.path.join(self.upload_dir, name) for name in self.images])
+
+        dest_paths = [os.path.join(self.data_dir, '{}.jpg'.format(frame))
+            for frame in range(len(extractor))]
+        sizes = list(extractor.save_images(dest_paths, workers=workers))
+
+        expected_sizes = [Image.open(io.BytesIO(self.members[name])).size
+            for name in self.images]
+        self.assertEqual(sizes, expected_sizes)
+        for dest_path, size in zip(dest_paths, expected_sizes):
+            with Image.open(dest_path) as image:
+                self.assertEqual(image.format, 'JPEG')
+                self.assertEqual(image.size, size)
+
+        # Images are removed after compression, other members aren't extracted
+        for name in self.members:
+            self.assertFalse(os.path.exists(os.path.join(self.upload_dir, name)))
+        self.assertFalse(os.path.exists(os.path.join(self._temp_dir.name, 'outside.png')))
+
+    def test_zip(self):
+        self._check_archive(self._make_zip(), workers=1)
+
+    def test_zip_with_workers(self):
+        self._check_archive(self._make_zip(), workers=2)
+
+    def test_tar(self):
+        self._check_archive(self._make_tar(), workers=1)
+
+    def test_tar_with_workers(self):
+        self._check_archive(self._make_tar(), workers=2)
+
+    def test_extract(self):
+        extractor = ArchiveExtractor([self._make_tar()], self.upload_dir, 95)
+        extractor.extract()
+
+        self.assertFalse(extractor.is_streamed())
+        for name in self.images:
+            with open(os.path.join(self.upload_dir, name), 'rb') as image_file:
+                self.assertEqual(image_file.read(), self.members[name])
+        self.assertFalse(os.path.exists(os.path.join(self.upload_dir, 'a', 'readme.txt')))
+
+class _DecodingProcess:
+    # ffmpeg which has decoded the output
+    def __init__(self, output):
+        self.stdout = io.BytesIO(output)
+        self.returncode = 0
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self):
+        return self.returncode
+
+class VideoExtractorTestCase(SimpleTestCase):
+    def test_paths_are_taken_only_for_decoded_frames(self):
+        # 3 raw RGB frames 2x2
+        process = _DecodingProcess(b'\x80' * 2 * 2 * 3 * 3)
+        extractor = VideoExtractor(['video.mp4'], None, 95, frame_size=(2, 2),
+            stop=9)
+        taken_paths = []
+        def get_dest_paths():
+            for frame in itertools.count():
+                taken_paths.append(frame)
+                yield io.BytesIO()
+
+        with mock.patch('subprocess.Popen', return_value=process):
+            sizes = list(extractor.save_images(get_dest_paths()))
+
+        self.assertEqual(sizes, [(2, 2)] * 3)
+        self.assertEqual(taken_paths, [0, 1, 2])
@@ -0,0 +1,48 @@
+# Copyright (C) 2019 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from cvat.apps.engine.models import BinaryFloatArrayField
+
+class PointsFieldTestCase(SimpleTestCase):
+    # Little-endian float64 values 1.0 and -2.5
+    points = [1.0, -2.5]
+    packed_points = b"\x00\x00\x00\x00\x00\x00\xf0\x3f" \
+        b"\x00\x00\x00\x00\x00\x00\x04\xc0"
+
+    def setUp(self):
+        self.field = BinaryFloatArrayField()
+        self.field.set_attributes_from_name("points")
+
+    def test_get_prep_value(self):
+        self.assertEqual(self.field.get_prep_value(self.points), self.packed_points)
+        self.assertEqual(self.field.get_prep_value([1, -2.5]), self.packed_points)
+        self.assertEqual(self.field.get_prep_value([]), b"")
+
+    def test_from_db_value(self):
+        self.assertEqual(self.field.from_db_value(self.packed_points, None, None),
+            self.points)
+        # PostgreSQL returns bytea values as memoryview
+        self.assertEqual(self.field.from_db_value(memoryview(self.packed_points),
+            None, None), self.points)
+        self.assertEqual(self.field.from_db_value(b"", None, None), [])
+
+    def test_values_are_exact(self):
+        points = [0.1 + 0.2, 1e-300, 4096.000000000001]
+        self.assertEqual(self.field.from_db_value(
+            self.field.get_prep_value(points), None, None), points)
+
+    def test_null(self):
+        self.assertIsNone(self.field.get_prep_value(None))
+        self.assertIsNone(self.field.from_db_value(None, None, None))
+
+    def test_serialization(self):
+        # Fixtures keep binary values as base64 strings
+        shape = mock.Mock(points=self.points)
+        self.assertEqual(self.field.value_to_string(shape), "AAAAAAAA8D8AAAAAAAAEwA==")
+        self.assertEqual(self.field.to_python("AAAAAAAA8D8AAAAAAAAEwA=="), self.points)
+        self.assertEqual(self.field.to_python(self.points), self.points)
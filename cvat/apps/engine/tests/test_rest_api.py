@@ -3,6 +3,7 @@
 # SPDX-License-Identifier: MIT
 
 import os
+import json
 import shutil
 from PIL import Image
 from io import BytesIO
@@ -11,6 +12,7 @@ from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
 from django.conf import settings
 from django.contrib.auth.models import User, Group
+from django.test import override_settings
 from cvat.apps.engine.models import (Task, Segment, Job, StatusChoice,
     AttributeType, Project)
 from cvat.apps.annotation.models import AnnotationFormat
@@ -1543,6 +1545,74 @@ class TaskDataAPITestCase(APITestCase):
         response = self._create_task(None, data)
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
+class TaskFrameChunkAPITestCase(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        create_db_users(cls)
+
+    def _create_task(self, frames):
+        data = {
+            "name": "my task #1",
+            "overlap": 0,
+            "segment_size": 0,
+            "image_quality": 75,
+            "labels": [{"name": "car"}],
+        }
+        response = self.client.post('/api/v1/tasks', data=data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        tid = response.data["id"]
+
+        images = {"client_files[{}]".format(frame):
+            generate_image_file("test_{}.jpg".format(frame)) for frame in range(frames)}
+        response = self.client.post("/api/v1/tasks/{}/data".format(tid), data=images)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+        return tid
+
+    def _get_chunk(self, tid, chunk):
+        return self.client.get("/api/v1/tasks/{}/frames/chunks/{}".format(tid, chunk))
+
+    def _check_chunks(self):
+        with ForceLogin(self.admin, self.client):
+            tid = self._create_task(frames=5)
+            response = self.client.get("/api/v1/tasks/{}/frames/meta".format(tid))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            sizes = [(frame["width"], frame["height"]) for frame in response.data]
+
+            # The last chunk is partial
+            for chunk, frames in enumerate([[0, 1], [2, 3], [4]]):
+                response = self._get_chunk(tid, chunk)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(response["Content-Type"], "application/zip")
+                with zipfile.ZipFile(io.BytesIO(response.content)) as chunk_archive:
+                    self.assertEqual(chunk_archive.namelist(),
+                        ["{}.jpg".format(frame) for frame in frames])
+                    for frame in frames:
+                        image = Image.open(io.BytesIO(
+                            chunk_archive.read("{}.jpg".format(frame))))
+                        self.assertEqual(image.size, sizes[frame])
+
+            response = self._get_chunk(tid, 3)
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    @override_settings(FRAME_CHUNK_SIZE=0, FRAME_DEFAULT_CHUNK_SIZE=2)
+    def test_api_v1_tasks_id_frames_chunks_extracted(self):
+        self._check_chunks()
+
+    @override_settings(FRAME_CHUNK_SIZE=2)
+    def test_api_v1_tasks_id_frames_chunks_on_demand(self):
+        self._check_chunks()
+
+    def test_api_v1_tasks_id_frames_chunks_no_auth(self):
+        with ForceLogin(self.admin, self.client):
+            tid = self._create_task(frames=1)
+
+        response = self._get_chunk(tid, 0)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
 def compare_objects(self, obj1, obj2, ignore_keys, fp_tolerance=.001):
     if isinstance(obj1, dict):
         self.assertTrue(isinstance(obj2, dict), "{} != {}".format(obj1, obj2))
@@ -1656,6 +1726,12 @@ class JobAnnotationAPITestCase(APITestCase):
 
         return response
 
+    def _stream_api_v1_jobs_id_data(self, jid, user):
+        with ForceLogin(user, self.client):
+            response = self.client.get("/api/v1/jobs/{}/annotations?stream=true".format(jid))
+
+        return response
+
     def _delete_api_v1_jobs_id_data(self, jid, user):
         with ForceLogin(user, self.client):
             response = self.client.delete("/api/v1/jobs/{}/annotations".format(jid),
@@ -1803,6 +1879,13 @@ class JobAnnotationAPITestCase(APITestCase):
         data["tracks"][0]["shapes"][1]["attributes"] = default_attr_values[data["tracks"][0]["label_id"]]["mutable"]
         self._check_response(response, data)
 
+        response = self._stream_api_v1_jobs_id_data(job["id"], annotator)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        if annotator:
+            self.assertTrue(response.streaming)
+            content = json.loads(b"".join(response.streaming_content).decode("utf-8"))
+            compare_objects(self, data, content, ignore_keys=["id"])
+
         response = self._delete_api_v1_jobs_id_data(job["id"], annotator)
         data["version"] += 1 # need to update the version
         self.assertEqual(response.status_code, HTTP_204_NO_CONTENT)
@@ -2101,6 +2184,12 @@ class TaskAnnotationAPITestCase(JobAnnotationAPITestCase):
 
         return response
 
+    def _stream_api_v1_tasks_id_annotations(self, pk, user):
+        with ForceLogin(user, self.client):
+            response = self.client.get("/api/v1/tasks/{}/annotations?stream=true".format(pk))
+
+        return response
+
     def _delete_api_v1_tasks_id_annotations(self, pk, user):
         with ForceLogin(user, self.client):
             response = self.client.delete("/api/v1/tasks/{}/annotations".format(pk),
@@ -2272,6 +2361,13 @@ class TaskAnnotationAPITestCase(JobAnnotationAPITestCase):
         self.assertEqual(response.status_code, HTTP_200_OK)
         self._check_response(response, data)
 
+        response = self._stream_api_v1_tasks_id_annotations(task["id"], annotator)
+        self.assertEqual(response.status_code, HTTP_200_OK)
+        if annotator:
+            self.assertTrue(response.streaming)
+            content = json.loads(b"".join(response.streaming_content).decode("utf-8"))
+            compare_objects(self, data, content, ignore_keys=["id"])
+
         response = self._delete_api_v1_tasks_id_annotations(task["id"], annotator)
         data["version"] += 1
         self.assertEqual(response.status_code, HTTP_204_NO_CONTENT)
@@ -2885,6 +2981,86 @@ class TaskAnnotationAPITestCase(JobAnnotationAPITestCase):
     def test_api_v1_tasks_id_annotations_upload_coco_user(self):
         self._run_coco_annotation_upload_test(self.user)
 
+class TaskShareDirectDumpAPITestCase(APITestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    @classmethod
+    def setUpTestData(cls):
+        create_db_users(cls)
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for name in ["direct_1.jpg", os.path.join("direct", "direct_2.jpg")]:
+            path = os.path.join(settings.SHARE_ROOT, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data = generate_image_file(os.path.basename(name))
+            with open(path, 'wb') as image:
+                image.write(data.read())
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        os.remove(os.path.join(settings.SHARE_ROOT, "direct_1.jpg"))
+        shutil.rmtree(os.path.join(settings.SHARE_ROOT, "direct"))
+
+    @override_settings(SHARE_IMPORT_MODE='direct')
+    def test_api_v1_tasks_id_annotations_dump_direct_share(self):
+        data = {
+            "name": "my task #1",
+            "overlap": 0,
+            "segment_size": 0,
+            "image_quality": 75,
+            "labels": [{"name": "car"}],
+        }
+
+        with ForceLogin(self.admin, self.client):
+            response = self.client.post('/api/v1/tasks', data=data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            task = response.data
+
+            response = self.client.post("/api/v1/tasks/{}/data".format(task["id"]),
+                data={
+                    "server_files[0]": "direct_1.jpg",
+                    "server_files[1]": "direct/direct_2.jpg",
+                })
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+
+            # Images are kept in the share
+            db_image = Task.objects.get(pk=task["id"]).image_set.first()
+            self.assertTrue(db_image.path.startswith(settings.SHARE_ROOT))
+
+            response = self.client.put("/api/v1/tasks/{}/annotations".format(task["id"]),
+                data={
+                    "version": 0,
+                    "tags": [],
+                    "shapes": [{
+                        "frame": frame,
+                        "label_id": task["labels"][0]["id"],
+                        "group": 0,
+                        "attributes": [],
+                        "points": [1.0, 2.0, 30.0, 40.0],
+                        "type": "rectangle",
+                        "occluded": False,
+                    } for frame in range(2)],
+                    "tracks": [],
+                }, format="json")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+            url = "/api/v1/tasks/{0}/annotations/my_task_{0}?format={1}".format(
+                task["id"], "CVAT XML 1.1 for images")
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            response = self.client.get(url + "&action=download")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        xmldump = ET.fromstring(b"".join(response.streaming_content))
+        names = [image.get("name") for image in xmldump.findall("./image")]
+        self.assertEqual(names, ["direct/direct_2.jpg", "direct_1.jpg"])
+
 class ServerShareAPITestCase(APITestCase):
     def setUp(self):
         self.client = APIClient()
@@ -0,0 +1,121 @@
+# Copyright (C) 2019 Intel Corporation
+#
+# SPDX-License-Identifier: MIT
+
+import os
+import re
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from cvat.apps.engine import task
+from cvat.apps.engine.progress import ProgressReporter
+
+class _FlakyRangeHandler(BaseHTTPRequestHandler):
+    # Breaks the connection in the middle of the first response for each
+    # file and supports Range requests (except for some files)
+    files = {}
+    broken_paths = set()
+    no_range_paths = set()
+    range_requests = []
+
+    def do_GET(self):
+        data = self.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+
+        offset = 0
+        match = re.match(r'bytes=(\d+)-', self.headers.get('Range', ''))
+        if match and self.path not in self.no_range_paths:
+            offset = int(match.group(1))
+            self.range_requests.append((self.path, offset))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                offset, len(data) - 1, len(data)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data) - offset))
+        self.end_headers()
+
+        if self.path not in self.broken_paths:
+            self.broken_paths.add(self.path)
+            self.wfile.write(data[offset:offset + len(data) // 3])
+            self.close_connection = True
+        else:
+            self.wfile.write(data[offset:])
+
+    def log_message(self, *args):
+        pass
+
+class _RecordingProgressReporter(ProgressReporter):
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.instances.append(self)
+
+class DownloadDataTestCase(SimpleTestCase):
+    def setUp(self):
+        _FlakyRangeHandler.files = {
+            '/{}.bin'.format(i): os.urandom(3 * 1024 * 1024 + i) for i in range(3)
+        }
+        _FlakyRangeHandler.broken_paths = set()
+        _FlakyRangeHandler.no_range_paths = set()
+        _FlakyRangeHandler.range_requests = []
+
+        self.server = HTTPServer(('127.0.0.1', 0), _FlakyRangeHandler)
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_thread.join()
+
+    def _get_url(self, path):
+        return 'http://127.0.0.1:{}{}'.format(self.server.server_port, path)
+
+    @mock.patch.object(task, '_DOWNLOAD_BACKOFF', 0)
+    def test_download_data_resumes_interrupted_files(self):
+        paths = sorted(_FlakyRangeHandler.files)
+        with tempfile.TemporaryDirectory() as upload_dir:
+            names = task._download_data([self._get_url(path) for path in paths], upload_dir)
+
+            self.assertEqual(names, [os.path.basename(path) for path in paths])
+            for path, name in zip(paths, names):
+                with open(os.path.join(upload_dir, name), 'rb') as downloaded_file:
+                    self.assertEqual(downloaded_file.read(), _FlakyRangeHandler.files[path])
+
+        self.assertEqual(sorted(path for path, _ in _FlakyRangeHandler.range_requests), paths)
+        self.assertTrue(all(offset > 0 for _, offset in _FlakyRangeHandler.range_requests))
+
+    @mock.patch.object(task, '_DOWNLOAD_BACKOFF', 0)
+    def test_download_data_restarts_files_if_range_is_ignored(self):
+        paths = sorted(_FlakyRangeHandler.files)
+        _FlakyRangeHandler.no_range_paths = set(paths)
+        _RecordingProgressReporter.instances = []
+        with tempfile.TemporaryDirectory() as upload_dir:
+            with mock.patch.object(task, 'ProgressReporter', _RecordingProgressReporter):
+                names = task._download_data([self._get_url(path) for path in paths],
+                    upload_dir)
+
+            for path, name in zip(paths, names):
+                with open(os.path.join(upload_dir, name), 'rb') as downloaded_file:
+                    self.assertEqual(downloaded_file.read(), _FlakyRangeHandler.files[path])
+
+        self.assertEqual(_FlakyRangeHandler.range_requests, [])
+        # Bytes of restarted files are counted once
+        progress = _RecordingProgressReporter.instances[0]
+        self.assertEqual(progress.bytes,
+            sum(len(data) for data in _FlakyRangeHandler.files.values()))
+        self.assertEqual(progress.progress, 100.0)
+
+    @mock.patch.object(task, '_DOWNLOAD_BACKOFF', 0)
+    def test_download_data_fails_on_missing_file(self):
+        with tempfile.TemporaryDirectory() as upload_dir:
+            with self.assertRaisesRegex(Exception, 'Failed to download'):
+                task._download_data([self._get_url('/missing.bin')], upload_dir)
@@ -6,13 +6,13 @@ import os
 import os.path as osp
 import re
 import traceback
-from ast import literal_eval
 import shutil
 from datetime import datetime
 from tempfile import mkstemp
 
 from django.views.generic import RedirectView
-from django.http import HttpResponseBadRequest, HttpResponseNotFound
+from django.http import (HttpResponse, HttpResponseBadRequest, HttpResponseNotFound,
+    StreamingHttpResponse)
 from django.shortcuts import render
 from django.conf import settings
 from sendfile import sendfile
@@ -30,7 +30,7 @@ from django.db import IntegrityError
 from django.utils import timezone
 
 
-from . import annotation, task, models
+from . import annotation, task, models, frame_provider
 from cvat.settings.base import JS_3RDPARTY, CSS_3RDPARTY
 from cvat.apps.authentication.decorators import login_required
 from .log import slogger, clogger
@@ -307,7 +307,11 @@ class TaskViewSet(auth.TaskGetQuerySetMixin, viewsets.ModelViewSet):
         serializer_class=LabeledDataSerializer)
     def annotations(self, request, pk):
         self.get_object() # force to call check_object_permissions
-        if request.method == 'GET':
+        if request.method == 'GET' and is_streaming_request(request):
+            return StreamingHttpResponse(
+                annotation.stream_task_data(pk, request.user),
+                content_type="application/json")
+        elif request.method == 'GET':
             data = annotation.get_task_data(pk, request.user)
             serializer = LabeledDataSerializer(data=data)
             if serializer.is_valid(raise_exception=True):
@@ -345,9 +349,7 @@ class TaskViewSet(auth.TaskGetQuerySetMixin, viewsets.ModelViewSet):
         url_path='annotations/(?P<filename>[^/]+)')
     def dump(self, request, pk, filename):
         filename = re.sub(r'[\\/*?:"<>|]', '_', filename)
-        username = request.user.username
         db_task = self.get_object() # call check_object_permissions as well
-        timestamp = datetime.now().strftime("%Y_%m_%d_%H_%M_%S")
         action = request.query_params.get("action")
         if action not in [None, "download"]:
             raise serializers.ValidationError(
@@ -360,30 +362,27 @@ class TaskViewSet(auth.TaskGetQuerySetMixin, viewsets.ModelViewSet):
             raise serializers.ValidationError(
                 "Please specify a correct 'format' parameter for the request")
 
-        file_path = os.path.join(db_task.get_task_dirname(),
-            "{}.{}.{}.{}".format(filename, username, timestamp, db_dumper.format.lower()))
-
+        # Identical requests (the same task, format and versions of
+        # annotations) of all users share one job and one file. The job
+        # isn't removed after downloading, other users can wait for it.
+        dump_key = annotation.get_task_dump_key(db_task, db_dumper,
+            request.scheme, request.get_host())
         queue = django_rq.get_queue("default")
-        rq_id = "{}@/api/v1/tasks/{}/annotations/{}/{}".format(username, pk, dump_format, filename)
+        rq_id = "/api/v1/tasks/{}/annotations/dump/{}".format(pk, dump_key)
         rq_job = queue.fetch_job(rq_id)
 
         if rq_job:
             if rq_job.is_finished:
-                if not rq_job.meta.get("download"):
+                # The dump is kept in the export cache of the task. It can
+                # be evicted, so it is created again in the case.
+                file_path = rq_job.return_value
+                if file_path and os.path.exists(file_path):
                     if action == "download":
-                        rq_job.meta[action] = True
-                        rq_job.save_meta()
-                        return sendfile(request, rq_job.meta["file_path"], attachment=True,
+                        return sendfile(request, file_path, attachment=True,
                             attachment_filename="{}.{}".format(filename, db_dumper.format.lower()))
                     else:
                         return Response(status=status.HTTP_201_CREATED)
-                else: # Remove the old dump file
-                    try:
-                        os.remove(rq_job.meta["file_path"])
-                    except OSError:
-                        pass
-                    finally:
-                        rq_job.delete()
+                rq_job.delete()
             elif rq_job.is_failed:
                 exc_info = str(rq_job.exc_info)
                 rq_job.delete()
@@ -391,14 +390,12 @@ class TaskViewSet(auth.TaskGetQuerySetMixin, viewsets.ModelViewSet):
             else:
                 return Response(status=status.HTTP_202_ACCEPTED)
 
-        rq_job = queue.enqueue_call(
-            func=annotation.dump_task_data,
-            args=(pk, request.user, file_path, db_dumper,
+        queue.enqueue_call(
+            func=annotation.export_task_data,
+            args=(pk, request.user, db_dumper,
                   request.scheme, request.get_host()),
             job_id=rq_id,
         )
-        rq_job.meta["file_path"] = file_path
-        rq_job.save_meta()
 
         return Response(status=status.HTTP_202_ACCEPTED)
 
@@ -433,17 +430,11 @@ class TaskViewSet(auth.TaskGetQuerySetMixin, viewsets.ModelViewSet):
     @action(detail=True, methods=['GET'], serializer_class=ImageMetaSerializer,
         url_path='frames/meta')
     def data_info(self, request, pk):
-        try:
-            db_task = self.get_object() # call check_object_permissions as well
-            meta_cache_file = open(db_task.get_image_meta_cache_path())
-        except OSError:
-            task.make_image_meta_cache(db_task)
-            meta_cache_file = open(db_task.get_image_meta_cache_path())
-
-        data = literal_eval(meta_cache_file.read())
-        serializer = ImageMetaSerializer(many=True, data=data['original_size'])
-        if serializer.is_valid(raise_exception=True):
-            return Response(serializer.data)
+        db_task = self.get_object() # call check_object_permissions as well
+        sizes = task.get_image_meta_cache(db_task)
+
+        return Response([{'width': width, 'height': height}
+            for width, height in sizes.tolist()])
 
     @action(detail=True, methods=['GET'], serializer_class=None,
         url_path='frames/(?P<frame>\d+)')
@@ -454,6 +445,10 @@ class TaskViewSet(auth.TaskGetQuerySetMixin, viewsets.ModelViewSet):
             # Follow symbol links if the frame is a link on a real image otherwise
             # mimetype detection inside sendfile will work incorrectly.
             db_task = self.get_object()
+            if db_task.data_chunk_size:
+                return HttpResponse(frame_provider.get_frame(db_task, int(frame)),
+                    content_type='image/jpeg')
+
             path = os.path.realpath(db_task.get_frame_path(frame))
             return sendfile(request, path)
         except Exception as e:
@@ -461,6 +456,30 @@ class TaskViewSet(auth.TaskGetQuerySetMixin, viewsets.ModelViewSet):
                 "cannot get frame #{}".format(frame), exc_info=True)
             return HttpResponseBadRequest(str(e))
 
+    @action(detail=True, methods=['GET'], serializer_class=None,
+        url_path='frames/chunks/(?P<chunk>\d+)')
+    def frame_chunk(self, request, pk, chunk):
+        """Get a zip archive with a chunk of frames for the task"""
+
+        # Permissions are checked once for all frames of the chunk. Chunk
+        # N contains frames [N * chunk_size, (N + 1) * chunk_size).
+        db_task = self.get_object()
+        chunk = int(chunk)
+        if chunk * frame_provider.get_chunk_size(db_task) >= db_task.size:
+            return HttpResponseNotFound("Chunk #{} doesn't exist".format(chunk))
+
+        try:
+            data = frame_provider.get_chunk(db_task, chunk)
+        except Exception as e:
+            slogger.task[pk].error(
+                "cannot get chunk #{}".format(chunk), exc_info=True)
+            return HttpResponseBadRequest(str(e))
+
+        response = HttpResponse(data, content_type='application/zip')
+        # Frames of a task are never changed
+        response['Cache-Control'] = 'private, max-age=86400'
+        return response
+
     @action(detail=True, methods=['GET'], serializer_class=None,
         url_path='dataset')
     def dataset_export(self, request, pk):
@@ -551,7 +570,11 @@ class JobViewSet(viewsets.GenericViewSet,
         serializer_class=LabeledDataSerializer)
     def annotations(self, request, pk):
         self.get_object() # force to call check_object_permissions
-        if request.method == 'GET':
+        if request.method == 'GET' and is_streaming_request(request):
+            return StreamingHttpResponse(
+                annotation.stream_job_data(pk, request.user),
+                content_type="application/json")
+        elif request.method == 'GET':
             data = annotation.get_job_data(pk, request.user)
             return Response(data)
         elif request.method == 'PUT':
@@ -657,6 +680,11 @@ def rq_handler(job, exc_type, exc_value, tb):
 
     return True
 
+def is_streaming_request(request):
+    # Annotations are written into the response incrementally, without
+    # validation by serializers
+    return request.query_params.get("stream", "").lower() in ["1", "true"]
+
 def load_data_proxy(request, rq_id, rq_func, pk):
     queue = django_rq.get_queue("default")
     rq_job = queue.fetch_job(rq_id)
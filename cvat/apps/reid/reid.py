@@ -3,23 +3,23 @@
 # SPDX-License-Identifier: MIT
 
 import os
-import rq
 import cv2
 import math
 import numpy
-import fnmatch
 
 from openvino.inference_engine import IENetwork, IEPlugin
 from scipy.optimize import linear_sum_assignment
 from scipy.spatial.distance import euclidean, cosine
 
+from cvat.apps.engine import frame_provider
 from cvat.apps.engine.models import Job
+from cvat.apps.engine.progress import ProgressReporter
 
 
 class ReID:
     __threshold = None
     __max_distance = None
-    __frame_urls = None
+    __db_task = None
     __frame_boxes = None
     __stop_frame = None
     __plugin = None
@@ -33,22 +33,18 @@ class ReID:
     def __init__(self, jid, data):
         self.__threshold = data["threshold"]
         self.__max_distance = data["maxDistance"]
-        self.__frame_urls = {}
         self.__frame_boxes = {}
 
         db_job = Job.objects.select_related('segment__task').get(pk = jid)
         db_segment = db_job.segment
         db_task = db_segment.task
 
+        self.__db_task = db_task
         self.__stop_frame = db_segment.stop_frame
 
-        for root, _, filenames in os.walk(db_task.get_data_dirname()):
-            for filename in fnmatch.filter(filenames, '*.jpg'):
-                frame = int(os.path.splitext(filename)[0])
-                if frame >= db_segment.start_frame and frame <= db_segment.stop_frame:
-                    self.__frame_urls[frame] = os.path.join(root, filename)
-
-        for frame in self.__frame_urls:
+        # Frames are read by the frame provider, they can be not extracted
+        stop_frame = min(db_segment.stop_frame, db_task.size - 1)
+        for frame in range(db_segment.start_frame, stop_frame + 1):
             self.__frame_boxes[frame] = [box for box in data["boxes"] if box["frame"] == frame]
 
         IE_PLUGINS_PATH = os.getenv('IE_PLUGINS_PATH', None)
@@ -112,6 +108,11 @@ class ReID:
         return cosine(embedding_1, embedding_2)
 
 
+    def __read_frame(self, frame):
+        frame_data = frame_provider.get_frame(self.__db_task, frame)
+        return cv2.imdecode(numpy.frombuffer(frame_data, dtype=numpy.uint8), cv2.IMREAD_COLOR)
+
+
     def __compute_difference_matrix(self, cur_boxes, next_boxes, cur_image, next_image):
         def _int(number, upper):
             return math.floor(numpy.clip(number, 0, upper - 1))
@@ -148,17 +149,13 @@ class ReID:
 
     def __apply_matching(self):
         frames = sorted(list(self.__frame_boxes.keys()))
-        job = rq.get_current_job()
+        progress = ProgressReporter(total=len(frames), check_cancel=True)
         box_tracks = {}
 
         for idx, (cur_frame, next_frame) in enumerate(list(zip(frames[:-1], frames[1:]))):
-            job.refresh()
-            if "cancel" in job.meta:
+            if not progress.update(idx):
                 return None
 
-            job.meta["progress"] = idx * 100.0 / len(frames)
-            job.save_meta()
-
             cur_boxes = self.__frame_boxes[cur_frame]
             next_boxes = self.__frame_boxes[next_frame]
 
@@ -171,8 +168,8 @@ class ReID:
             if not (len(cur_boxes) and len(next_boxes)):
                 continue
 
-            cur_image = cv2.imread(self.__frame_urls[cur_frame], cv2.IMREAD_COLOR)
-            next_image = cv2.imread(self.__frame_urls[next_frame], cv2.IMREAD_COLOR)
+            cur_image = self.__read_frame(cur_frame)
+            next_image = self.__read_frame(next_frame)
             difference_matrix = self.__compute_difference_matrix(cur_boxes, next_boxes, cur_image, next_image)
             cur_idxs, next_idxs = linear_sum_assignment(difference_matrix)
             for idx, cur_idx in enumerate(cur_idxs):
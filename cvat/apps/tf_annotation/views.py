@@ -10,9 +10,10 @@ from cvat.apps.authentication.decorators import login_required
 from cvat.apps.engine.models import Task as TaskModel
 from cvat.apps.engine.serializers import LabeledDataSerializer
 from cvat.apps.engine.annotation import put_task_data
+from cvat.apps.engine import frame_provider
+from cvat.apps.engine.progress import ProgressReporter
 
 import django_rq
-import fnmatch
 import json
 import os
 import rq
@@ -54,17 +55,14 @@ def run_inference_engine_annotation(image_list, labels_mapping, treshold):
     del network
 
     try:
-        for image_num, im_name in enumerate(image_list):
-
-            job.refresh()
-            if 'cancel' in job.meta:
+        progress = ProgressReporter(total=len(image_list), job=job, check_cancel=True)
+        for image_num, image_file in enumerate(image_list):
+            if not progress.update(image_num):
                 del job.meta['cancel']
                 job.save()
                 return None
-            job.meta['progress'] = image_num * 100 / len(image_list)
-            job.save_meta()
 
-            image = Image.open(im_name)
+            image = Image.open(image_file)
             width, height = image.size
             image.thumbnail((600, 600), Image.ANTIALIAS)
             dwidth, dheight = 600 / image.size[0], 600 / image.size[1]
@@ -114,17 +112,14 @@ def run_tensorflow_annotation(image_list, labels_mapping, treshold):
             config = tf.ConfigProto()
             config.gpu_options.allow_growth=True
             sess = tf.Session(graph=detection_graph, config=config)
-            for image_num, image_path in enumerate(image_list):
-
-                job.refresh()
-                if 'cancel' in job.meta:
+            progress = ProgressReporter(total=len(image_list), job=job, check_cancel=True)
+            for image_num, image_file in enumerate(image_list):
+                if not progress.update(image_num):
                     del job.meta['cancel']
                     job.save()
                     return None
-                job.meta['progress'] = image_num * 100 / len(image_list)
-                job.save_meta()
 
-                image = Image.open(image_path)
+                image = Image.open(image_file)
                 width, height = image.size
                 if width > 1920 or height > 1080:
                     image = image.resize((width // 2, height // 2), Image.ANTIALIAS)
@@ -152,19 +147,6 @@ def run_tensorflow_annotation(image_list, labels_mapping, treshold):
     return result
 
 
-def make_image_list(path_to_data):
-    def get_image_key(item):
-        return int(os.path.splitext(os.path.basename(item))[0])
-
-    image_list = []
-    for root, dirnames, filenames in os.walk(path_to_data):
-        for filename in fnmatch.filter(filenames, '*.jpg'):
-                image_list.append(os.path.join(root, filename))
-
-    image_list.sort(key=get_image_key)
-    return image_list
-
-
 def convert_to_cvat_format(data):
     result = {
         "tracks": [],
@@ -199,7 +181,7 @@ def create_thread(tid, labels_mapping, user):
         # Get job indexes and segment length
         db_task = TaskModel.objects.get(pk=tid)
         # Get image list
-        image_list = make_image_list(db_task.get_data_dirname())
+        image_list = frame_provider.FrameFiles(db_task)
 
         # Run auto annotation by tf
         result = None
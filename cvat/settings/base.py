@@ -400,3 +400,38 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = 100 * 1024 * 1024  # 100 MB
 DATA_UPLOAD_MAX_NUMBER_FIELDS = None   # this django check disabled
 LOCAL_LOAD_MAX_FILES_COUNT = 500
 LOCAL_LOAD_MAX_FILES_SIZE = 512 * 1024 * 1024  # 512 MB
+
+# Number of processes which compress images on task creation
+MEDIA_COMPRESSION_WORKERS = int(os.environ.get('MEDIA_COMPRESSION_WORKERS',
+    os.cpu_count() or 1))
+
+# Number of processes which are used by dumpers of annotations (e.g. to fix
+# intersections of polygons for COCO or to draw segmentation masks)
+ANNOTATION_DUMP_WORKERS = int(os.environ.get('ANNOTATION_DUMP_WORKERS',
+    os.cpu_count() or 1))
+
+# How files from the share are imported into a task:
+#   copy - files are copied into the task directory
+#   link - files are cloned (reflinks) or hardlinked if the share and the
+#          task directory are on the same filesystem, copied otherwise
+#   direct - files are read right from the share, they must not be changed
+#            or removed while the task exists
+SHARE_IMPORT_MODE = os.environ.get('SHARE_IMPORT_MODE', 'copy')
+
+# Number of remote files which are downloaded simultaneously
+DOWNLOAD_WORKERS = int(os.environ.get('DOWNLOAD_WORKERS', 4))
+
+# If it isn't zero, frames of new image and video tasks aren't extracted on
+# task creation. They are decoded from the original media by chunks of the
+# size on the first request. Frames are read by the frame provider in all
+# features (DEXTR, automatic annotation, dataset export).
+FRAME_CHUNK_SIZE = int(os.environ.get('FRAME_CHUNK_SIZE', 0))
+# Extracted frames of other tasks are served by chunks of the size
+FRAME_DEFAULT_CHUNK_SIZE = 36
+FRAME_CACHE_MEMORY_SIZE = 256 * 1024 * 1024  # 256 MB per process
+FRAME_CACHE_DISK_SIZE = 10 * 1024 * 1024 * 1024  # 10 GB
+
+# Exported annotations and datasets (and snapshots of annotations) are kept
+# while annotations of tasks are not changed. The limit is common for all
+# tasks, the least recently used files are removed first.
+EXPORT_CACHE_SIZE = int(os.environ.get('EXPORT_CACHE_SIZE', 5 * 1024 * 1024 * 1024))  # 5 GB